@@ -1,6 +1,38 @@
 from flask import Flask
 from app.config import load_configurations, configure_logging
 from .views import webhook_blueprint
+from .utils.async_runtime import async_runtime
+from .utils.job_queue import job_queue
+from .utils.graph_client import graph_client
+from .utils.partitioned_dispatcher import dispatcher
+from .services.openai_service import start_warm_up
+import atexit
+
+
+def start_message_pipeline(thread_workers=True):
+    """
+    Start the workers that process incoming messages, and the warm-up.
+
+    Args:
+        thread_workers: Start the worker pool the Flask lanes run on; the
+            ASGI app runs its lanes on the event loop and passes False
+    """
+    if dispatcher.enabled:
+        # Multi-process mode: messages are processed by worker processes, which
+        # own the thread pool and Graph API connections
+        dispatcher.start()
+        atexit.register(dispatcher.stop)
+    else:
+        # Start the background workers that process incoming messages
+        if thread_workers:
+            job_queue.start()
+
+        # Open the Graph API connections in the background so startup is not blocked
+        async_runtime.submit(graph_client.warm_up_async())
+
+    # Create or sync the vector store and assistant off the startup path;
+    # GET /ready reports when this has finished
+    start_warm_up()
 
 
 def create_app():
@@ -15,4 +47,6 @@ def create_app():
     # Register the Blueprint
     # app.register_blueprint(webhook_blueprint, url_prefix="/webhook")
 
+    start_message_pipeline()
+
     return app
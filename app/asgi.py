@@ -0,0 +1,159 @@
+"""
+ASGI entry point for the asyncio message pipeline.
+
+Run with an ASGI server, e.g.:
+
+    uvicorn app.asgi:app --host 0.0.0.0 --port 8000
+
+Serves the same /webhook and /ready endpoints as the Flask app, but every
+conversation is a coroutine on the async runtime's event loop instead of a
+pinned worker thread, so thousands can wait on OpenAI and the Graph API at
+once. It is the same pipeline the Flask workers run: their blocking entry
+points are wrappers around these coroutines.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from app import start_message_pipeline
+from app.config import configure_logging
+from app.decorators.security import signature_matches
+from app.services.openai_service import readiness
+from app.utils.async_runtime import async_runtime
+from app.utils.graph_client import graph_client
+from app.utils.lane_scheduler import async_lane_scheduler
+from app.utils.partitioned_dispatcher import SERVING_DRAIN_TIMEOUT, dispatcher
+from app.utils.whatsapp_utils import (
+    is_valid_whatsapp_message,
+    is_whatsapp_status_update,
+    process_message_event_async,
+)
+from app.views import accept_message_events
+
+load_dotenv()
+VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
+APP_SECRET = os.getenv("APP_SECRET", "")
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_response(send, status, payload):
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), b"text/plain"
+    else:
+        body, content_type = json.dumps(payload).encode("utf-8"), b"application/json"
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def verify(query_string):
+    """Webhook verification handshake; returns (status, payload)."""
+    params = parse_qs(query_string.decode("utf-8"))
+    mode = params.get("hub.mode", [None])[0]
+    token = params.get("hub.verify_token", [None])[0]
+    challenge = params.get("hub.challenge", [""])[0]
+
+    if mode and token:
+        if mode == "subscribe" and token == VERIFY_TOKEN:
+            logging.info("WEBHOOK_VERIFIED")
+            return 200, challenge
+        logging.warning("Verification failed: token mismatch.")
+        return 403, {"status": "error", "message": "Verification failed"}
+    logging.error("Missing parameters for verification.")
+    return 400, {"status": "error", "message": "Missing parameters"}
+
+
+async def handle_message(raw_body, headers):
+    """Validate a webhook POST and schedule its messages; returns (status, payload)."""
+    signature = headers.get(b"x-hub-signature-256", b"").decode("utf-8")[7:]
+    if not signature_matches(APP_SECRET, raw_body, signature):
+        logging.info("Signature verification failed!")
+        return 403, {"status": "error", "message": "Invalid signature"}
+
+    try:
+        body = json.loads(raw_body)
+    except ValueError:
+        body = None
+    if not body:
+        logging.error("Empty or invalid JSON received.")
+        return 400, {"status": "error", "message": "Invalid JSON provided"}
+
+    if is_valid_whatsapp_message(body):
+        # The dedup check writes to SQLite, so it runs off the event loop
+        accepted = await asyncio.to_thread(
+            accept_message_events, body, async_lane_scheduler, process_message_event_async
+        )
+        if not accepted:
+            return 503, {"status": "error", "message": "Server busy"}
+        return 200, {"status": "ok"}
+    elif is_whatsapp_status_update(body):
+        logging.info("Received a WhatsApp status update.")
+        return 200, {"status": "ok"}
+    logging.warning("Not a valid WhatsApp API event.")
+    return 404, {"status": "error", "message": "Not a WhatsApp API event"}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            configure_logging()
+            start_message_pipeline(thread_workers=False)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Let in-flight conversations finish
+            if dispatcher.enabled:
+                await asyncio.to_thread(dispatcher.stop)
+            else:
+                drained = async_runtime.submit(async_lane_scheduler.drain(SERVING_DRAIN_TIMEOUT))
+                await asyncio.wrap_future(drained)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if path == "/webhook" and method == "GET":
+        status, payload = verify(scope.get("query_string", b""))
+    elif path == "/webhook" and method == "POST":
+        raw_body = await read_body(receive)
+        status, payload = await handle_message(raw_body, dict(scope["headers"]))
+    elif path == "/ready" and method == "GET":
+        is_ready, payload = readiness()
+        status = 200 if is_ready else 503
+    elif path == "/queue-stats" and method == "GET":
+        if dispatcher.enabled:
+            status, payload = 200, dispatcher.stats()
+        else:
+            status, payload = 200, async_lane_scheduler.stats()
+    elif path == "/graph-stats" and method == "GET":
+        status, payload = 200, graph_client.stats()
+    else:
+        status, payload = 404, {"status": "error", "message": "Not found"}
+    await send_response(send, status, payload)
@@ -5,6 +5,17 @@ import hashlib
 import hmac
 
 
+def signature_matches(app_secret, payload, signature):
+    """
+    Check a raw payload (bytes) against an X-Hub-Signature-256 hex digest,
+    without needing a Flask app context.
+    """
+    expected_signature = hmac.new(
+        bytes(app_secret, "latin-1"), msg=payload, digestmod=hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected_signature, signature)
+
+
 def validate_signature(payload, signature):
     """
     Validate the incoming payload's signature against our expected signature
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from dotenv import load_dotenv
+from .response_cache import STOP_WORDS
+
+load_dotenv()
+BM25_INDEX_FILE = os.getenv("BM25_INDEX_FILE", "bm25_index.json")
+BM25_CHUNK_CHARS = int(os.getenv("BM25_CHUNK_CHARS", "800"))
+# How often the indexed files are checked for changes
+BM25_REFRESH_INTERVAL = float(os.getenv("BM25_REFRESH_INTERVAL", "30"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Bumped whenever tokenisation changes, so older index files are rebuilt
+BM25_INDEX_FORMAT = 2
+
+TOKEN = re.compile(r"\w+")
+
+
+# Everything `search` reads, swapped in as one object after a rebuild
+_Snapshot = namedtuple("_Snapshot", ["chunks", "postings", "avg_length"])
+
+
+def tokenize(text):
+    """
+    Lower-case word tokens with English and Swahili stop words removed.
+
+    Single letters are kept ("Station A"), as in the response cache keys.
+    """
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def split_into_chunks(text, max_chars=BM25_CHUNK_CHARS):
+    """Group paragraphs into passages of roughly `max_chars` characters."""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BM25Index:
+    """
+    Local BM25 inverted index over the bot's knowledge files.
+
+    Each file is split into passages and stored with its content hash, so a
+    sync only re-tokenises files that were added or edited. The index is
+    persisted as JSON and the postings lists are rebuilt in memory on load.
+    A rebuild assembles a complete new snapshot before swapping it in, so a
+    search running meanwhile sees either the old index or the new one.
+    """
+
+    def __init__(self, index_file=BM25_INDEX_FILE):
+        self.index_file = index_file
+        self._files = {}
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot = _Snapshot([], {}, 0.0)
+        self._stats_fingerprint = None
+        self._last_refresh = 0.0
+        self._load()
+        self._build_postings()
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r") as f:
+                data = json.load(f)
+            if data.get("format") != BM25_INDEX_FORMAT:
+                logging.info("BM25 index was built with older tokenisation, rebuilding")
+                return
+            self._files = data.get("files", {})
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load BM25 index, rebuilding: {e}")
+            self._files = {}
+
+    def _save(self):
+        # Write to a temp file and rename so readers never see a partial index
+        directory = os.path.dirname(os.path.abspath(self.index_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"format": BM25_INDEX_FORMAT, "files": self._files}, f)
+        os.replace(tmp_path, self.index_file)
+
+    def _build_postings(self):
+        chunks = []
+        postings = defaultdict(list)
+        for path, entry in sorted(self._files.items()):
+            for chunk in entry["chunks"]:
+                chunk_id = len(chunks)
+                chunks.append((path, chunk["text"], chunk["length"]))
+                for term, count in chunk["tf"].items():
+                    postings[term].append((chunk_id, count))
+        total = sum(length for _, _, length in chunks)
+        snapshot = _Snapshot(chunks, dict(postings), total / len(chunks) if chunks else 0.0)
+        with self._snapshot_lock:
+            self._snapshot = snapshot
+
+    def sync(self, paths):
+        """
+        Bring the index in line with `paths`, re-indexing only changed files.
+
+        Returns:
+            int: Number of files (re)indexed or removed.
+        """
+        with self._lock:
+            changed = 0
+            paths = [p for p in paths if os.path.isfile(p)]
+            for path in paths:
+                digest = file_hash(path)
+                if self._files.get(path, {}).get("hash") == digest:
+                    continue
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    text = f.read()
+                chunks = []
+                for passage in split_into_chunks(text):
+                    tokens = tokenize(passage)
+                    chunks.append(
+                        {"text": passage, "tf": dict(Counter(tokens)), "length": len(tokens)}
+                    )
+                self._files[path] = {"hash": digest, "chunks": chunks}
+                changed += 1
+                logging.info(f"Indexed {len(chunks)} passages from {path}")
+
+            for stale in set(self._files) - set(paths):
+                del self._files[stale]
+                changed += 1
+                logging.info(f"Removed {stale} from the BM25 index")
+
+            if changed:
+                self._build_postings()
+                self._save()
+            return changed
+
+    def refresh(self, paths):
+        """Sync at most once per BM25_REFRESH_INTERVAL, and only if files changed."""
+        now = time.monotonic()
+        if now - self._last_refresh < BM25_REFRESH_INTERVAL:
+            return
+        self._last_refresh = now
+        fingerprint = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        if fingerprint != self._stats_fingerprint:
+            self.sync(paths)
+            self._stats_fingerprint = fingerprint
+
+    def search(self, query, k=4):
+        """
+        Return the top-k passages for a query.
+
+        Returns:
+            list of dicts with 'score', 'source' and 'text'.
+        """
+        with self._snapshot_lock:
+            chunks, postings, avg_length = self._snapshot
+        if not chunks:
+            return []
+        n = len(chunks)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            matches = postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(1 + (n - len(matches) + 0.5) / (len(matches) + 0.5))
+            for chunk_id, tf in matches:
+                length = chunks[chunk_id][2]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {"score": round(score, 4), "source": chunks[i][0], "text": chunks[i][1]}
+            for i, score in best
+        ]
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+MEMORY_DB_FILE = os.getenv("MEMORY_DB_FILE", "memory.sqlite3")
+# Tokens of recent turns replayed to the model on every call
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1200"))
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "20"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "200"))
+# Conversations idle for longer than this start over
+MEMORY_TTL_SECONDS = int(os.getenv("MEMORY_TTL_SECONDS", "86400"))
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "5000"))
+# When over budget, trim down to this fraction of it, so summaries are batched
+MEMORY_TRIM_TARGET = 0.75
+# Per-message overhead of the chat format, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text):
+    """
+    Count tokens with tiktoken when it is installed, else estimate them at
+    about four characters per token.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to roughly `max_tokens`, keeping the end (the newest facts)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max_tokens * 4
+    return "…" + text[-keep:]
+
+
+def fallback_summary(summary, turns):
+    """Summary used when no summariser is set or it fails: the turns, verbatim."""
+    lines = [summary] if summary else []
+    lines += [f"{turn['role']}: {turn['content']}" for turn in turns]
+    return truncate_to_tokens("\n".join(lines), MEMORY_SUMMARY_TOKENS)
+
+
+class _Conversation:
+    __slots__ = ("summary", "turns", "updated_at")
+
+    def __init__(self, summary="", turns=(), updated_at=0.0):
+        self.summary = summary
+        self.turns = deque(turns, maxlen=MEMORY_MAX_TURNS)
+        self.updated_at = updated_at
+
+
+# Roles are stored as one letter to keep rows small
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_CODE_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+def _pack_turns(turns):
+    compact = [[_ROLE_CODES[t["role"]], t["content"]] for t in turns]
+    return zlib.compress(json.dumps(compact, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack_turns(blob):
+    compact = json.loads(zlib.decompress(blob).decode("utf-8"))
+    return [{"role": _CODE_ROLES[code], "content": content} for code, content in compact]
+
+
+class ConversationMemory:
+    """
+    Bounded per-user memory for the function-calling assistant, keyed by wa_id.
+
+    Recent turns live in a ring buffer trimmed to a token budget; turns that
+    fall out of it are folded into a rolling summary by `summarize`, so the
+    model keeps names, user IDs and plate numbers without the prompt growing
+    without limit. Conversations are stored zlib-compressed in SQLite (shared
+    by all workers) behind an in-process LRU cache.
+    """
+
+    def __init__(
+        self,
+        db_file=MEMORY_DB_FILE,
+        token_budget=MEMORY_TOKEN_BUDGET,
+        ttl_seconds=MEMORY_TTL_SECONDS,
+        cache_size=MEMORY_CACHE_SIZE,
+        summarize=None,
+    ):
+        self.db_file = db_file
+        self.token_budget = token_budget
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        # summarize(previous_summary, turns) -> new summary text
+        self.summarize = summarize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._summaries = 0
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations "
+            "(wa_id TEXT PRIMARY KEY, summary TEXT NOT NULL, turns BLOB NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, wa_id):
+        with self._lock:
+            conversation = self._cache.get(wa_id)
+            if conversation is not None:
+                self._cache.move_to_end(wa_id)
+                return conversation
+        row = (
+            self._connection()
+            .execute(
+                "SELECT summary, turns, updated_at FROM conversations WHERE wa_id = ?",
+                (wa_id,),
+            )
+            .fetchone()
+        )
+        if row:
+            conversation = _Conversation(row[0], _unpack_turns(row[1]), row[2])
+        else:
+            conversation = _Conversation()
+        self._cache_put(wa_id, conversation)
+        return conversation
+
+    def _cache_put(self, wa_id, conversation):
+        with self._lock:
+            self._cache[wa_id] = conversation
+            self._cache.move_to_end(wa_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _save(self, wa_id, conversation):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO conversations (wa_id, summary, turns, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (wa_id, conversation.summary, _pack_turns(conversation.turns), conversation.updated_at),
+        )
+
+    def _expired(self, conversation):
+        return (
+            conversation.updated_at
+            and time.time() - conversation.updated_at > self.ttl_seconds
+        )
+
+    def context(self, wa_id):
+        """
+        Messages to place between the system prompt and the new user message.
+
+        Returns:
+            list: An optional summary system message followed by recent turns.
+        """
+        if not wa_id:
+            return []
+        conversation = self._load(wa_id)
+        if self._expired(conversation):
+            return []
+        messages = []
+        if conversation.summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation with this client: {conversation.summary}",
+                }
+            )
+        messages.extend(dict(turn) for turn in conversation.turns)
+        return messages
+
+    def append(self, wa_id, turns):
+        """
+        Record the turns of one exchange and trim the buffer to its budget.
+
+        Args:
+            wa_id: The user's WhatsApp ID
+            turns: List of {"role", "content"} messages, oldest first
+        """
+        if not wa_id:
+            return
+        conversation = self._load(wa_id)
+        if self._expired(conversation):
+            conversation = _Conversation()
+
+        folded = []
+        for turn in turns:
+            if len(conversation.turns) == conversation.turns.maxlen:
+                folded.append(conversation.turns[0])
+            conversation.turns.append({"role": turn["role"], "content": turn["content"]})
+
+        used = sum(message_tokens(t) for t in conversation.turns)
+        if used > self.token_budget:
+            # Trim below the budget rather than to it, so the next few
+            # exchanges fit without another summary call
+            target = self.token_budget * MEMORY_TRIM_TARGET
+            while len(conversation.turns) > 1 and used > target:
+                turn = conversation.turns.popleft()
+                used -= message_tokens(turn)
+                folded.append(turn)
+
+        if folded:
+            conversation.summary = self._fold(conversation.summary, folded)
+        conversation.updated_at = time.time()
+        self._save(wa_id, conversation)
+        self._cache_put(wa_id, conversation)
+
+    def _fold(self, summary, turns):
+        with self._lock:
+            self._summaries += 1
+        if self.summarize is not None:
+            try:
+                return truncate_to_tokens(
+                    self.summarize(summary, turns), MEMORY_SUMMARY_TOKENS
+                )
+            except Exception as e:
+                logging.warning(f"Conversation summary failed, keeping turns verbatim: {e}")
+        return fallback_summary(summary, turns)
+
+    def clear(self, wa_id):
+        """Forget everything remembered for a user."""
+        with self._lock:
+            self._cache.pop(wa_id, None)
+        self._connection().execute("DELETE FROM conversations WHERE wa_id = ?", (wa_id,))
+
+    def stats(self):
+        """Return cached conversation and summary counters."""
+        with self._lock:
+            return {"cached_conversations": len(self._cache), "summaries": self._summaries}
@@ -123,14 +123,22 @@ eastc_functions = [
         "type": "function",
         "function": {
             "name": "request_filling_station",
-            "description": "Provides a list of nearby gas filling stations based on the user's location.",
+            "description": "Provides a list of nearby gas filling stations based on the user's location, ranked by distance, queue length and stock. Uses the location the user last shared on WhatsApp unless coordinates are given.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "user_id": {
                         "type": "integer",
                         "description": "The unique ID of the user requesting nearby filling stations.",
-                    }
+                    },
+                    "latitude": {
+                        "type": "number",
+                        "description": "Latitude of the user's location, if known.",
+                    },
+                    "longitude": {
+                        "type": "number",
+                        "description": "Longitude of the user's location, if known.",
+                    },
                 },
                 "required": ["user_id"],
             },
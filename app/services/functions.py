@@ -1,113 +1,147 @@
-import requests
-from flask import Flask, request, jsonify
-from flask import Blueprint, request, jsonify, current_app
-
-webhook_blueprint = Blueprint("webhook", __name__)
-
-REGISTRATION_URL = "https://9a83-197-250-226-222.ngrok-free.app/registration"
-# In-memory database for demonstration purposes
-
-users_db = {}
-bookings_db = []
-
-
-# @webhook_blueprint.route("/register", methods=["POST"])
-
-
-def register_user():
-    data = request.json
-    phone_number = data.get("phone_number")
-    car_plate_no = data.get("car_plate_no")
-
+import logging
+import os
+from dotenv import load_dotenv
+from app.utils.registration_client import (
+    QUEUED,
+    REGISTERED,
+    REGISTRATION_TIMEOUT,
+    UNKNOWN,
+    registration_client,
+)
+from .station_registry import station_registry, station_summary
+from .tool_runtime import ToolError, tool
+from .user_store import CANCELLED, CONFIRMED, BookingError, normalise_phone, user_store
+
+load_dotenv()
+# How long a user's nearby-station list is reused within a conversation
+STATION_CACHE_TTL = float(os.getenv("STATION_CACHE_TTL", "120"))
+
+# Tools called by the assistant. Each is a plain function taking the
+# arguments described in function_descriptions.eastc_functions, returning
+# JSON-serialisable data and raising ToolError for failures the user should
+# hear about. They run on the tool runtime's worker threads, never inside a
+# Flask request.
+
+
+# wa_id is the requesting user's WhatsApp ID, who hears about a queued
+# registration once it completes (the number being registered may differ)
+@tool(timeout=REGISTRATION_TIMEOUT + 2, max_concurrency=4, context=("wa_id",))
+def register_user(phone_number, car_plate_no, wa_id=None):
     if not phone_number or not car_plate_no:
-        return jsonify({"error": "Phone number and car plate number are required"}), 400
-
-    # Send data to the external registration endpoint
-    try:
-        response = requests.post(REGISTRATION_URL, json=data)
-        if response.status_code == 201:
-            user_id = len(users_db) + 1
-            users_db[user_id] = {
-                "phone_number": phone_number,
-                "car_plate_no": car_plate_no,
-            }
-            return jsonify(
-                {"message": "User registered successfully", "user_id": user_id}
-            ), 201
-        else:
-            return jsonify(
-                {"error": "Failed to register user", "details": response.json()}
-            ), response.status_code
-    except requests.exceptions.RequestException as e:
-        return jsonify(
-            {"error": "Could not connect to registration service", "details": str(e)}
-        ), 500
-
-
-# Payment options endpoint
-
-# @app.route('/payment', methods=['POST'])
-# @webhook_blueprint.route("/payment", methods=["POST"])
-
-
-def payment_options():
-    data = request.json
-    user_id = data.get("user_id")
-    payment_option = data.get("payment_option")
-
+        raise ToolError("Phone number and car plate number are required")
+
+    outcome, details = registration_client.register(phone_number, car_plate_no, reply_to=wa_id)
+    if outcome == QUEUED:
+        return {
+            "message": "Registration service is unavailable; the registration is queued "
+            "and the user will get a WhatsApp message once it completes",
+            "queued": True,
+        }
+    if outcome == UNKNOWN:
+        raise ToolError(
+            "Registration service did not confirm the registration; it may have gone "
+            "through, so the user should not register again right away",
+            details,
+        )
+    if outcome != REGISTERED:
+        raise ToolError("Failed to register user", details)
+
+    user, _ = user_store.register(phone_number, car_plate_no)
+    return {"message": "User registered successfully", "user_id": user["user_id"]}
+
+
+def _finish_queued_registration(phone_number, car_plate_no, outcome, details, reply_to):
+    # Imported here: whatsapp_utils imports this module through openai_service
+    from app.utils.whatsapp_utils import send_whatsapp_message
+
+    wa_id = reply_to or normalise_phone(phone_number).lstrip("+")
+    if outcome == REGISTERED:
+        user, _ = user_store.register(phone_number, car_plate_no)
+        text = (
+            f"Usajili wako umekamilika. Namba yako ya mteja ni {user['user_id']}.\n"
+            f"Your registration is complete. Your user ID is {user['user_id']}."
+        )
+    elif outcome == UNKNOWN:
+        logging.error(f"Queued registration for {phone_number} has unknown outcome: {details}")
+        text = (
+            "Samahani, hatukuweza kuthibitisha usajili wako. "
+            "Tafadhali uliza hali yake kabla ya kujisajili tena.\n"
+            "Sorry, we could not confirm your registration. "
+            "Please check its status before registering again."
+        )
+    else:
+        logging.error(f"Queued registration for {phone_number} was rejected: {details}")
+        text = (
+            "Samahani, usajili wako haukufanikiwa. Tafadhali jaribu tena.\n"
+            "Sorry, your registration did not go through. Please try again."
+        )
+    send_whatsapp_message(wa_id, text)
+
+
+registration_client.on_replayed = _finish_queued_registration
+
+
+def find_user_id(phone_number):
+    """Return the ID of the user registered with a phone number (any format), or None."""
+    user = user_store.find_by_phone(phone_number)
+    return user["user_id"] if user else None
+
+
+# Choosing a payment method or confirming changes the user's booking, so their
+# cached station list (which reflects bookings in production) is dropped
+@tool(timeout=5, max_concurrency=8, invalidates=("request_filling_station",))
+def payment_options(user_id, payment_option):
     if not user_id or not payment_option:
-        return jsonify({"error": "User ID and payment option are required"}), 400
+        raise ToolError("User ID and payment option are required")
 
     if payment_option not in ["cash", "electronic"]:
-        return jsonify({"error": "Invalid payment option"}), 400
-
-    bookings_db.append(
-        {"user_id": user_id, "payment_option": payment_option, "status": "Pending"}
-    )
-    return jsonify({"message": "Payment option selected successfully"}), 200
+        raise ToolError("Invalid payment option")
 
+    if user_store.get(user_id) is None:
+        raise ToolError("User not found, please register first")
 
-# Nearby filling stations endpoint
-# @webhook_blueprint.route("/filling-stations", methods=["POST"])
+    booking = user_store.open_booking(user_id, payment_option)
+    return {
+        "message": "Payment option selected successfully",
+        "booking_id": booking["booking_id"],
+    }
 
 
-def request_filling_station():
-    data = request.json
-    user_id = data.get("user_id")
-
+@tool(timeout=5, max_concurrency=8, cache_ttl=STATION_CACHE_TTL)
+def request_filling_station(user_id, latitude=None, longitude=None):
     if not user_id:
-        return jsonify({"error": "User ID is required"}), 400
-
-    # Mock data for nearby filling stations
-    filling_stations = [
-        {"name": "Station A", "location": "Kinondoni", "distance": "2.5 km"},
-        {"name": "Station B", "location": "Mikocheni", "distance": "3.0 km"},
-        {"name": "Station C", "location": "Kijitonyama", "distance": "4.2 km"},
-    ]
-    return jsonify(
-        {"message": "Nearby filling stations", "stations": filling_stations}
-    ), 200
+        raise ToolError("User ID is required")
 
+    if latitude is None or longitude is None:
+        user = user_store.get(user_id)
+        location = station_registry.last_location(user["phone_number"]) if user else None
+        if location is not None:
+            latitude, longitude = location
 
-# Booking confirmation endpoint
-# @webhook_blueprint.route("/confirmation-", methods=["POST"])
+    if latitude is None or longitude is None:
+        ranked = station_registry.rank_without_location()
+        return {
+            "message": "Stations with the shortest queues; share your location for the nearest ones",
+            "stations": [station_summary(r) for r in ranked],
+        }
 
+    ranked = station_registry.rank(latitude, longitude)
+    if not ranked:
+        raise ToolError("No filling station near the user's location")
+    return {"message": "Nearby filling stations", "stations": [station_summary(r) for r in ranked]}
 
-def confirm_booking():
-    data = request.json
-    user_id = data.get("user_id")
-    confirmation = data.get("confirmation")
 
+@tool(timeout=5, max_concurrency=8, invalidates=("request_filling_station",))
+def confirm_booking(user_id, confirmation):
     if not user_id or confirmation is None:
-        return jsonify({"error": "User ID and confirmation status are required"}), 400
-
-    for booking in bookings_db:
-        if booking["user_id"] == user_id:
-            if confirmation:
-                booking["status"] = "Confirmed"
-                return jsonify({"message": "Booking confirmed"}), 200
-            else:
-                booking["status"] = "Cancelled"
-                return jsonify({"message": "Booking cancelled"}), 200
-
-    return jsonify({"error": "Booking not found for the user"}), 404
+        raise ToolError("User ID and confirmation status are required")
+
+    try:
+        booking = user_store.transition_booking(user_id, CONFIRMED if confirmation else CANCELLED)
+    except BookingError as e:
+        raise ToolError(str(e))
+    if booking is None:
+        raise ToolError("Booking not found for the user")
+    if confirmation:
+        return {"message": "Booking confirmed", "booking_id": booking["booking_id"]}
+    return {"message": "Booking cancelled", "booking_id": booking["booking_id"]}
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+from dotenv import load_dotenv
+from .function_descriptions import eastc_functions
+
+load_dotenv()
+# Optional JSON file {intent: {pattern: weight}} replacing intents of the built-in lexicon
+INTENT_LEXICON_FILE = os.getenv("INTENT_LEXICON_FILE")
+# A tool is chosen only if its score reaches this...
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "1.5"))
+# ...and it holds at least this share of the total score of all intents
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.6"))
+
+RETRIEVAL_INTENT = "retrieval"
+
+# Bilingual lexicon: regex fragments (no capturing groups) and their weights.
+# Swahili verbs take prefixes and suffixes, so their roots match inside words.
+DEFAULT_LEXICON = {
+    "register_user": {
+        r"regist\w*": 2.5,
+        r"sign ?up": 2.0,
+        r"create (?:an |my )?account": 2.0,
+        r"new (?:user|customer|account)": 1.0,
+        r"\w*jisajili\w*": 2.5,
+        r"\w*sajili\w*": 2.0,
+        r"usajili": 2.5,
+        r"fungua akaunti": 2.0,
+        r"mteja mpya": 1.0,
+        r"(?:car |number |license )?plate(?: number| no)?": 1.0,
+        r"namba ya gari": 1.5,
+        r"namba ya simu|phone number": 0.5,
+    },
+    "confirm_booking": {
+        r"confirm\w*": 2.5,
+        r"cancel\w*": 2.5,
+        r"\w*thibitish\w*": 2.5,
+        r"\w*ghairi\w*|sitisha\w*": 2.5,
+        r"book(?:ing|ed)?": 1.5,
+        r"reserv\w*": 1.5,
+        r"nafasi|\w*hifadhi\w*": 1.0,
+        r"order|oda": 1.0,
+    },
+    "request_filling_station": {
+        r"(?:filling|gas|petrol|fuel) stations?": 2.5,
+        r"stations?": 1.0,
+        r"nearest|nearby|closest|near me|close to me": 1.5,
+        r"kituo(?: cha mafuta)?|vituo(?: vya mafuta)?": 2.0,
+        r"sheli": 2.0,
+        r"karibu (?:na|yangu|nami|nangu)": 1.5,
+        r"where (?:can|do) i (?:get|buy|find|fill)": 2.0,
+        r"(?:nitapata|napata|nipate) mafuta": 2.0,
+        r"\w*jaza mafuta": 1.5,
+        r"wapi": 0.5,
+    },
+    "payment_options": {
+        r"pay(?:ment|ments|ing)?": 2.5,
+        r"\w*lip(?:a|e|ia|ie|wa)\b|malipo": 2.5,
+        r"cash|ta(?:s|si)limu": 2.0,
+        r"electronic(?:ally)?|mobile money": 1.5,
+        r"m-?pesa|tigo ?pesa|airtel money|halo ?pesa": 2.0,
+        r"card|kadi": 1.0,
+        r"pesa|fedha": 0.5,
+    },
+    # Questions the knowledge base answers; they pull away from the tools
+    RETRIEVAL_INTENT: {
+        r"prices?|cost|bei|gharama": 1.5,
+        r"how much|kiasi gani|shilingi ngapi|ngapi": 1.5,
+        r"open\w*|clos(?:e|es|ing)|hours|saa ngapi|kufunguliwa|kufungwa": 1.5,
+        r"discounts?|promo\w*|offers?|punguzo|ofa": 1.5,
+        r"safe\w*|usalama|salama": 1.5,
+        r"availab\w*|inapatikana": 1.0,
+        r"queue|foleni|wait\w*|msongamano": 1.0,
+        r"emergenc\w*|dharura|mechanic|fundi|tow\w*": 1.5,
+        r"complain\w*|malalamiko|feedback|maoni": 1.5,
+        r"what is|ni nini|how do|how can|vipi": 0.5,
+    },
+}
+
+IntentDecision = namedtuple("IntentDecision", ["intent", "score", "confidence", "scores"])
+
+
+def load_lexicon(path=INTENT_LEXICON_FILE):
+    """Built-in lexicon, with intents overridden from `path` when it is set."""
+    lexicon = {intent: dict(patterns) for intent, patterns in DEFAULT_LEXICON.items()}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            lexicon.update(json.load(f))
+        logging.info(f"Loaded intent lexicon overrides from {path}")
+    return lexicon
+
+
+class IntentRouter:
+    """
+    Route a message to a tool, or to retrieval, in a single regex pass.
+
+    Every lexicon pattern becomes one capturing alternative of a combined
+    regex; the group index of a match identifies its intent and weight. Each
+    pattern counts once per message. The top intent wins if its score and its
+    share of all scores clear the thresholds; otherwise the message goes to
+    retrieval.
+    """
+
+    def __init__(
+        self,
+        lexicon=None,
+        tools=eastc_functions,
+        min_score=ROUTER_MIN_SCORE,
+        min_confidence=ROUTER_MIN_CONFIDENCE,
+    ):
+        lexicon = load_lexicon() if lexicon is None else lexicon
+        self.tools = [tool["function"]["name"] for tool in tools]
+        missing = [name for name in self.tools if not lexicon.get(name)]
+        if missing:
+            raise ValueError(f"Intent lexicon has no patterns for tools: {missing}")
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+
+        alternatives = []
+        self._groups = [None]  # group numbers start at 1
+        for intent, patterns in lexicon.items():
+            for pattern, weight in patterns.items():
+                if re.compile(pattern).groups:
+                    raise ValueError(f"Pattern {pattern!r} must use non-capturing groups")
+                alternatives.append(f"({pattern})")
+                self._groups.append((intent, pattern, float(weight)))
+        self._pattern = re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+        self._intents = list(lexicon)
+
+    def route(self, message_body):
+        """
+        Score a message against every intent.
+
+        Returns:
+            IntentDecision: the chosen intent (a tool name or "retrieval"), its
+            score and confidence, and the score of every intent that matched.
+        """
+        scores = {}
+        seen = set()
+        for match in self._pattern.finditer((message_body or "").lower()):
+            group = match.lastindex
+            if group in seen:
+                continue
+            seen.add(group)
+            intent, _, weight = self._groups[group]
+            scores[intent] = scores.get(intent, 0.0) + weight
+
+        if not scores:
+            return IntentDecision(RETRIEVAL_INTENT, 0.0, 0.0, scores)
+        intent = max(scores, key=scores.get)
+        score = scores[intent]
+        confidence = score / sum(scores.values())
+        if (
+            intent == RETRIEVAL_INTENT
+            or score < self.min_score
+            or confidence < self.min_confidence
+        ):
+            return IntentDecision(RETRIEVAL_INTENT, score, confidence, scores)
+        return IntentDecision(intent, score, confidence, scores)
+
+
+# Shared router used by the OpenAI services
+intent_router = IntentRouter()
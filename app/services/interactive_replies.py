@@ -0,0 +1,204 @@
+import logging
+from .functions import find_user_id
+from .station_registry import format_distance, station_registry
+from .tool_runtime import tool_runtime
+
+# Reply IDs are "<action>:<value>" with an optional ":<user_id>", e.g.
+# "pay:cash:12" or "booking:cancel". Without a user ID the sender's phone
+# number is looked up among registered users.
+ID_SEPARATOR = ":"
+
+NOT_REGISTERED_REPLY = (
+    "Samahani, hatukupata usajili wako. Tafadhali jisajili kwanza.\n"
+    "Sorry, we could not find your registration. Please register first."
+)
+
+NO_STATIONS_REPLY = (
+    "Samahani, hakuna kituo cha gesi karibu na mahali ulipo.\n"
+    "Sorry, there is no filling station near your location."
+)
+# Rows shown in the station list (WhatsApp allows at most 10)
+STATION_LIST_SIZE = 5
+
+
+def reply_id(action, value, user_id=None):
+    """Build the ID of a button or list row handled by the dispatcher."""
+    parts = [action, value] + ([str(user_id)] if user_id is not None else [])
+    return ID_SEPARATOR.join(parts)
+
+
+def payment_buttons(user_id=None):
+    """Buttons for `send_button_message` offering the payment options."""
+    return [
+        {"id": reply_id("pay", "cash", user_id), "title": "Cash / Taslimu"},
+        {"id": reply_id("pay", "electronic", user_id), "title": "Electronic / Mtandao"},
+    ]
+
+
+def booking_buttons(user_id=None):
+    """Buttons for `send_button_message` confirming or cancelling a booking."""
+    return [
+        {"id": reply_id("booking", "confirm", user_id), "title": "Confirm / Thibitisha"},
+        {"id": reply_id("booking", "cancel", user_id), "title": "Cancel / Ghairi"},
+    ]
+
+
+def station_location_message(station):
+    """Message object pinning a station on the map, for `send_reply`."""
+    return {
+        "type": "location",
+        "location": {
+            "latitude": station.latitude,
+            "longitude": station.longitude,
+            "name": station.name,
+            "address": station.address,
+        },
+    }
+
+
+def station_list_message(ranked):
+    """Message object listing ranked stations; tapping a row sends its location."""
+    rows = []
+    for item in ranked:
+        stock = "in stock / ipo" if item.in_stock else "out of stock / imeisha"
+        rows.append(
+            {
+                "id": reply_id("station", item.station.id),
+                "title": item.station.name[:24],
+                "description": (
+                    f"{format_distance(item.distance_km)} · queue {item.queue_length} · {stock}"
+                )[:72],
+            }
+        )
+    return {
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "body": {
+                "text": "Vituo bora karibu nawe / Best stations near you. "
+                "Chagua kimoja kuona ramani / Pick one to see it on the map."
+            },
+            "action": {
+                "button": "Stations / Vituo",
+                "sections": [{"title": "Nearest stations", "rows": rows}],
+            },
+        },
+    }
+
+
+def nearby_stations_reply(wa_id, latitude, longitude):
+    """
+    Answer a shared location with the best stations around it.
+
+    One station is sent as a map pin, several as a list. The location is
+    remembered for later `request_filling_station` calls, whose cached
+    results for this user are dropped.
+    """
+    station_registry.remember_location(wa_id, latitude, longitude)
+    user_id = find_user_id(wa_id)
+    if user_id is not None:
+        tool_runtime.cache.invalidate(("request_filling_station",), user_id=user_id)
+    ranked = station_registry.rank(latitude, longitude, k=STATION_LIST_SIZE)
+    logging.info(f"Location from {wa_id}: {len(ranked)} stations nearby")
+    if not ranked:
+        return NO_STATIONS_REPLY
+    if len(ranked) == 1:
+        return station_location_message(ranked[0].station)
+    return station_list_message(ranked)
+
+
+def interactive_reply(message):
+    """
+    Return (id, title) of a button or list tap, or None for other messages.
+
+    Covers `interactive` button_reply / list_reply messages and template
+    quick-reply `button` messages (whose payload plays the part of the ID).
+    """
+    if message.get("type") == "interactive":
+        interactive = message.get("interactive", {})
+        reply = interactive.get(interactive.get("type"), {})
+        if "id" in reply:
+            return reply["id"], reply.get("title", "")
+    elif message.get("type") == "button":
+        button = message.get("button", {})
+        return button.get("payload", ""), button.get("text", "")
+    return None
+
+
+class InteractiveDispatcher:
+    """
+    Map button and list reply IDs straight to handlers, without the LLM.
+
+    A handler is registered per action (the part of the ID before the first
+    separator) and returns the reply text or a message object, so a tap is
+    answered with a single Graph API call. Taps on IDs with no handler, like the generated IDs of
+    `send_quick_reply_buttons`, return None so the caller can fall back to
+    treating the tapped title as text.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    def register(self, action):
+        """Decorator registering `handler(wa_id, value, user_id)` for an action."""
+
+        def decorator(handler):
+            self._handlers[action] = handler
+            return handler
+
+        return decorator
+
+    def dispatch(self, wa_id, reply_id_value):
+        """
+        Run the handler for a reply ID.
+
+        Returns:
+            str, dict or None: The reply text or message object, or None if
+            no handler owns the ID.
+        """
+        action, _, rest = reply_id_value.partition(ID_SEPARATOR)
+        handler = self._handlers.get(action)
+        if handler is None:
+            return None
+        value, _, user_id = rest.partition(ID_SEPARATOR)
+        if user_id.isdigit():
+            user_id = int(user_id)
+        else:
+            user_id = find_user_id(wa_id)
+        logging.info(f"Interactive reply '{reply_id_value}' from {wa_id} -> {action}")
+        return handler(wa_id, value, user_id)
+
+
+interactive_dispatcher = InteractiveDispatcher()
+
+
+def _result_text(result):
+    if result.ok:
+        return result.data.get("message", "")
+    return result.error
+
+
+@interactive_dispatcher.register("pay")
+def handle_payment_reply(wa_id, value, user_id):
+    if user_id is None:
+        return NOT_REGISTERED_REPLY
+    result = tool_runtime.run("payment_options", {"user_id": user_id, "payment_option": value})
+    return _result_text(result)
+
+
+@interactive_dispatcher.register("booking")
+def handle_booking_reply(wa_id, value, user_id):
+    if user_id is None:
+        return NOT_REGISTERED_REPLY
+    result = tool_runtime.run(
+        "confirm_booking", {"user_id": user_id, "confirmation": value == "confirm"}
+    )
+    return _result_text(result)
+
+
+@interactive_dispatcher.register("station")
+def handle_station_reply(wa_id, value, user_id):
+    station = station_registry.get(value)
+    if station is None:
+        return NO_STATIONS_REPLY
+    return station_location_message(station)
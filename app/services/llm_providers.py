@@ -0,0 +1,564 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+from dotenv import load_dotenv
+from app.utils.async_runtime import async_runtime
+from .tool_calls import ToolCallAccumulator
+
+load_dotenv()
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# Providers in order of preference, until there is latency data to rank them
+LLM_PROVIDERS = [
+    name.strip() for name in os.getenv("LLM_PROVIDERS", "openai,gemini").split(",") if name.strip()
+]
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+# Latency and error rate are judged over the calls of the last LLM_STATS_WINDOW
+# seconds, and only once a provider has LLM_MIN_SAMPLES of them
+LLM_STATS_WINDOW = float(os.getenv("LLM_STATS_WINDOW", "300"))
+LLM_MIN_SAMPLES = int(os.getenv("LLM_MIN_SAMPLES", "20"))
+LLM_MAX_ERROR_RATE = float(os.getenv("LLM_MAX_ERROR_RATE", "0.3"))
+# The second provider is asked once the first has been silent for its p95,
+# or for the default delay while that is unknown, within the bounds below
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "4"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "10"))
+
+
+def _message(content_parts, tool_calls):
+    return SimpleNamespace(content="".join(content_parts) or None, tool_calls=tool_calls)
+
+
+class OpenAIProvider:
+    """Chat completions from OpenAI; also hands out the shared SDK clients."""
+
+    name = "openai"
+
+    def __init__(self, api_key, model=OPENAI_MODEL, timeout=LLM_REQUEST_TIMEOUT):
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        """Return the shared OpenAI client, importing the SDK on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if not self.api_key:
+                        raise ValueError("Set OPENAI_API_KEY in environment variables.")
+                    import openai
+
+                    self._client = openai.OpenAI(api_key=self.api_key)
+        return self._client
+
+    def async_client(self):
+        """Return the shared AsyncOpenAI client, importing the SDK on first use."""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    if not self.api_key:
+                        raise ValueError("Set OPENAI_API_KEY in environment variables.")
+                    import openai
+
+                    self._async_client = openai.AsyncOpenAI(api_key=self.api_key)
+        return self._async_client
+
+    def _request(self, messages, tools, max_tokens):
+        request = {"model": self.model, "messages": messages, "timeout": self.timeout}
+        if tools:
+            request.update(tools=tools, tool_choice="auto", parallel_tool_calls=True)
+        if max_tokens:
+            request["max_tokens"] = max_tokens
+        return request
+
+    @staticmethod
+    def _reply(response):
+        if not response.choices or not response.choices[0].message:
+            return SimpleNamespace(content=None, tool_calls=None)
+        return response.choices[0].message
+
+    async def complete_async(self, messages, tools=None, on_text=None, max_tokens=None):
+        """
+        Run one completion, streaming content deltas to `on_text` when given.
+
+        Returns:
+            An object with `content` and `tool_calls` like a non-streamed message.
+        """
+        request = self._request(messages, tools, max_tokens)
+        client = self.async_client()
+        if on_text is None:
+            return self._reply(await client.chat.completions.create(**request))
+
+        content_parts = []
+        tool_calls = ToolCallAccumulator()
+        async for chunk in await client.chat.completions.create(stream=True, **request):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                on_text(delta.content)
+            tool_calls.add(delta.tool_calls)
+        return _message(content_parts, tool_calls.tool_calls())
+
+
+# JSON schema keywords Gemini function declarations do not accept
+_GEMINI_UNSUPPORTED_SCHEMA_KEYS = {"additionalProperties", "default", "$schema"}
+
+
+def gemini_schema(schema):
+    """Copy of a JSON schema without the keywords Gemini rejects."""
+    if isinstance(schema, dict):
+        return {
+            key: gemini_schema(value)
+            for key, value in schema.items()
+            if key not in _GEMINI_UNSUPPORTED_SCHEMA_KEYS
+        }
+    if isinstance(schema, list):
+        return [gemini_schema(item) for item in schema]
+    return schema
+
+
+def gemini_tools(tools):
+    """OpenAI tool definitions as one Gemini tool of function declarations."""
+    declarations = []
+    for tool in tools:
+        function = tool["function"]
+        declaration = {"name": function["name"], "description": function.get("description", "")}
+        if function.get("parameters", {}).get("properties"):
+            declaration["parameters"] = gemini_schema(function["parameters"])
+        declarations.append(declaration)
+    return [{"function_declarations": declarations}]
+
+
+def gemini_contents(messages):
+    """
+    Translate OpenAI chat messages into Gemini's system instruction and contents.
+
+    System messages are joined into the system instruction. Tool calls and
+    tool results become function_call / function_response parts; Gemini has
+    no call IDs, so results are matched to calls by name.
+
+    Returns:
+        tuple: (system instruction or None, list of contents)
+    """
+    system, contents, call_names = [], [], {}
+
+    def add(role, part):
+        # Consecutive parts from the same side go in one turn
+        if contents and contents[-1]["role"] == role:
+            contents[-1]["parts"].append(part)
+        else:
+            contents.append({"role": role, "parts": [part]})
+
+    for message in messages:
+        role = message["role"]
+        if role == "system":
+            system.append(message["content"])
+        elif role == "tool":
+            try:
+                response = json.loads(message["content"])
+            except (TypeError, ValueError):
+                response = message["content"]
+            if not isinstance(response, dict):
+                response = {"result": response}
+            name = call_names.get(message.get("tool_call_id"), "tool")
+            add("user", {"function_response": {"name": name, "response": response}})
+        elif role == "assistant":
+            if message.get("content"):
+                add("model", {"text": message["content"]})
+            for call in message.get("tool_calls") or []:
+                function = call["function"]
+                call_names[call["id"]] = function["name"]
+                try:
+                    args = json.loads(function["arguments"] or "{}")
+                except ValueError:
+                    args = {}
+                add("model", {"function_call": {"name": function["name"], "args": args}})
+        elif message.get("content"):
+            add("user", {"text": message["content"]})
+    return "\n\n".join(system) or None, contents
+
+
+def _integral_numbers(value):
+    # Gemini returns every number as a float; schemas here expect integer IDs
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {k: _integral_numbers(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_integral_numbers(v) for v in value]
+    return value
+
+
+class _GeminiReply:
+    """Collect text and function calls from Gemini responses or stream chunks."""
+
+    def __init__(self, on_text=None):
+        self.on_text = on_text
+        self.text = []
+        self.tool_calls = []
+
+    def add(self, response):
+        for candidate in response.candidates[:1]:
+            for part in candidate.content.parts:
+                if part.text:
+                    self.text.append(part.text)
+                    if self.on_text is not None:
+                        self.on_text(part.text)
+                if "function_call" in part:
+                    call = type(part.function_call).to_dict(part.function_call)
+                    self.tool_calls.append(
+                        SimpleNamespace(
+                            id=f"call_{uuid.uuid4().hex[:24]}",
+                            type="function",
+                            function=SimpleNamespace(
+                                name=call["name"],
+                                arguments=json.dumps(_integral_numbers(call.get("args", {}))),
+                            ),
+                        )
+                    )
+
+    def message(self):
+        return _message(self.text, self.tool_calls)
+
+
+class GeminiProvider:
+    """Chat completions from Gemini, taking and returning OpenAI-shaped messages."""
+
+    name = "gemini"
+
+    def __init__(self, api_key, model=GEMINI_MODEL, timeout=LLM_REQUEST_TIMEOUT):
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self._genai = None
+        self._lock = threading.Lock()
+
+    def _sdk(self):
+        # Imported on first use, like the OpenAI SDK, to keep it off startup
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=self.api_key)
+                    self._genai = genai
+        return self._genai
+
+    def _model(self, messages, tools, max_tokens):
+        system, contents = gemini_contents(messages)
+        model = self._sdk().GenerativeModel(
+            self.model,
+            system_instruction=system,
+            tools=gemini_tools(tools) if tools else None,
+            generation_config={"max_output_tokens": max_tokens} if max_tokens else None,
+        )
+        return model, contents
+
+    async def complete_async(self, messages, tools=None, on_text=None, max_tokens=None):
+        """Same contract as OpenAIProvider.complete_async."""
+        model, contents = self._model(messages, tools, max_tokens)
+        reply = _GeminiReply(on_text)
+        response = await model.generate_content_async(
+            contents, stream=on_text is not None, request_options={"timeout": self.timeout}
+        )
+        if on_text is None:
+            reply.add(response)
+        else:
+            async for chunk in response:
+                reply.add(chunk)
+        return reply.message()
+
+
+class ProviderStats:
+    """Rolling time-to-first-output and error rate of one provider."""
+
+    def __init__(self, window=LLM_STATS_WINDOW):
+        self.window = window
+        self._samples = deque()  # (finished at, seconds to first output, ok)
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds, ok):
+        now = time.monotonic()
+        self._samples.append((now, seconds, ok))
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        samples = [s for s in self._samples if now - s[0] <= self.window]
+        latencies = sorted(s[1] for s in samples if s[2])
+        failures = sum(1 for s in samples if not s[2])
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))]
+
+        return {
+            "samples": len(samples),
+            "error_rate": failures / len(samples) if samples else 0.0,
+            "p50": percentile(50),
+            "p95": percentile(95),
+        }
+
+
+class _LostRace(Exception):
+    """Raised inside a losing provider's stream to stop it."""
+
+
+_LOST = object()
+
+
+class _Race:
+    """Decides which provider's reply is used: the first to produce output."""
+
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.winner = None
+        self._lock = threading.Lock()
+
+    def claim(self, name):
+        with self._lock:
+            if self.winner is None:
+                self.winner = name
+            return self.winner == name
+
+
+class ProviderRouter:
+    """
+    Send each completion to the fastest healthy LLM provider, hedging slow ones.
+
+    Providers are ranked by their rolling p50 time to first output (first
+    streamed token, or the whole reply when not streaming); one whose error
+    rate is above LLM_MAX_ERROR_RATE goes last. If the chosen provider has
+    produced nothing by its p95, the same request goes to the next provider
+    too, and whichever produces output first wins; the other's output is
+    dropped, and a streaming loser is stopped at its next token. A provider
+    that fails before producing output is replaced by the next at once.
+
+    Completions have no side effects (tools run after they return), so a
+    hedged request is always safe to send twice. Attempts are tasks on the
+    async runtime, and a losing one is cancelled once the race is decided.
+    """
+
+    def __init__(self, providers, max_error_rate=LLM_MAX_ERROR_RATE, min_samples=LLM_MIN_SAMPLES):
+        self.providers = list(providers)
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self._stats = {provider.name: ProviderStats() for provider in self.providers}
+        self._lock = threading.Lock()
+
+    def _snapshots(self):
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def _healthy(self, snapshot):
+        return snapshot["samples"] < self.min_samples or snapshot["error_rate"] <= self.max_error_rate
+
+    def ranked(self):
+        """Providers in the order they should be tried."""
+        snapshots = self._snapshots()
+
+        def key(item):
+            index, provider = item
+            snapshot = snapshots[provider.name]
+            known = snapshot["samples"] >= self.min_samples and snapshot["p50"] is not None
+            return (
+                not self._healthy(snapshot),
+                snapshot["p50"] if known else float("inf"),
+                index,
+            )
+
+        return [provider for _, provider in sorted(enumerate(self.providers), key=key)]
+
+    def hedge_delay(self, name):
+        """Seconds to wait for a provider's first output before hedging."""
+        snapshot = self._snapshots()[name]
+        if snapshot["samples"] < self.min_samples or snapshot["p95"] is None:
+            delay = LLM_HEDGE_DEFAULT_DELAY
+        else:
+            delay = snapshot["p95"]
+        return min(max(delay, LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+    def _record(self, name, seconds, ok):
+        with self._lock:
+            self._stats[name].record(seconds, ok)
+
+    def _count(self, name, counter):
+        with self._lock:
+            stats = self._stats[name]
+            setattr(stats, counter, getattr(stats, counter) + 1)
+
+    def _emitter(self, provider, race, mark):
+        if race.on_text is None:
+            return None
+
+        def emit(delta):
+            mark()
+            if not race.claim(provider.name):
+                raise _LostRace()
+            race.on_text(delta)
+
+        return emit
+
+    async def _attempt(self, provider, race, messages, tools, max_tokens):
+        started = time.monotonic()
+        first_output = []
+
+        def mark():
+            if not first_output:
+                first_output.append(time.monotonic() - started)
+
+        try:
+            result = await provider.complete_async(
+                messages,
+                tools=tools,
+                on_text=self._emitter(provider, race, mark),
+                max_tokens=max_tokens,
+            )
+        except _LostRace:
+            self._record(provider.name, first_output[0], True)
+            return _LOST
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._record(provider.name, time.monotonic() - started, False)
+            raise
+        mark()
+        self._record(provider.name, first_output[0], True)
+        return result if race.claim(provider.name) else _LOST
+
+    def _settle(self, provider, outcome, race, primary, hedge):
+        """
+        Handle one finished attempt.
+
+        Returns:
+            The reply, or _LOST if another attempt won or this one failed
+            before producing output.
+        """
+        try:
+            result = outcome()
+        except Exception as e:
+            if race.winner == provider.name:
+                # Part of this reply has already reached the user
+                raise
+            logging.warning(f"LLM provider {provider.name} failed: {e}")
+            return _LOST
+        if result is not _LOST and provider is hedge:
+            self._count(provider.name, "hedge_wins")
+            logging.info(f"Hedged request to {provider.name} beat {primary.name}")
+        return result
+
+    async def complete_async(self, messages, tools=None, on_text=None, max_tokens=None):
+        """
+        Run a completion on the best provider, hedging to the next one if slow.
+
+        Returns:
+            An object with `content` and `tool_calls` like a non-streamed message.
+        """
+        waiting = self.ranked()
+        if not waiting:
+            raise RuntimeError("No LLM provider is configured")
+        race = _Race(on_text)
+        pending = {}
+        errors = []
+
+        def launch():
+            provider = waiting.pop(0)
+            task = asyncio.create_task(
+                self._attempt(provider, race, messages, tools, max_tokens)
+            )
+            pending[task] = provider
+            return provider
+
+        primary = launch()
+        hedge_at = time.monotonic() + self.hedge_delay(primary.name)
+        hedge = None
+        try:
+            while pending:
+                can_hedge = waiting and hedge is None and race.winner is None
+                timeout = max(hedge_at - time.monotonic(), 0) if can_hedge else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if race.winner is None:
+                        hedge = launch()
+                        self._count(hedge.name, "hedges")
+                        logging.info(f"{primary.name} slow, hedging to {hedge.name}")
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    result = self._settle(provider, task.result, race, primary, hedge)
+                    if result is not _LOST:
+                        return result
+                # Everything in flight failed: fail over to the next provider now
+                if not pending and waiting and race.winner is None:
+                    launch()
+            raise errors[-1] if errors else RuntimeError("No LLM provider produced a reply")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def complete(self, messages, tools=None, on_text=None, max_tokens=None):
+        """Blocking version of `complete_async`, for callers outside the event loop."""
+        return async_runtime.run(
+            self.complete_async(messages, tools=tools, on_text=on_text, max_tokens=max_tokens)
+        )
+
+    def stats(self):
+        """Per-provider rolling latency, error rate and hedge counts."""
+        snapshots = self._snapshots()
+        ranking = [provider.name for provider in self.ranked()]
+        result = {}
+        with self._lock:
+            for name, stats in self._stats.items():
+                snapshot = snapshots[name]
+                result[name] = {
+                    "rank": ranking.index(name) + 1,
+                    "healthy": self._healthy(snapshot),
+                    "recent_calls": snapshot["samples"],
+                    "error_rate": round(snapshot["error_rate"], 4),
+                    "p50_ms": None if snapshot["p50"] is None else round(snapshot["p50"] * 1000, 1),
+                    "p95_ms": None if snapshot["p95"] is None else round(snapshot["p95"] * 1000, 1),
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "hedges": stats.hedges,
+                    "hedge_wins": stats.hedge_wins,
+                }
+        return result
+
+
+def configured_providers(openai_provider, names=LLM_PROVIDERS):
+    """The providers named in LLM_PROVIDERS that have credentials."""
+    providers = []
+    for name in names:
+        if name == "openai":
+            providers.append(openai_provider)
+        elif name == "gemini":
+            if GEMINI_API_KEY:
+                providers.append(GeminiProvider(GEMINI_API_KEY))
+            else:
+                logging.warning("GEMINI_API_KEY is not set, Gemini provider disabled")
+        else:
+            logging.warning(f"Unknown LLM provider '{name}' in LLM_PROVIDERS")
+    return providers
@@ -1,27 +1,72 @@
+import asyncio
 import logging
-import shelve
 import os
 import json
+import threading
 import time
 from dotenv import load_dotenv
-import openai
-from .functions import *  # Import function implementations
+from .functions import *  # Registers the tool implementations
+from .tool_runtime import tool_runtime
 from .function_descriptions import eastc_functions
+from .thread_store import thread_store
+from .conversation_memory import ConversationMemory
+from .prompt_builder import PromptBuilder
+from .intent_router import RETRIEVAL_INTENT, intent_router
+from .tool_calls import (
+    MAX_TOOL_ITERATIONS,
+    assistant_tool_message,
+    run_tool_calls_async,
+    tool_results_turn,
+)
+from .llm_providers import OpenAIProvider, ProviderRouter, configured_providers
+from .response_cache import ResponseCache
+from .bm25_index import BM25Index
+from .vector_store_sync import sync_vector_store, write_json_atomic
+from app.utils.async_runtime import async_runtime
+from app.utils.file_lock import FileLock
+from .run_waiter import (
+    RUN_TIMEOUT_SECONDS,
+    RunFailedError,
+    RunStreamInterrupted,
+    RunTimeoutError,
+    stream_run_async,
+    wait_for_run_async,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# Load environment variables and set up OpenAI client
+# Load environment variables; the OpenAI client itself is created on first use
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logging.error("Missing OpenAI API Key.")
-    raise ValueError("Set OPENAI_API_KEY in environment variables.")
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Owns the OpenAI SDK clients; also one of the chat completion providers
+openai_provider = OpenAIProvider(OPENAI_API_KEY)
+# Chat completions go to the fastest healthy provider (OpenAI, Gemini)
+llm_router = ProviderRouter(configured_providers(openai_provider))
+
+
+def get_client():
+    """
+    Return the shared OpenAI client, importing the SDK on first use.
+
+    Deferring the import keeps it off the startup path, so the app can bind
+    and answer health checks before the SDK is loaded.
+    """
+    return openai_provider.client()
+
+
+def get_async_client():
+    """Return the shared AsyncOpenAI client used by the async pipeline."""
+    return openai_provider.async_client()
+
+
+# Stream run events instead of polling when the API allows it
+RUN_STREAMING = os.getenv("RUN_STREAMING", "true").lower() == "true"
 
 
 # # Constants
-THREAD_DB_FILE = "threads_db"
 VECTOR_STORE_META_FILE = "vector_store_meta.json"
 SYSTEM_PROMPT = """Project Overview: Gas Station Assistance Bot for Dar es Salaam
 This project focuses on creating a bot to assist automobile owners around Dar es Salaam in efficiently accessing and redistributing traffic across the limited number of gas stations in the city. By addressing congestion at the filling stations, the bot will improve customer experience and optimize service delivery for station operators.
@@ -95,8 +140,32 @@ Environmental policies or updates (e.g., eco-friendly initiatives by stations).
 Purpose: Educates users on safety and sustainability practices.
 Example Query: "How can I safely refuel my car?"
 ."""
+# Splits SYSTEM_PROMPT into a cacheable static prefix and per-intent sections
+prompt_builder = PromptBuilder(SYSTEM_PROMPT)
 VECTOR_STORE_NAME = "smartGas_vector_store"
 FILE_PATHS = ["../Hybrid_whatsap_bot/app/Bot_Data/LPG.txt"]
+BOT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Bot_Data")
+
+# "assistants" uses the hosted file_search assistant; "local" answers from the
+# BM25 index over Bot_Data with a single chat completion
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "assistants")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+
+
+def knowledge_files():
+    """Knowledge files for local retrieval: FILE_PATHS plus everything in Bot_Data."""
+    paths = [os.path.abspath(p) for p in FILE_PATHS if os.path.isfile(p)]
+    if os.path.isdir(BOT_DATA_DIR):
+        for filename in sorted(os.listdir(BOT_DATA_DIR)):
+            path = os.path.abspath(os.path.join(BOT_DATA_DIR, filename))
+            if filename.endswith((".txt", ".md")) and path not in paths:
+                paths.append(path)
+    return paths
+
+
+# Answers to repeated questions, dropped whenever the knowledge files change
+response_cache = ResponseCache(knowledge_files=FILE_PATHS + knowledge_files())
+bm25_index = BM25Index()
 
 
 # Constants
@@ -112,14 +181,13 @@ def load_metadata(file_path):
 
 
 def save_metadata(file_path, data):
-    """Save metadata to a JSON file."""
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=4)
+    """Save metadata to a JSON file atomically."""
+    write_json_atomic(file_path, data)
 
 
 def upload_file_with_vector_store(file_paths, vector_store_name="DefaultVectorStore"):
     """
-    Upload files to OpenAI and associate them with a vector store, checking for existing metadata.
+    Sync files to an OpenAI vector store, uploading only what changed.
 
     Args:
         file_paths (list of str): Paths of files to upload.
@@ -129,62 +197,12 @@ def upload_file_with_vector_store(file_paths, vector_store_name="DefaultVectorSt
         dict: Metadata about the vector store and uploaded files.
     """
     try:
-        # Load existing metadata
         metadata = load_metadata(VECTOR_STORE_META_FILE)
-        if metadata:
-            logging.info(f"Loaded existing metadata: {metadata}")
-
-            # Check if the vector store and files match
-            if metadata.get("vector_store_name") == vector_store_name and set(
-                metadata.get("uploaded_files", [])
-            ) == set(file_paths):
-                logging.info(
-                    f"Vector store '{vector_store_name}' and files already uploaded."
-                )
-                return metadata
-
-        # No matching metadata; proceed with upload
-        logging.info(f"Creating vector store: {vector_store_name}")
-        vector_store = client.beta.vector_stores.create(name=vector_store_name)
-        logging.info(f"Vector store created with ID: {vector_store.id}")
-
-        # Prepare file streams
-        file_streams = [open(path, "rb") for path in file_paths]
-        logging.info(f"Uploading files to vector store '{vector_store_name}'...")
-
-        # Upload files and associate them with the vector store
-        file_batch = client.beta.vector_stores.file_batches.upload_and_poll(
-            vector_store_id=vector_store.id, files=file_streams
-        )
-
-        # Safely extract file counts if available
-        file_counts = {}
-        if hasattr(file_batch, "file_counts"):
-            file_counts = {
-                "processed_files": getattr(file_batch.file_counts, "processed", None),
-                "failed_files": getattr(file_batch.file_counts, "failed", None),
-                "pending_files": getattr(file_batch.file_counts, "pending", None),
-            }
-
-        # Close file streams
-        for stream in file_streams:
-            stream.close()
-
-        # Prepare and save metadata
-        metadata = {
-            "vector_store_name": vector_store_name,
-            "vector_store_id": vector_store.id,
-            "file_batch_status": file_batch.status,
-            "file_counts": file_counts,
-            "uploaded_files": file_paths,
-        }
-        save_metadata(VECTOR_STORE_META_FILE, metadata)
-
-        # Log the result
-        logging.info(f"File batch upload completed with status: {file_batch.status}")
-        logging.info(f"File counts: {file_counts}")
-
-        return metadata
+        synced = sync_vector_store(get_client(), file_paths, vector_store_name, metadata)
+        if synced is not metadata:
+            save_metadata(VECTOR_STORE_META_FILE, synced)
+            logging.info(f"File counts: {synced.get('file_counts')}")
+        return synced
 
     except Exception as e:
         logging.error(f"Error uploading files to vector store: {e}")
@@ -212,92 +230,90 @@ def save_assistant_metadata(data):
 import time
 
 
-#  Main assistant function to handle user input and function calling
-def run_assistant(thread_id, name, message_body):
-    try:
-        logging.info(f"Running assistant for thread: {thread_id}")
-
-        # Initialize conversation history with system instructions
-        conversation_history = [
+def summarize_turns(summary, turns):
+    """Fold conversation turns into the rolling summary with one cheap completion."""
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    response = llm_router.complete(
+        [
             {
                 "role": "system",
-                "content": f"You are having a conversation with the client named {name}. Instructions: {SYSTEM_PROMPT}",
+                "content": "Update the summary of a conversation between a fuel station booking "
+                "assistant and a client. Keep every name, user ID, phone number, plate number, "
+                "station, booking and payment detail. Reply with the summary only.",
             },
-            {"role": "user", "content": message_body},
-        ]
-
-        # Continuously handle responses until no function call is pending
-        while True:
-            # Send the message and get the response
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=conversation_history,
-                functions=eastc_functions,
-                function_call="auto",
-            )
+            {
+                "role": "user",
+                "content": f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}",
+            },
+        ],
+        max_tokens=200,
+    )
+    return response.content
+
+
+# Recent turns and a rolling summary per user, replayed to the function assistant
+conversation_memory = ConversationMemory(summarize=summarize_turns)
 
-            # Check if choices and message content exist
-            if not response.choices or not response.choices[0].message:
-                logging.error("No response choices or message content from assistant.")
-                return "Samahani, kuna tatizo. Tafadhali jaribu tena baadaye."
-
-            # Retrieve the message from the response
-            response_message = response.choices[0].message
-
-            # Process function call if available
-            if (
-                hasattr(response_message, "function_call")
-                and response_message.function_call
-            ):
-                function_called = response_message.function_call.name
-                function_args = json.loads(response_message.function_call.arguments)
-
-                # Map function names to actual implementations
-                available_functions = {
-                    "register_user": register_user,
-                    "payment_options": payment_options,
-                    "request_filling_station": request_filling_station,
-                    "confirm_booking": confirm_booking,
-                }
-
-                # Call the function and store result if function exists
-                if function_called in available_functions:
-                    function_to_call = available_functions[function_called]
-
-                    # Call the function and store the result if it exists
-                    function_result = function_to_call(**function_args)
-                    logging.info(
-                        f"Function {function_called} executed with result: {function_result}"
-                    )
-
-                    # Ensure the result is a string before appending to the conversation history
-                    if isinstance(function_result, list):
-                        function_result_str = "\n".join(
-                            [
-                                f"{item['title']}: {item['description']}"
-                                for item in function_result
-                            ]
-                        )
-                    else:
-                        function_result_str = str(function_result)
-
-                    # Append function result as assistant's response in conversation history
-                    conversation_history.append(
-                        {"role": "assistant", "content": function_result_str}
-                    )
-                else:
-                    logging.error(f"Function {function_called} not found.")
-                    return "Samahani, kuna tatizo. Tafadhali jaribu tena baadaye."
 
+#  Main assistant function to handle user input and tool calling
+async def run_assistant_async(
+    thread_id, name, message_body, on_text=None, wa_id=None, intent="function"
+):
+    try:
+        logging.info(f"Running assistant for thread: {thread_id}")
+
+        # Static instructions and the sections relevant to the message, then
+        # what we remember of this user, then the name and the new message;
+        # the model no longer re-asks for details it was already given
+        history = await asyncio.to_thread(conversation_memory.context, wa_id)
+        conversation_history = prompt_builder.build(intent, message_body, name, history=history)
+        new_turns = [conversation_history[-1]]
+
+        # Every tool call the model makes in one turn runs concurrently, and
+        # their results go back together in the next round trip
+        for _ in range(MAX_TOOL_ITERATIONS):
+            # Streamed when on_text is given, so the reply can be sent to the
+            # user as it is written
+            response_message = await llm_router.complete_async(
+                conversation_history, tools=eastc_functions, on_text=on_text
+            )
+            tool_calls = response_message.tool_calls
+            if tool_calls:
+                results = await run_tool_calls_async(tool_calls, tool_runtime, {"wa_id": wa_id})
+                conversation_history.append(
+                    assistant_tool_message(response_message.content, tool_calls)
+                )
+                conversation_history.extend(results)
+                new_turns.append(tool_results_turn(tool_calls, results))
             else:
-                # If no function call is detected, break with final response content
-                return response_message.content
+                # If no tool call is requested, this is the final reply
+                reply = response_message.content
+                if not reply:
+                    logging.error("No response content from assistant.")
+                    return "Samahani, kuna tatizo. Tafadhali jaribu tena baadaye."
+                new_turns.append({"role": "assistant", "content": reply})
+                try:
+                    # Summarising old turns may call the LLM; keep it off the loop
+                    await asyncio.to_thread(conversation_memory.append, wa_id, new_turns)
+                except Exception as e:
+                    logging.error(f"Could not update conversation memory: {e}")
+                return reply
+
+        logging.error(f"Assistant still calling tools after {MAX_TOOL_ITERATIONS} rounds, giving up")
+        return "Samahani, kuna tatizo. Tafadhali jaribu tena baadaye."
 
     except Exception as e:
         logging.error(f"Error running assistant: {str(e)}")
         return "Samahani, kuna tatizo. Tafadhali jaribu tena baadaye."
 
 
+def run_assistant(thread_id, name, message_body, on_text=None, wa_id=None, intent="function"):
+    """Blocking version of `run_assistant_async`."""
+    return async_runtime.run(
+        run_assistant_async(thread_id, name, message_body, on_text, wa_id, intent)
+    )
+
+
 """
 Dealing with the retrieval assistant
 """
@@ -314,13 +330,13 @@ def get_or_create_retrieval_assistant(vector_store_id):
 
     try:
         # Create the retrieval assistant
-        assistant = client.beta.assistants.create(
+        assistant = get_client().beta.assistants.create(
             name="RetrievalAssistant",
             instructions=SYSTEM_PROMPT,
             model="gpt-3.5-turbo",
             tools=[{"type": "file_search"}],
         )
-        updated_assistant = client.beta.assistants.update(
+        updated_assistant = get_client().beta.assistants.update(
             assistant_id=assistant.id,
             tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}},
         )
@@ -352,115 +368,280 @@ def initialize_assistants():
     return retrieval_assistant_id
 
 
-# Initialize assistants
-retrieval_assistant_id = initialize_assistants()
+# Assistant and vector-store initialisation runs in the background after startup;
+# a file lock makes sure only one worker process talks to the API at a time
+WARM_UP_LOCK_FILE = os.getenv("WARM_UP_LOCK_FILE", "warm_up.lock")
+WARM_UP_WAIT_SECONDS = float(os.getenv("WARM_UP_WAIT_SECONDS", "30"))
+retrieval_assistant_id = None
+warm_up_done = threading.Event()
+warm_up_error = None
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+def warm_up():
+    """Initialise the knowledge base for the configured retrieval mode."""
+    global retrieval_assistant_id, warm_up_error
+    started = time.monotonic()
+    try:
+        with FileLock(WARM_UP_LOCK_FILE):
+            if RETRIEVAL_MODE == "local":
+                bm25_index.sync(knowledge_files())
+            else:
+                retrieval_assistant_id = initialize_assistants()
+        logging.info(f"Warm-up finished in {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        warm_up_error = str(e)
+        logging.error(f"Warm-up failed: {e}")
+    finally:
+        warm_up_done.set()
+
+
+def start_warm_up():
+    """Start the warm-up on a background thread, once per process."""
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def readiness():
+    """Return (ready, details) for the /ready endpoint."""
+    if not warm_up_done.is_set():
+        return False, {"status": "warming_up"}
+    if warm_up_error:
+        return False, {"status": "error", "error": warm_up_error}
+    return True, {"status": "ready", "retrieval_mode": RETRIEVAL_MODE}
+
 
 # Define routing keywords and determine assistant type
-function_call_keywords = {"payment", "contact", "info"}
+def route_message(message_body):
+    """Route a message to a tool intent or to retrieval, logging the decision."""
+    decision = intent_router.route(message_body)
+    logging.info(
+        f"Intent '{decision.intent}' (score {decision.score:.1f}, "
+        f"confidence {decision.confidence:.2f}, scores {decision.scores})"
+    )
+    return decision
 
 
 def determine_assistant(message_body):
     """Determines the appropriate assistant based on message content."""
-    if any(keyword in message_body.lower() for keyword in function_call_keywords):
-        return "function"
-    return "retrieval"
-
+    if route_message(message_body).intent == RETRIEVAL_INTENT:
+        return "retrieval"
+    return "function"
+
+
+async def latest_assistant_reply_async(thread_id):
+    """Return the text of the newest assistant message on a thread, or None."""
+    messages = await get_async_client().beta.threads.messages.list(thread_id=thread_id)
+    for msg in messages.data:
+        if msg.role == "assistant" and msg.content:
+            # Check if content is in a complex structure and extract text
+            if isinstance(msg.content, list):
+                for content_block in msg.content:
+                    if hasattr(content_block, "text") and hasattr(
+                        content_block.text, "value"
+                    ):
+                        return content_block.text.value
+            elif isinstance(msg.content, str):
+                return msg.content
+    return None
+
+
+async def wait_for_retrieval_run_async(thread_id, assistant_id, on_text=None):
+    """
+    Run the assistant on a thread and return its reply text.
 
-# Thread management for user interactions
-def get_or_create_thread(wa_id):
-    with shelve.open(THREAD_DB_FILE, writeback=True) as threads_shelf:
-        thread_id = threads_shelf.get(wa_id)
-        if not thread_id:
-            try:
-                thread = client.beta.threads.create()
-                threads_shelf[wa_id] = thread.id
-                logging.info(
-                    f"New thread created for wa_id '{wa_id}' with thread ID: {thread.id}"
-                )
-                return thread.id
-            except Exception as e:
-                logging.error(f"Error creating new thread: {e}")
-                raise RuntimeError("Failed to create thread.")
-        return thread_id
+    Streams run events when possible. If the stream breaks after the run was
+    created, that run is polled instead; if streaming is unavailable
+    altogether, a regular run is created and polled. Either way the whole wait
+    is bounded by one RUN_TIMEOUT_SECONDS deadline.
+    """
+    client = get_async_client()
+    deadline = time.monotonic() + RUN_TIMEOUT_SECONDS
+    if RUN_STREAMING:
+        try:
+            run, reply = await stream_run_async(
+                client,
+                thread_id,
+                assistant_id,
+                timeout=RUN_TIMEOUT_SECONDS,
+                on_text=on_text,
+            )
+            return reply or await latest_assistant_reply_async(thread_id)
+        except (RunTimeoutError, RunFailedError):
+            raise
+        except RunStreamInterrupted as e:
+            logging.warning(f"{e}, falling back to polling")
+            await wait_for_run_async(
+                client, thread_id, e.run_id, timeout=deadline - time.monotonic()
+            )
+            return await latest_assistant_reply_async(thread_id)
+        except Exception as e:
+            logging.warning(f"Run streaming unavailable, falling back to polling: {e}")
+
+    run = await client.beta.threads.runs.create(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+    )
+    await wait_for_run_async(client, thread_id, run.id, timeout=deadline - time.monotonic())
+    return await latest_assistant_reply_async(thread_id)
+
+
+async def ask_retrieval_assistant_async(thread_id, name, message_body, assistant_id, on_text=None):
+    """Post the question to the thread, run the retrieval assistant and return its reply."""
+    if not assistant_id:
+        raise RuntimeError("Retrieval assistant is not initialised yet.")
+    # Add the user message to the thread
+    await get_async_client().beta.threads.messages.create(
+        thread_id=thread_id,
+        role="user",
+        content=f"{message_body},my name is {name}",
+    )
+
+    # Run the assistant and wait for it to reach a terminal state
+    reply = await wait_for_retrieval_run_async(thread_id, assistant_id, on_text=on_text)
+    if not reply:
+        raise RuntimeError("No valid response received from the assistant.")
+    logging.info(f"Assistant responded with: {reply}")
+    return reply
+
+
+async def ask_local_retrieval_async(name, message_body, on_text=None):
+    """
+    Answer from the local BM25 index with one chat completion.
 
+    The top passages are injected into the prompt, replacing the thread
+    message, run and polling round trips of the hosted assistant.
+    """
+    paths = knowledge_files()
+    # Re-reads any knowledge file that changed, so it runs off the loop
+    await asyncio.to_thread(bm25_index.refresh, paths)
+    passages = bm25_index.search(message_body, k=RETRIEVAL_TOP_K)
+    context = "\n\n---\n\n".join(p["text"] for p in passages)
+    messages = prompt_builder.build(
+        "retrieval",
+        message_body,
+        name,
+        extra_instructions="Answer using only the reference passages below. "
+        f"If they do not contain the answer, say so.\n\nReference passages:\n{context}",
+    )
+
+    reply = (await llm_router.complete_async(messages, on_text=on_text)).content
+    if not reply:
+        raise RuntimeError("No valid response received from the model.")
+    logging.info(f"Local retrieval responded with: {reply}")
+    return reply
+
+
+async def run_retrieval_assistant_async(thread_id, name, message_body, assistant_id, on_text=None):
+    """
+    Run retrieval assistant and get a response, streaming deltas to `on_text`.
 
-def run_retrieval_assistant(thread_id, name, message_body, assistant_id):
-    """Run retrieval assistant and get a response."""
+    Repeated FAQ questions are answered from the response cache, and identical
+    questions asked at the same time share a single assistant run.
+    """
     try:
-        # Add the user message to the thread
-        user_message = client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=f"{message_body},my name is {name}",
-        )
-
-        # Run the assistant
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id="asst_Mvq8PfboUCg0clWKdGq8L1XT",
+        reply, cached = await response_cache.get_or_compute_async(
+            message_body,
+            name,
+            lambda: ask_local_retrieval_async(name, message_body, on_text=on_text)
+            if RETRIEVAL_MODE == "local"
+            else ask_retrieval_assistant_async(
+                thread_id, name, message_body, assistant_id, on_text=on_text
+            ),
         )
+        if cached:
+            logging.info(f"Answered from response cache: {reply}")
+        return reply
 
-        # Wait for the run to complete
-        while run.status != "completed":
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-        # Get the assistant's response
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        for msg in messages.data:
-            if msg.role == "assistant" and msg.content:
-                # Check if content is in a complex structure and extract text
-                if isinstance(msg.content, list):
-                    for content_block in msg.content:
-                        if hasattr(content_block, "text") and hasattr(
-                            content_block.text, "value"
-                        ):
-                            logging.info(
-                                f"Assistant responded with: {content_block.text.value}"
-                            )
-                            return content_block.text.value
-                elif isinstance(msg.content, str):
-                    logging.info(f"Assistant responded with: {msg.content}")
-                    return msg.content
-
-        return "Sorry, no valid response received from the assistant."
-
+    except RunTimeoutError as e:
+        logging.error(f"Retrieval assistant timed out: {e}")
+        return "Sorry, this is taking longer than expected. Please try again."
     except Exception as e:
         logging.error(f"Error running retrieval assistant: {e}")
         return "Sorry, an error occurred. Please try again later."
 
 
+def run_retrieval_assistant(thread_id, name, message_body, assistant_id, on_text=None):
+    """Blocking version of `run_retrieval_assistant_async`."""
+    return async_runtime.run(
+        run_retrieval_assistant_async(thread_id, name, message_body, assistant_id, on_text)
+    )
+
+
+# Thread management for user interactions
+async def create_thread_async():
+    """Create a new OpenAI thread and return its ID."""
+    try:
+        thread = await get_async_client().beta.threads.create()
+        logging.info(f"New thread created with thread ID: {thread.id}")
+        return thread.id
+    except Exception as e:
+        logging.error(f"Error creating new thread: {e}")
+        raise RuntimeError("Failed to create thread.")
+
+
+def create_thread():
+    """Blocking version of `create_thread_async`."""
+    return async_runtime.run(create_thread_async())
+
+
+async def delete_thread_async(thread_id):
+    """Delete an OpenAI thread that is no longer needed."""
+    await get_async_client().beta.threads.delete(thread_id)
+
+
+def delete_thread(thread_id):
+    """Blocking version of `delete_thread_async`."""
+    async_runtime.run(delete_thread_async(thread_id))
+
+
 def get_or_create_thread(wa_id):
     """Retrieve or create a thread for the user."""
-    with shelve.open(THREAD_DB_FILE, writeback=True) as threads_shelf:
-        thread_id = threads_shelf.get(wa_id)
-        if thread_id:
-            logging.info(f"Found existing thread ID for wa_id '{wa_id}': {thread_id}")
-            return thread_id
-
-        try:
-            thread = client.beta.threads.create()
-            threads_shelf[wa_id] = thread.id
-            logging.info(
-                f"New thread created for wa_id '{wa_id}' with thread ID: {thread.id}"
-            )
-            return thread.id
-        except Exception as e:
-            logging.error(f"Error creating new thread: {e}")
-            raise RuntimeError("Failed to create thread.")
+    return thread_store.get_or_create(wa_id, create_thread, delete_thread)
 
 
 # Generate response
-def generate_response(message_body, wa_id, name):
-    """Route the message to the appropriate assistant."""
-    thread_id = get_or_create_thread(wa_id)
+async def generate_response_async(message_body, wa_id, name, on_text=None):
+    """
+    Route the message to the appropriate assistant.
+
+    Args:
+        message_body: The user's message text
+        wa_id: The user's WhatsApp ID
+        name: The user's profile name
+        on_text: Optional callable receiving reply text deltas as they stream
+            in; it is called on the event loop and must not block
+
+    Returns:
+        str: The full reply text.
+    """
+    # The thread store is SQLite; a new user's thread is created from the
+    # worker thread through the blocking wrapper
+    thread_id = await asyncio.to_thread(get_or_create_thread, wa_id)
 
     # Determine assistant type based on the message content
-    assistant_type = determine_assistant(message_body)
-    if assistant_type == "function":
+    intent = route_message(message_body).intent
+    if intent != RETRIEVAL_INTENT:
         logging.info("Routing to function assistant.")
-        return run_assistant(thread_id, name, message_body)
+        return await run_assistant_async(
+            thread_id, name, message_body, on_text=on_text, wa_id=wa_id, intent=intent
+        )
     else:
         logging.info("Routing to retrieval assistant.")
-        return run_retrieval_assistant(
-            thread_id, name, message_body, retrieval_assistant_id
+        # Messages that arrive during startup wait for the knowledge base
+        start_warm_up()
+        if not warm_up_done.is_set():
+            await asyncio.to_thread(warm_up_done.wait, WARM_UP_WAIT_SECONDS)
+        return await run_retrieval_assistant_async(
+            thread_id, name, message_body, retrieval_assistant_id, on_text=on_text
         )
+
+
+def generate_response(message_body, wa_id, name, on_text=None):
+    """Blocking version of `generate_response_async`, for callers outside the event loop."""
+    return async_runtime.run(generate_response_async(message_body, wa_id, name, on_text))
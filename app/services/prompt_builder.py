@@ -0,0 +1,122 @@
+import logging
+import re
+import threading
+from .conversation_memory import count_tokens, message_tokens
+
+# Words (English and Swahili, matched as prefixes) that make a numbered
+# section of the system prompt relevant to a message
+SECTION_KEYWORDS = {
+    1: ["availab", "lpg", "diesel", "petrol", "gas", "fuel", "stock", "mafuta", "dizeli", "petroli", "gesi", "inapatikana", "yapo"],
+    2: ["where", "nearest", "closest", "near", "locat", "direction", "wapi", "karibu", "mahali", "njia"],
+    3: ["queue", "wait", "busy", "traffic", "line", "foleni", "msongamano", "subiri", "muda"],
+    4: ["open", "clos", "hour", "time", "maintenance", "saa", "kufunguliwa", "kufungwa", "wazi"],
+    5: ["service", "wash", "tire", "tyre", "oil", "huduma", "kuosha", "tairi", "oili"],
+    6: ["discount", "promo", "offer", "loyalty", "punguzo", "ofa", "zawadi"],
+    7: ["emergenc", "breakdown", "broke", "tow", "mechanic", "dharura", "fundi", "imeharibika"],
+    8: ["complain", "feedback", "report", "issue", "problem", "malalamiko", "lalamik", "tatizo", "maoni"],
+    9: ["price", "cost", "how much", "bei", "gharama", "shilingi", "tsh", "kiasi"],
+    10: ["safe", "environment", "eco", "usalama", "salama", "mazingira"],
+}
+
+# Sections always included for a routed intent, on top of keyword matches
+INTENT_SECTIONS = {
+    "request_filling_station": (1, 2, 3, 4),
+    "confirm_booking": (3, 4),
+    "payment_options": (6, 9),
+    "register_user": (),
+    "function": (),
+    "retrieval": (),
+}
+
+SECTION_HEADING = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+
+class PromptBuilder:
+    """
+    Assemble system prompts from a static prefix plus the relevant sections.
+
+    The prompt document is split once into its overview (everything before
+    the first numbered section) and its numbered sections. Every prompt
+    starts with the same overview bytes, followed by the selected sections
+    in document order, so the provider's prompt cache can reuse the prefix.
+    Per-user details such as the name go in a separate message at the end.
+    Assembled prompts and their token counts are cached per section set.
+    """
+
+    def __init__(self, document):
+        document = document.strip().rstrip(".").rstrip()
+        headings = list(SECTION_HEADING.finditer(document))
+        self.prefix = document[: headings[0].start()].rstrip() if headings else document
+        self.sections = {}
+        for i, match in enumerate(headings):
+            end = headings[i + 1].start() if i + 1 < len(headings) else len(document)
+            self.sections[int(match.group(1))] = document[match.start() : end].rstrip()
+        self.prefix_tokens = count_tokens(self.prefix)
+        self.section_tokens = {n: count_tokens(text) for n, text in self.sections.items()}
+        self.full_tokens = count_tokens(document)
+        self._keywords = {
+            n: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in words) + ")")
+            for n, words in SECTION_KEYWORDS.items()
+            if n in self.sections
+        }
+        self._assembled = {}
+        self._lock = threading.Lock()
+        logging.info(
+            f"Prompt document split into a {self.prefix_tokens}-token prefix and "
+            f"{len(self.sections)} sections ({self.full_tokens} tokens in full)"
+        )
+
+    def sections_for(self, intent, message_body):
+        """Section numbers relevant to an intent and message, in document order."""
+        text = (message_body or "").lower()
+        selected = {n for n, pattern in self._keywords.items() if pattern.search(text)}
+        selected.update(n for n in INTENT_SECTIONS.get(intent, ()) if n in self.sections)
+        return tuple(sorted(selected))
+
+    def system_prompt(self, sections):
+        """
+        Return the system prompt for a section set and its token count.
+
+        Returns:
+            tuple: (prompt text, tokens)
+        """
+        with self._lock:
+            assembled = self._assembled.get(sections)
+        if assembled is None:
+            text = "\n".join([self.prefix] + [self.sections[n] for n in sections])
+            assembled = (text, self.prefix_tokens + sum(self.section_tokens[n] for n in sections))
+            with self._lock:
+                self._assembled[sections] = assembled
+        return assembled
+
+    def build(self, intent, message_body, name, history=(), extra_instructions=""):
+        """
+        Assemble the messages for one chat completion.
+
+        Args:
+            intent: Routed intent, e.g. "function" or a tool name
+            message_body: The user's message text
+            name: The user's profile name, placed after the history
+            history: Remembered messages to place before the new message
+            extra_instructions: Text appended to the system prompt, e.g. retrieved passages
+
+        Returns:
+            list: Chat messages, ending with the user's message.
+        """
+        sections = self.sections_for(intent, message_body)
+        system_text, system_tokens = self.system_prompt(sections)
+        if extra_instructions:
+            system_text = f"{system_text}\n\n{extra_instructions}"
+            system_tokens += count_tokens(extra_instructions)
+        messages = [
+            {"role": "system", "content": system_text},
+            *history,
+            {"role": "system", "content": f"You are having a conversation with the client named {name}."},
+            {"role": "user", "content": message_body},
+        ]
+        total_tokens = system_tokens + sum(message_tokens(m) for m in messages[1:])
+        logging.info(
+            f"Prompt for intent '{intent}': sections {list(sections)}, "
+            f"{system_tokens} system tokens of {self.full_tokens}, {total_tokens} tokens in total"
+        )
+        return messages
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from dotenv import load_dotenv
+
+load_dotenv()
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "900"))
+# How often the knowledge files are checked for changes
+KNOWLEDGE_CHECK_INTERVAL = float(os.getenv("KNOWLEDGE_CHECK_INTERVAL", "30"))
+
+# Words that carry no meaning for matching FAQ questions, in English and Swahili.
+# Single letters are deliberately absent: in "Station A" or "Pump B" the
+# letter is the name, so "a" and "i" are never dropped
+STOP_WORDS = {
+    # English
+    "an", "the", "is", "are", "was", "be", "what", "whats", "which", "how",
+    "do", "does", "can", "could", "would", "will", "you", "your", "me", "my",
+    "we", "please", "tell", "know", "want", "to", "of", "in", "on", "at", "for",
+    "there", "any", "it", "this", "that", "hi", "hello", "hey", "kindly", "and",
+    # Swahili
+    "je", "ni", "na", "ya", "wa", "za", "la", "kwa", "katika", "tafadhali",
+    "naomba", "nataka", "habari", "mambo", "gani", "hii", "hiyo", "hicho", "kile",
+    "ipi", "nini", "nani", "mimi", "wewe", "sana", "pia", "au", "kama",
+}
+
+NON_WORD = re.compile(r"[^\w\s]")
+# Placeholder standing in for the asking user's name inside a shared answer
+NAME_PLACEHOLDER = "\x00name\x00"
+
+
+def name_pattern(name):
+    """Regex matching a name as a whole word, so "Jo" is not found inside "Join"."""
+    return re.compile(rf"(?<!\w){re.escape(name)}(?!\w)")
+
+
+def normalise_question(text):
+    """
+    Reduce a question to the words that matter for matching.
+
+    Lower-cases, strips accents and punctuation and drops English and Swahili
+    stop words, so "What's the petrol price today?" and "petrol price today"
+    share a cache entry. Word order and single letters are kept, so "Station
+    A" and "a station" do not.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = NON_WORD.sub("", text.replace("'", "").replace("’", ""))
+    words = [word for word in text.split() if word not in STOP_WORDS]
+    return " ".join(words)
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of answers keyed by normalised question, with single-flight.
+
+    Concurrent identical questions are collapsed into one in-flight LLM call
+    whose answer is shared. The whole cache is dropped when any of the
+    knowledge files change, or on an explicit `invalidate()`.
+    """
+
+    def __init__(
+        self,
+        knowledge_files=(),
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    ):
+        self.knowledge_files = list(knowledge_files)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._fingerprint = self._knowledge_fingerprint()
+        self._last_check = time.monotonic()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    def _knowledge_fingerprint(self):
+        fingerprint = []
+        for path in self.knowledge_files:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def _check_knowledge(self):
+        # Called with the lock held
+        now = time.monotonic()
+        if now - self._last_check < KNOWLEDGE_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        fingerprint = self._knowledge_fingerprint()
+        if fingerprint != self._fingerprint:
+            logging.info("Knowledge files changed, clearing response cache")
+            self._fingerprint = fingerprint
+            self._entries.clear()
+
+    def invalidate(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._fingerprint = self._knowledge_fingerprint()
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def _put(self, key, answer):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _claim(self, key):
+        """
+        Look a key up, or register the caller as the one computing it.
+
+        Returns:
+            tuple: (cached answer or None, in-flight future, is_leader)
+        """
+        with self._lock:
+            self._check_knowledge()
+            answer = self._get(key)
+            if answer is not None:
+                self._hits += 1
+                return answer, None, False
+            future = self._in_flight.get(key)
+            if future is None:
+                future = Future()
+                self._in_flight[key] = future
+                self._misses += 1
+                return None, future, True
+            self._coalesced += 1
+            return None, future, False
+
+    def _settle(self, key, future, name, answer=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if error is None:
+                shared = name_pattern(name).sub(NAME_PLACEHOLDER, answer) if name else answer
+                self._put(key, shared)
+        if error is None:
+            future.set_result(shared)
+        else:
+            future.set_exception(error)
+
+    async def get_or_compute_async(self, question, name, compute):
+        """
+        Return a cached answer or compute it once for all concurrent askers.
+
+        Args:
+            question: The user's message text
+            name: The asking user's name; it is swapped out of shared answers
+            compute: Coroutine function returning the answer; exceptions are
+                not cached
+
+        Returns:
+            tuple: (answer, cached) where `cached` is False only for the caller
+            that actually ran `compute`.
+        """
+        key = normalise_question(question)
+        if not key:
+            return await compute(), False
+
+        answer, future, leader = self._claim(key)
+        if answer is not None:
+            return self._personalise(answer, name), True
+        if not leader:
+            # Shielded: a follower giving up must not cancel the shared answer
+            answer = await asyncio.shield(asyncio.wrap_future(future))
+            return self._personalise(answer, name), True
+
+        try:
+            answer = await compute()
+        except BaseException as e:
+            self._settle(key, future, name, error=e)
+            raise
+        self._settle(key, future, name, answer=answer)
+        return answer, False
+
+    @staticmethod
+    def _personalise(answer, name):
+        return answer.replace(NAME_PLACEHOLDER, name or "")
+
+    def stats(self):
+        """Return hit, miss and coalesced-call counters."""
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "hit_rate": round((self._hits + self._coalesced) / lookups, 4)
+                if lookups
+                else 0.0,
+            }
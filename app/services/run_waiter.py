@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+RUN_TIMEOUT_SECONDS = float(os.getenv("RUN_TIMEOUT_SECONDS", "60"))
+RUN_POLL_MIN_INTERVAL = float(os.getenv("RUN_POLL_MIN_INTERVAL", "0.2"))
+RUN_POLL_MAX_INTERVAL = float(os.getenv("RUN_POLL_MAX_INTERVAL", "2.0"))
+RUN_POLL_BACKOFF = 1.5
+
+# Run states after which the run will not progress on its own
+TERMINAL_RUN_STATES = {
+    "completed",
+    "failed",
+    "cancelled",
+    "expired",
+    "incomplete",
+    "requires_action",
+}
+# Stream events that carry a terminal run
+TERMINAL_RUN_EVENTS = {f"thread.run.{state}" for state in TERMINAL_RUN_STATES}
+
+
+class RunTimeoutError(RuntimeError):
+    """Raised when a run does not reach a terminal state before its deadline."""
+
+
+class RunFailedError(RuntimeError):
+    """Raised when a run ends in any terminal state other than 'completed'."""
+
+    def __init__(self, run):
+        super().__init__(f"Run {run.id} ended with status '{run.status}'")
+        self.run = run
+
+
+class RunStreamInterrupted(RuntimeError):
+    """Raised when a stream breaks after its run was created; poll the run instead."""
+
+    def __init__(self, run_id, cause):
+        super().__init__(f"Stream for run {run_id} was interrupted: {cause}")
+        self.run_id = run_id
+
+
+def _check_run(run):
+    if run.status != "completed":
+        raise RunFailedError(run)
+    return run
+
+
+async def stream_run_async(
+    client, thread_id, assistant_id, timeout=RUN_TIMEOUT_SECONDS, on_text=None
+):
+    """
+    Create a run and follow it through streamed run events.
+
+    The reply text is assembled from the message deltas, so no extra
+    messages.list call is needed once the run completes.
+
+    Args:
+        client: AsyncOpenAI client
+        thread_id: Thread to run
+        assistant_id: Assistant to run it with
+        timeout: Hard deadline for the whole run, in seconds
+        on_text: Optional callable receiving each text delta as it arrives;
+            it is called on the event loop and must not block
+
+    Returns:
+        tuple: (run, reply text)
+    """
+    parts = []
+    streams = []
+
+    async def follow():
+        async with client.beta.threads.runs.stream(
+            thread_id=thread_id, assistant_id=assistant_id, timeout=timeout
+        ) as stream:
+            streams.append(stream)
+            try:
+                async for event in stream:
+                    if event.event == "thread.message.delta":
+                        for block in event.data.delta.content or []:
+                            text = getattr(block, "text", None)
+                            if text is not None and text.value:
+                                parts.append(text.value)
+                                if on_text is not None:
+                                    on_text(text.value)
+                    elif event.event in TERMINAL_RUN_EVENTS:
+                        return event.data
+                    elif event.event == "error":
+                        raise RuntimeError(f"Run stream error: {event.data}")
+            except Exception as e:
+                current = stream.current_run
+                if current is None:
+                    raise
+                raise RunStreamInterrupted(current.id, e)
+        return None
+
+    # The request timeout only bounds each read, so a stream that stalls or
+    # keeps trickling events is closed at the deadline instead
+    try:
+        run = await asyncio.wait_for(follow(), timeout)
+    except asyncio.TimeoutError:
+        current = streams[0].current_run if streams else None
+        if current is not None:
+            await _cancel_run(client, thread_id, current.id)
+        raise RunTimeoutError(f"Run on thread {thread_id} timed out")
+
+    if run is None:
+        raise RuntimeError(f"Run stream on thread {thread_id} ended without a run")
+    return _check_run(run), "".join(parts)
+
+
+async def _cancel_run(client, thread_id, run_id):
+    try:
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        logging.warning(f"Could not cancel run {run_id}: {e}")
+
+
+async def wait_for_run_async(client, thread_id, run_id, timeout=RUN_TIMEOUT_SECONDS):
+    """
+    Poll a run until it reaches a terminal state.
+
+    Used when streaming is unavailable. Polling starts at a short interval
+    that backs off towards RUN_POLL_MAX_INTERVAL, so quick runs finish with
+    little dead time while long ones do not burn an API call every half
+    second. A waiting run is a coroutine asleep between polls, so thousands
+    of them cost no threads, and a failed retrieve is retried at the next
+    interval.
+
+    Returns:
+        The completed run.
+
+    Raises:
+        RunTimeoutError: If the deadline passes first (the run is cancelled).
+        RunFailedError: If the run ends in a non-completed terminal state.
+    """
+
+    async def poll():
+        interval = RUN_POLL_MIN_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                run = await client.beta.threads.runs.retrieve(
+                    thread_id=thread_id, run_id=run_id
+                )
+            except Exception as e:
+                logging.warning(f"Polling run {run_id} failed: {e}")
+            else:
+                if run.status in TERMINAL_RUN_STATES:
+                    return run
+            interval = min(interval * RUN_POLL_BACKOFF, RUN_POLL_MAX_INTERVAL)
+
+    try:
+        run = await asyncio.wait_for(poll(), max(timeout, 0))
+    except asyncio.TimeoutError:
+        await _cancel_run(client, thread_id, run_id)
+        raise RunTimeoutError(f"Run {run_id} timed out")
+    return _check_run(run)
@@ -0,0 +1,290 @@
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+STATIONS_FILE = os.getenv(
+    "STATIONS_FILE", os.path.join(os.path.dirname(os.path.dirname(__file__)), "stations.json")
+)
+# Side of one grid cell of the spatial index
+STATION_GRID_CELL_KM = float(os.getenv("STATION_GRID_CELL_KM", "2"))
+# Stations further away than this are never offered
+STATION_SEARCH_RADIUS_KM = float(os.getenv("STATION_SEARCH_RADIUS_KM", "30"))
+# Scoring, in km-equivalents: each car already queueing counts as this much
+# extra distance, and a station out of stock as this much
+STATION_QUEUE_WEIGHT_KM = float(os.getenv("STATION_QUEUE_WEIGHT_KM", "0.5"))
+STATION_OUT_OF_STOCK_PENALTY_KM = float(os.getenv("STATION_OUT_OF_STOCK_PENALTY_KM", "50"))
+# Users whose last shared location is remembered
+STATION_LOCATIONS_REMEMBERED = int(os.getenv("STATION_LOCATIONS_REMEMBERED", "10000"))
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+Station = namedtuple("Station", ["id", "name", "address", "latitude", "longitude"])
+RankedStation = namedtuple(
+    "RankedStation", ["station", "distance_km", "queue_length", "in_stock", "score"]
+)
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distance in km from one point to arrays of points."""
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlon = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def format_distance(distance_km):
+    if distance_km is None:
+        return "unknown"
+    return f"{distance_km:.1f} km"
+
+
+class StationRegistry:
+    """
+    Filling stations with a grid index for nearest-station queries.
+
+    Coordinates are bucketed into square cells about `cell_km` wide. A query
+    looks at the user's cell, then rings of cells around it, until the k-th
+    nearest station found is closer than any unvisited cell can be, so only
+    a handful of stations are measured even with thousands registered.
+    Queue length and stock are kept in arrays next to the coordinates and
+    updated in place, so candidates are ranked in one NumPy pass.
+    """
+
+    def __init__(
+        self,
+        stations=(),
+        cell_km=STATION_GRID_CELL_KM,
+        radius_km=STATION_SEARCH_RADIUS_KM,
+        queue_weight_km=STATION_QUEUE_WEIGHT_KM,
+        out_of_stock_penalty_km=STATION_OUT_OF_STOCK_PENALTY_KM,
+    ):
+        self.cell_km = cell_km
+        self.radius_km = radius_km
+        self.queue_weight_km = queue_weight_km
+        self.out_of_stock_penalty_km = out_of_stock_penalty_km
+        self._lock = threading.Lock()
+        self._locations = OrderedDict()
+        self.load(stations)
+
+    @classmethod
+    def from_file(cls, path=STATIONS_FILE, **kwargs):
+        """Load stations from a JSON list; a missing file gives an empty registry."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            logging.warning(f"Station file {path} not found, no stations registered")
+            records = []
+        return cls(records, **kwargs)
+
+    def load(self, records):
+        """
+        Replace the registered stations.
+
+        Each record has id, name, latitude and longitude, and optionally
+        address, queue_length and in_stock.
+        """
+        records = list(records)
+        stations = [
+            Station(
+                str(r["id"]),
+                r["name"],
+                r.get("address", ""),
+                float(r["latitude"]),
+                float(r["longitude"]),
+            )
+            for r in records
+        ]
+        latitudes = np.array([s.latitude for s in stations], dtype=float)
+        longitudes = np.array([s.longitude for s in stations], dtype=float)
+        queues = np.array([r.get("queue_length", 0) for r in records], dtype=float)
+        in_stock = np.array([r.get("in_stock", True) for r in records], dtype=bool)
+
+        # Cells are square at the stations' mean latitude
+        mean_lat = float(latitudes.mean()) if stations else 0.0
+        lat_step = self.cell_km / KM_PER_DEGREE_LAT
+        lon_step = lat_step / max(math.cos(math.radians(mean_lat)), 0.2)
+        rows = np.floor(latitudes / lat_step).astype(int)
+        cols = np.floor(longitudes / lon_step).astype(int)
+        cells = {}
+        for index, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            cells.setdefault(cell, []).append(index)
+
+        with self._lock:
+            self._stations = stations
+            self._by_id = {s.id: i for i, s in enumerate(stations)}
+            self._latitudes = latitudes
+            self._longitudes = longitudes
+            self._queues = queues
+            self._in_stock = in_stock
+            self._lat_step = lat_step
+            self._lon_step = lon_step
+            self._cells = {cell: np.array(ids) for cell, ids in cells.items()}
+            self._max_rings = int(math.ceil(self.radius_km / self.cell_km)) + 1
+        logging.info(f"Station registry loaded {len(stations)} stations in {len(cells)} cells")
+
+    def __len__(self):
+        return len(self._stations)
+
+    def get(self, station_id):
+        index = self._by_id.get(str(station_id))
+        return None if index is None else self._stations[index]
+
+    def update(self, station_id, queue_length=None, in_stock=None):
+        """Record a station's current queue length and/or stock; False if unknown."""
+        index = self._by_id.get(str(station_id))
+        if index is None:
+            return False
+        with self._lock:
+            if queue_length is not None:
+                self._queues[index] = queue_length
+            if in_stock is not None:
+                self._in_stock[index] = in_stock
+        return True
+
+    def _ring(self, row, col, ring):
+        """Station indices in the cells exactly `ring` cells from (row, col)."""
+        if ring == 0:
+            cells = [(row, col)]
+        else:
+            cells = [(row - ring, c) for c in range(col - ring, col + ring + 1)]
+            cells += [(row + ring, c) for c in range(col - ring, col + ring + 1)]
+            cells += [(r, col - ring) for r in range(row - ring + 1, row + ring)]
+            cells += [(r, col + ring) for r in range(row - ring + 1, row + ring)]
+        found = [self._cells[cell] for cell in cells if cell in self._cells]
+        return np.concatenate(found) if found else None
+
+    def nearest(self, latitude, longitude, k):
+        """
+        Indices and distances of up to k stations nearest to a point.
+
+        Returns:
+            tuple: (index array, distance array in km), nearest first, limited
+            to the search radius.
+        """
+        row = math.floor(latitude / self._lat_step)
+        col = math.floor(longitude / self._lon_step)
+        indices, distances = [], []
+        for ring in range(self._max_rings + 1):
+            found = self._ring(row, col, ring)
+            if found is not None:
+                indices.append(found)
+                distances.append(
+                    haversine_km(
+                        latitude, longitude, self._latitudes[found], self._longitudes[found]
+                    )
+                )
+            count = sum(len(i) for i in indices)
+            # Anything in an unvisited ring is at least `ring` cells away
+            if count >= k:
+                kth = np.partition(np.concatenate(distances), k - 1)[k - 1]
+                if kth <= ring * self.cell_km:
+                    break
+        if not indices:
+            return np.array([], dtype=int), np.array([], dtype=float)
+        indices = np.concatenate(indices)
+        distances = np.concatenate(distances)
+        within = distances <= self.radius_km
+        indices, distances = indices[within], distances[within]
+        order = np.argsort(distances, kind="stable")[:k]
+        return indices[order], distances[order]
+
+    def _ranked(self, indices, distances, scores, k):
+        ranked = []
+        for j in np.argsort(scores, kind="stable")[:k]:
+            i = int(indices[j])
+            ranked.append(
+                RankedStation(
+                    self._stations[i],
+                    None if distances is None else round(float(distances[j]), 2),
+                    int(self._queues[i]),
+                    bool(self._in_stock[i]),
+                    round(float(scores[j]), 3),
+                )
+            )
+        return ranked
+
+    def rank(self, latitude, longitude, k=5, candidates=4):
+        """
+        Best k stations for a user at a point.
+
+        The `k * candidates` nearest stations are scored together on distance,
+        queue length and stock (lower is better), so a slightly further
+        station with no queue beats a close one with a long queue.
+
+        Returns:
+            list: RankedStation tuples, best first.
+        """
+        if not self._stations:
+            return []
+        indices, distances = self.nearest(latitude, longitude, k * candidates)
+        with self._lock:
+            queues = self._queues[indices]
+            out_of_stock = ~self._in_stock[indices]
+        scores = (
+            distances
+            + self.queue_weight_km * queues
+            + self.out_of_stock_penalty_km * out_of_stock
+        )
+        return self._ranked(indices, distances, scores, k)
+
+    def rank_without_location(self, k=5):
+        """Best k stations on queue length and stock alone, when the user's location is unknown."""
+        if not self._stations:
+            return []
+        indices = np.arange(len(self._stations))
+        with self._lock:
+            scores = (
+                self.queue_weight_km * self._queues
+                + self.out_of_stock_penalty_km * ~self._in_stock
+            )
+        return self._ranked(indices, None, scores, k)
+
+    def remember_location(self, wa_id, latitude, longitude):
+        """Keep a user's last shared location for later station requests."""
+        digits = "".join(ch for ch in str(wa_id) if ch.isdigit())
+        with self._lock:
+            self._locations[digits] = (latitude, longitude)
+            self._locations.move_to_end(digits)
+            while len(self._locations) > STATION_LOCATIONS_REMEMBERED:
+                self._locations.popitem(last=False)
+
+    def last_location(self, phone_number):
+        """The (latitude, longitude) last shared from a phone number, or None."""
+        digits = "".join(ch for ch in str(phone_number) if ch.isdigit())
+        with self._lock:
+            return self._locations.get(digits)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stations": len(self._stations),
+                "cells": len(self._cells),
+                "in_stock": int(self._in_stock.sum()),
+                "remembered_locations": len(self._locations),
+            }
+
+
+def station_summary(ranked):
+    """JSON-ready description of a RankedStation for the model."""
+    return {
+        "id": ranked.station.id,
+        "name": ranked.station.name,
+        "location": ranked.station.address,
+        "distance": format_distance(ranked.distance_km),
+        "distance_km": ranked.distance_km,
+        "queue_length": ranked.queue_length,
+        "in_stock": ranked.in_stock,
+    }
+
+
+station_registry = StationRegistry.from_file()
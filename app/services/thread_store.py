@@ -0,0 +1,192 @@
+import logging
+import os
+import shelve
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+THREAD_STORE_FILE = os.getenv("THREAD_STORE_FILE", "threads.sqlite3")
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "10000"))
+# Legacy shelve file that held the wa_id -> thread ID map
+LEGACY_THREAD_DB_FILE = "threads_db"
+
+
+class ThreadStore:
+    """
+    Maps WhatsApp IDs to OpenAI thread IDs.
+
+    Backed by SQLite in WAL mode so several workers and processes can share it,
+    with a read-through LRU cache in front so the hot path never touches disk.
+    `get_or_create` creates the OpenAI thread outside any transaction and
+    stores it with INSERT OR IGNORE, so the database write lock is never held
+    across a network call; if another process stored a thread for the user
+    first, its thread wins and the new one is deleted.
+    """
+
+    def __init__(self, db_file=THREAD_STORE_FILE, cache_size=THREAD_CACHE_SIZE):
+        self.db_file = db_file
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # wa_id -> [lock, holders]; only users being created have an entry
+        self._key_locks = {}
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS threads "
+            "(wa_id TEXT PRIMARY KEY, thread_id TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cache_get(self, wa_id):
+        with self._cache_lock:
+            thread_id = self._cache.get(wa_id)
+            if thread_id is not None:
+                self._cache.move_to_end(wa_id)
+            return thread_id
+
+    def _cache_put(self, wa_id, thread_id):
+        with self._cache_lock:
+            self._cache[wa_id] = thread_id
+            self._cache.move_to_end(wa_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @contextmanager
+    def _key_lock(self, wa_id):
+        with self._cache_lock:
+            entry = self._key_locks.setdefault(wa_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._cache_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[wa_id]
+
+    def get(self, wa_id):
+        """Return the thread ID stored for a user, or None."""
+        thread_id = self._cache_get(wa_id)
+        if thread_id is not None:
+            return thread_id
+        row = (
+            self._connection()
+            .execute("SELECT thread_id FROM threads WHERE wa_id = ?", (wa_id,))
+            .fetchone()
+        )
+        if row:
+            self._cache_put(wa_id, row[0])
+            return row[0]
+        return None
+
+    def get_or_create(self, wa_id, create_thread, delete_thread=None):
+        """
+        Return the user's thread ID, creating it if missing.
+
+        Args:
+            wa_id: The user's WhatsApp ID
+            create_thread: Callable returning a new thread ID
+            delete_thread: Optional callable deleting a thread ID, used when
+                another process stored a thread for the user first
+
+        Returns:
+            str: The thread ID.
+        """
+        thread_id = self.get(wa_id)
+        if thread_id is not None:
+            return thread_id
+
+        # The per-key lock keeps threads in this process from creating a thread
+        # each; across processes the first INSERT wins
+        with self._key_lock(wa_id):
+            thread_id = self.get(wa_id)
+            if thread_id is not None:
+                return thread_id
+
+            created = create_thread()
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO threads (wa_id, thread_id) VALUES (?, ?)",
+                (wa_id, created),
+            )
+            thread_id = conn.execute(
+                "SELECT thread_id FROM threads WHERE wa_id = ?", (wa_id,)
+            ).fetchone()[0]
+            self._cache_put(wa_id, thread_id)
+
+        if thread_id != created:
+            logging.info(f"Thread for {wa_id} was created elsewhere, deleting {created}")
+            if delete_thread is not None:
+                try:
+                    delete_thread(created)
+                except Exception as e:
+                    logging.error(f"Could not delete orphan thread {created}: {e}")
+        return thread_id
+
+    def migrate_from_shelve(self, shelve_file=LEGACY_THREAD_DB_FILE):
+        """
+        Copy the wa_id -> thread ID map from the legacy shelve file, once.
+
+        Returns:
+            int: Number of mappings imported (0 if already migrated).
+        """
+        conn = self._connection()
+        done = conn.execute(
+            "SELECT value FROM store_meta WHERE key = 'shelve_migrated'"
+        ).fetchone()
+        if done:
+            return 0
+
+        imported = 0
+        rows = []
+        legacy_files = [shelve_file, f"{shelve_file}.db", f"{shelve_file}.dat"]
+        if any(os.path.exists(path) for path in legacy_files):
+            try:
+                with shelve.open(shelve_file, flag="r") as threads_shelf:
+                    rows = [(str(k), str(v)) for k, v in threads_shelf.items()]
+            except Exception as e:
+                # Leave the migration pending so it is retried on the next start
+                logging.error(f"Could not read legacy thread shelf '{shelve_file}': {e}")
+                return 0
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for wa_id, thread_id in rows:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO threads (wa_id, thread_id) VALUES (?, ?)",
+                    (wa_id, thread_id),
+                )
+                imported += cursor.rowcount
+            conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('shelve_migrated', '1')"
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        logging.info(f"Migrated {imported} thread mappings from '{shelve_file}'")
+        return imported
+
+
+# Shared store used by the OpenAI service
+thread_store = ThreadStore()
+thread_store.migrate_from_shelve()
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "5000"))
+
+
+def canonical_arguments(arguments):
+    """Arguments as a stable string, so {"a": 1, "b": 2} and {"b": 2, "a": 1} match."""
+    return json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ToolResultCache:
+    """
+    TTL + LRU cache of successful tool results.
+
+    Entries are keyed by tool name and canonicalised arguments, and each tool
+    sets its own TTL when it stores a result. Tools that change state drop
+    the cached results they affect through `invalidate`, scoped to a user
+    when the call names one.
+    """
+
+    def __init__(self, max_entries=TOOL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    def get(self, tool_name, arguments):
+        """Return the cached data for a call, or None."""
+        key = (tool_name, canonical_arguments(arguments))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[0]:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[2]
+
+    def put(self, tool_name, arguments, data, ttl_seconds):
+        key = (tool_name, canonical_arguments(arguments))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, arguments, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, tool_names, user_id=None):
+        """
+        Drop cached results of `tool_names`; only those for `user_id` if given.
+
+        Returns:
+            int: Number of entries dropped.
+        """
+        tool_names = set(tool_names)
+        with self._lock:
+            stale = [
+                key
+                for key, (_, arguments, _) in self._entries.items()
+                if key[0] in tool_names
+                and (user_id is None or arguments.get("user_id") == user_id)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self._invalidations += len(stale)
+            return len(stale)
+
+    def stats(self):
+        """Return hit, miss, invalidation and eviction counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+from types import SimpleNamespace
+from dotenv import load_dotenv
+from app.utils.async_runtime import async_runtime
+from .function_descriptions import eastc_functions
+
+load_dotenv()
+# Model round trips allowed per user message before giving up
+MAX_TOOL_ITERATIONS = int(os.getenv("MAX_TOOL_ITERATIONS", "5"))
+
+_JSON_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "object": (dict,),
+    "array": (list,),
+}
+
+
+def compile_schema(schema, path="arguments"):
+    """
+    Compile a JSON schema (the subset used in tool definitions) into a checker.
+
+    Supports type, properties, required, enum, items and additionalProperties.
+    The returned callable takes a value and returns a list of error messages.
+    """
+    checks = []
+    expected = schema.get("type")
+    if expected:
+        types = _JSON_TYPES[expected]
+
+        def check_type(value):
+            # bool is an int subclass, but true is not a valid integer
+            if isinstance(value, bool) and bool not in types:
+                return [f"{path} must be of type {expected}"]
+            if not isinstance(value, types):
+                return [f"{path} must be of type {expected}"]
+            return []
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+        checks.append(
+            lambda value: [] if value in allowed else [f"{path} must be one of {allowed}"]
+        )
+
+    if expected == "object":
+        properties = {
+            key: compile_schema(sub, f"{path}.{key}")
+            for key, sub in schema.get("properties", {}).items()
+        }
+        required = schema.get("required", [])
+        closed = schema.get("additionalProperties") is False
+
+        def check_object(value):
+            if not isinstance(value, dict):
+                return []
+            errors = [f"{path}.{key} is required" for key in required if key not in value]
+            for key, item in value.items():
+                if key in properties:
+                    errors.extend(properties[key](item))
+                elif closed:
+                    errors.append(f"{path}.{key} is not allowed")
+            return errors
+
+        checks.append(check_object)
+
+    if expected == "array" and "items" in schema:
+        item_check = compile_schema(schema["items"], f"{path}[]")
+        checks.append(
+            lambda value: [e for item in value for e in item_check(item)]
+            if isinstance(value, list)
+            else []
+        )
+
+    def validate(value):
+        errors = []
+        for check in checks:
+            errors.extend(check(value))
+            if errors:
+                break
+        return errors
+
+    return validate
+
+
+# Argument checkers for every tool, compiled once at import
+TOOL_VALIDATORS = {
+    tool["function"]["name"]: compile_schema(tool["function"].get("parameters", {}))
+    for tool in eastc_functions
+}
+
+
+def decode_tool_arguments(tool_call):
+    """
+    Decode a tool call's JSON arguments.
+
+    Returns:
+        tuple: (arguments dict or None, error message or None)
+    """
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+    except json.JSONDecodeError as e:
+        return None, f"Arguments are not valid JSON: {e}"
+    if not isinstance(arguments, dict):
+        return None, "Arguments must be a JSON object"
+    return arguments, None
+
+
+def tool_payload(result):
+    """The JSON-ready form of a ToolResult sent back to the model."""
+    if result.ok:
+        return {"ok": True, "result": result.data}
+    return {"ok": False, "error": result.error}
+
+
+async def run_tool_calls_async(tool_calls, runtime, context=None):
+    """
+    Run every tool call of one model turn concurrently on a ToolRuntime.
+
+    The tools run on the runtime's worker threads; the event loop only awaits
+    them. `context` is passed to the runtime for tools that need to know
+    about the conversation, such as the requesting wa_id.
+
+    Returns:
+        list: One "tool" message per call, in the order the model made them.
+    """
+    # Start every call before waiting on any, so they overlap
+    pending = []
+    for call in tool_calls:
+        arguments, error = decode_tool_arguments(call)
+        if error is not None:
+            logging.warning(f"Rejected call to {call.function.name}: {error}")
+            pending.append({"ok": False, "error": error})
+        else:
+            pending.append(runtime.start(call.function.name, arguments, context))
+
+    messages = []
+    for call, item in zip(tool_calls, pending):
+        payload = item if isinstance(item, dict) else tool_payload(await runtime.wait_async(item))
+        messages.append(
+            {"role": "tool", "tool_call_id": call.id, "content": format_tool_result(payload)}
+        )
+    return messages
+
+
+def run_tool_calls(tool_calls, runtime, context=None):
+    """Blocking version of `run_tool_calls_async`, for callers outside the event loop."""
+    return async_runtime.run(run_tool_calls_async(tool_calls, runtime, context))
+
+
+def format_tool_result(result):
+    """Serialise a tool's result for the model."""
+    if isinstance(result, str):
+        return result
+    try:
+        return json.dumps(result, default=str, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return str(result)
+
+
+def assistant_tool_message(content, tool_calls):
+    """The assistant message that must precede the tool results in the history."""
+    return {
+        "role": "assistant",
+        "content": content,
+        "tool_calls": [
+            {
+                "id": call.id,
+                "type": "function",
+                "function": {"name": call.function.name, "arguments": call.function.arguments},
+            }
+            for call in tool_calls
+        ],
+    }
+
+
+def tool_results_turn(tool_calls, results):
+    """Fold one turn's tool results into a plain assistant turn for memory."""
+    lines = [
+        f"{call.function.name} result: {result['content']}"
+        for call, result in zip(tool_calls, results)
+    ]
+    return {"role": "assistant", "content": "\n".join(lines)}
+
+
+class ToolCallAccumulator:
+    """Rebuild complete tool calls from streamed `delta.tool_calls` fragments."""
+
+    def __init__(self):
+        self._calls = {}
+
+    def add(self, deltas):
+        for delta in deltas or []:
+            call = self._calls.setdefault(
+                delta.index, {"id": None, "name": "", "arguments": []}
+            )
+            if delta.id:
+                call["id"] = delta.id
+            if delta.function is not None:
+                call["name"] += delta.function.name or ""
+                call["arguments"].append(delta.function.arguments or "")
+
+    def tool_calls(self):
+        return [
+            SimpleNamespace(
+                id=call["id"],
+                type="function",
+                function=SimpleNamespace(name=call["name"], arguments="".join(call["arguments"])),
+            )
+            for _, call in sorted(self._calls.items())
+        ]
@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from .tool_calls import TOOL_VALIDATORS
+from .tool_cache import ToolResultCache
+
+load_dotenv()
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "8"))
+# Tool invocations queued or running at once, across all tools
+TOOL_QUEUE_LIMIT = int(os.getenv("TOOL_QUEUE_LIMIT", "64"))
+TOOL_DEFAULT_TIMEOUT = float(os.getenv("TOOL_DEFAULT_TIMEOUT", "10"))
+
+ToolResult = namedtuple("ToolResult", ["ok", "data", "error"])
+
+
+class ToolError(Exception):
+    """Raised by a tool for an expected failure the model should be told about."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+class _Tool:
+    def __init__(self, name, func, timeout, max_concurrency, cache_ttl, invalidates, context):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.invalidates = tuple(invalidates)
+        self.context = tuple(context)
+        self.validator = TOOL_VALIDATORS.get(name)
+        self.max_concurrency = max_concurrency
+        # Invocations holding a slot, and those queued for one
+        self.running = 0
+        self.waiting = deque()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+
+
+class _Invocation:
+    __slots__ = ("tool", "arguments", "context", "future", "deadline", "result")
+
+    def __init__(self, tool=None, arguments=None, context=None, result=None):
+        self.tool = tool
+        self.arguments = arguments
+        self.context = context
+        self.future = Future() if tool else None
+        self.deadline = time.monotonic() + tool.timeout if tool else 0.0
+        self.result = result
+
+
+class ToolRuntime:
+    """
+    Registry and executor for the assistant's tools.
+
+    Tools are plain callables registered with `@tool(...)`; they take keyword
+    arguments, return JSON-serialisable data and raise ToolError for expected
+    failures. Arguments are checked against the tool's schema from
+    `eastc_functions` before anything runs. Invocations share one bounded
+    thread pool; each tool has its own timeout and concurrency cap, and calls
+    over the cap wait in the tool's own queue rather than on a pool thread, so
+    a slow backend behind one tool cannot take every worker. Nothing here needs a
+    Flask request, so tools run the same on any worker thread or process.
+    """
+
+    def __init__(self, num_workers=TOOL_WORKERS, queue_limit=TOOL_QUEUE_LIMIT, cache=None):
+        self._tools = {}
+        self.cache = cache if cache is not None else ToolResultCache()
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="tool")
+        self._capacity = threading.BoundedSemaphore(queue_limit)
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name=None,
+        timeout=TOOL_DEFAULT_TIMEOUT,
+        max_concurrency=4,
+        cache_ttl=None,
+        invalidates=(),
+        context=(),
+    ):
+        """
+        Decorator registering a tool.
+
+        Args:
+            name: Tool name as described to the model; defaults to the function name
+            timeout: Seconds a caller waits for the result, including queueing
+            max_concurrency: Invocations of this tool allowed to run at once
+            cache_ttl: Seconds to reuse a successful result for identical
+                arguments; None disables caching
+            invalidates: Tools whose cached results a successful call makes
+                stale, for the same user_id when the call has one
+            context: Names of values about the conversation (e.g. "wa_id")
+                passed to the tool as keyword arguments; the model cannot
+                set them
+        """
+
+        def decorator(func):
+            tool_name = name or func.__name__
+            if tool_name not in TOOL_VALIDATORS:
+                raise ValueError(f"Tool '{tool_name}' has no description in eastc_functions")
+            self._tools[tool_name] = _Tool(
+                tool_name, func, timeout, max_concurrency, cache_ttl, invalidates, context
+            )
+            return func
+
+        return decorator
+
+    def names(self):
+        return list(self._tools)
+
+    def start(self, name, arguments, context=None):
+        """
+        Validate and queue one invocation without waiting for it.
+
+        `context` holds values about the conversation, such as the requesting
+        wa_id; each tool receives only the ones it registered for.
+        """
+        tool = self._tools.get(name)
+        if tool is None:
+            return _Invocation(result=ToolResult(False, None, f"Unknown tool '{name}'"))
+        errors = tool.validator(arguments) if tool.validator else []
+        if errors:
+            return _Invocation(
+                result=ToolResult(False, None, "Invalid arguments: " + "; ".join(errors))
+            )
+        if tool.cache_ttl:
+            data = self.cache.get(name, arguments)
+            if data is not None:
+                logging.info(f"Tool {name} answered from cache")
+                return _Invocation(result=ToolResult(True, data, None))
+        if not self._capacity.acquire(blocking=False):
+            logging.error(f"Tool runtime is saturated, rejecting call to {name}")
+            return _Invocation(result=ToolResult(False, None, "Tool runtime is busy, try again"))
+
+        invocation = _Invocation(tool, arguments, context or {})
+        invocation.future.add_done_callback(lambda _: self._capacity.release())
+        with self._lock:
+            if tool.running >= tool.max_concurrency:
+                tool.waiting.append(invocation)
+                return invocation
+            tool.running += 1
+        self._submit(invocation)
+        return invocation
+
+    def _submit(self, invocation):
+        """Hand an invocation that holds one of its tool's slots to the pool."""
+        try:
+            self._executor.submit(self._execute, invocation)
+        except RuntimeError as e:  # executor shut down
+            if invocation.future.set_running_or_notify_cancel():
+                invocation.future.set_result(ToolResult(False, None, str(e)))
+            self._release_slot(invocation.tool)
+
+    def _release_slot(self, tool):
+        """Pass a finished invocation's slot to the next caller still waiting."""
+        with self._lock:
+            while tool.waiting:
+                invocation = tool.waiting.popleft()
+                if not invocation.future.cancelled():
+                    break
+            else:
+                tool.running -= 1
+                return
+        self._submit(invocation)
+
+    def _execute(self, invocation):
+        try:
+            # A caller that gave up cancels the future; running the call now
+            # would cause side effects nobody reports
+            if invocation.future.set_running_or_notify_cancel():
+                invocation.future.set_result(self._call(invocation))
+        finally:
+            self._release_slot(invocation.tool)
+
+    def _call(self, invocation):
+        tool = invocation.tool
+        arguments = invocation.arguments
+        if time.monotonic() >= invocation.deadline:
+            return ToolResult(False, None, f"Tool '{tool.name}' is busy, try again")
+        context = {key: invocation.context.get(key) for key in tool.context}
+        with self._lock:
+            tool.calls += 1
+        try:
+            try:
+                data = tool.func(**{**arguments, **context})
+            except ToolError as e:
+                error = str(e) if e.details is None else f"{e}: {e.details}"
+                return ToolResult(False, None, error)
+            if tool.cache_ttl and data is not None:
+                self.cache.put(tool.name, arguments, data, tool.cache_ttl)
+            if tool.invalidates:
+                self.cache.invalidate(tool.invalidates, user_id=arguments.get("user_id"))
+            return ToolResult(True, data, None)
+        except Exception as e:
+            logging.error(f"Tool {tool.name} failed: {e}")
+            with self._lock:
+                tool.failures += 1
+            return ToolResult(False, None, f"Tool failed: {e}")
+
+    def wait(self, invocation):
+        """Wait for an invocation started with `start`, up to its tool's timeout."""
+        if invocation.result is not None:
+            return invocation.result
+        tool = invocation.tool
+        try:
+            result = invocation.future.result(
+                timeout=max(invocation.deadline - time.monotonic(), 0)
+            )
+        except FutureTimeoutError:
+            result = self._timed_out(invocation)
+        logging.info(f"Tool {tool.name} finished: {result}")
+        return result
+
+    async def wait_async(self, invocation):
+        """`wait` for a coroutine: the event loop is not blocked while the tool runs."""
+        if invocation.result is not None:
+            return invocation.result
+        tool = invocation.tool
+        try:
+            # Shielded so the timeout does not cancel the future before
+            # `_timed_out` does, which keeps the two paths identical
+            result = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(invocation.future)),
+                max(invocation.deadline - time.monotonic(), 0),
+            )
+        except asyncio.TimeoutError:
+            result = self._timed_out(invocation)
+        logging.info(f"Tool {tool.name} finished: {result}")
+        return result
+
+    def _timed_out(self, invocation):
+        # A call still queued behind the tool's cap is dropped without running
+        invocation.future.cancel()
+        tool = invocation.tool
+        with self._lock:
+            tool.timeouts += 1
+        logging.error(f"Tool {tool.name} timed out after {tool.timeout}s")
+        return ToolResult(False, None, f"Tool '{tool.name}' timed out")
+
+    def run(self, name, arguments, context=None):
+        """Run one tool and return its ToolResult."""
+        return self.wait(self.start(name, arguments, context))
+
+    def run_many(self, calls):
+        """Run (name, arguments) pairs concurrently; results keep the input order."""
+        invocations = [self.start(name, arguments) for name, arguments in calls]
+        return [self.wait(invocation) for invocation in invocations]
+
+    def stats(self):
+        """Per-tool call, failure and timeout counters, plus result cache counters."""
+        with self._lock:
+            tools = {
+                name: {
+                    "calls": t.calls,
+                    "failures": t.failures,
+                    "timeouts": t.timeouts,
+                    "running": t.running,
+                    "waiting": len(t.waiting),
+                }
+                for name, t in self._tools.items()
+            }
+        return {"tools": tools, "cache": self.cache.stats()}
+
+
+# Shared runtime; tools register themselves with @tool(...)
+tool_runtime = ToolRuntime()
+tool = tool_runtime.register
@@ -0,0 +1,399 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+USER_STORE_FILE = os.getenv("USER_STORE_FILE", "users.sqlite3")
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Bounds how long another worker's change to a user can go unseen
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+# Country code assumed for local numbers such as 0712 345 678
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "255")
+
+PENDING = "Pending"
+CONFIRMED = "Confirmed"
+CANCELLED = "Cancelled"
+# Booking status -> statuses it may move to
+BOOKING_TRANSITIONS = {
+    PENDING: {CONFIRMED, CANCELLED},
+    CONFIRMED: {CANCELLED},
+    CANCELLED: set(),
+}
+
+_NON_DIGIT = re.compile(r"\D")
+_NON_ALNUM = re.compile(r"[^0-9A-Z]")
+
+
+def normalise_phone(phone_number, country_code=DEFAULT_COUNTRY_CODE):
+    """
+    E.164 form of a phone number, e.g. "0712 345 678" -> "+255712345678".
+
+    WhatsApp IDs ("255712345678") and numbers with "+" or "00" prefixes keep
+    their country code; local numbers get `country_code`.
+    """
+    raw = str(phone_number).strip()
+    digits = _NON_DIGIT.sub("", raw)
+    if raw.startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    if digits.startswith("0"):
+        return "+" + country_code + digits[1:]
+    if len(digits) == 9:
+        return "+" + country_code + digits
+    return "+" + digits
+
+
+def normalise_plate(car_plate_no):
+    """Plate number as stored for lookups: upper case without spaces, e.g. "T 123 ABC" -> "T123ABC"."""
+    return _NON_ALNUM.sub("", str(car_plate_no).upper())
+
+
+class BookingError(Exception):
+    """Raised when a booking change is not allowed in the booking's current state."""
+
+
+class UserStore:
+    """
+    Registered users and their bookings.
+
+    Backed by SQLite in WAL mode so every worker thread and process sees the
+    same data. Users are looked up by ID, E.164 phone number or plate number
+    through indexes, with a small LRU cache of user rows in front. Booking
+    changes run in BEGIN IMMEDIATE transactions that check the current
+    status, so two workers cannot both confirm or cancel the same booking,
+    and a user has at most one pending booking at a time. Registrations
+    waiting for the registration backend are kept here too, so they survive
+    a restart; a worker claims one for a lease before replaying it.
+    """
+
+    def __init__(
+        self,
+        db_file=USER_STORE_FILE,
+        cache_size=USER_CACHE_SIZE,
+        cache_ttl=USER_CACHE_TTL_SECONDS,
+    ):
+        self.db_file = db_file
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+        self._hits = 0
+        self._misses = 0
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phone_number TEXT NOT NULL UNIQUE,
+                car_plate_no TEXT NOT NULL,
+                plate_key TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS users_plate ON users (plate_key);
+            CREATE TABLE IF NOT EXISTS bookings (
+                booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL REFERENCES users (user_id),
+                payment_option TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bookings_user ON bookings (user_id, booking_id);
+            CREATE UNIQUE INDEX IF NOT EXISTS bookings_one_pending
+                ON bookings (user_id) WHERE status = 'Pending';
+            CREATE TABLE IF NOT EXISTS registration_queue (
+                phone_key TEXT PRIMARY KEY,
+                phone_number TEXT NOT NULL,
+                car_plate_no TEXT NOT NULL,
+                reply_to TEXT,
+                queued_at REAL NOT NULL,
+                claimed_until REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS registration_queue_age
+                ON registration_queue (queued_at);
+            """
+        )
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or time.monotonic() >= entry[0]:
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def _cache_put(self, user):
+        expires = time.monotonic() + self.cache_ttl
+        with self._cache_lock:
+            for key in (("id", user["user_id"]), ("phone", user["phone_number"])):
+                self._cache[key] = (expires, user)
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, user):
+        with self._cache_lock:
+            self._cache.pop(("id", user["user_id"]), None)
+            self._cache.pop(("phone", user["phone_number"]), None)
+
+    def _lookup(self, key, query, value):
+        user = self._cache_get(key)
+        if user is not None:
+            return user
+        row = self._connection().execute(query, (value,)).fetchone()
+        if row is None:
+            return None
+        user = dict(row)
+        self._cache_put(user)
+        return user
+
+    def register(self, phone_number, car_plate_no):
+        """
+        Add a user, or update the plate of the user already holding the number.
+
+        Returns:
+            tuple: (user dict, True if the user is new)
+        """
+        phone = normalise_phone(phone_number)
+
+        def work(conn):
+            row = conn.execute(
+                "SELECT user_id FROM users WHERE phone_number = ?", (phone,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE users SET car_plate_no = ?, plate_key = ? WHERE user_id = ?",
+                    (car_plate_no, normalise_plate(car_plate_no), row["user_id"]),
+                )
+                user_id, created = row["user_id"], False
+            else:
+                cursor = conn.execute(
+                    "INSERT INTO users (phone_number, car_plate_no, plate_key, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (phone, car_plate_no, normalise_plate(car_plate_no), time.time()),
+                )
+                user_id, created = cursor.lastrowid, True
+            user = dict(
+                conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            )
+            return user, created
+
+        user, created = self._transaction(work)
+        self._cache_drop(user)
+        self._cache_put(user)
+        return user, created
+
+    def get(self, user_id):
+        """The user with an ID, as a dict, or None."""
+        return self._lookup(("id", user_id), "SELECT * FROM users WHERE user_id = ?", user_id)
+
+    def find_by_phone(self, phone_number):
+        """The user registered with a phone number in any format, or None."""
+        phone = normalise_phone(phone_number)
+        return self._lookup(
+            ("phone", phone), "SELECT * FROM users WHERE phone_number = ?", phone
+        )
+
+    def find_by_plate(self, car_plate_no):
+        """Users registered with a plate number, in any spacing or case."""
+        rows = self._connection().execute(
+            "SELECT * FROM users WHERE plate_key = ? ORDER BY user_id",
+            (normalise_plate(car_plate_no),),
+        )
+        return [dict(row) for row in rows]
+
+    def open_booking(self, user_id, payment_option):
+        """
+        Start a pending booking, or change the payment option of the open one.
+
+        Returns:
+            dict: The pending booking.
+        """
+
+        def work(conn):
+            now = time.time()
+            row = conn.execute(
+                "SELECT booking_id FROM bookings WHERE user_id = ? AND status = ?",
+                (user_id, PENDING),
+            ).fetchone()
+            if row is not None:
+                booking_id = row["booking_id"]
+                conn.execute(
+                    "UPDATE bookings SET payment_option = ?, updated_at = ? WHERE booking_id = ?",
+                    (payment_option, now, booking_id),
+                )
+            else:
+                booking_id = conn.execute(
+                    "INSERT INTO bookings (user_id, payment_option, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (user_id, payment_option, PENDING, now, now),
+                ).lastrowid
+            return dict(
+                conn.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+            )
+
+        return self._transaction(work)
+
+    def latest_booking(self, user_id):
+        """The user's most recent booking, as a dict, or None."""
+        row = self._connection().execute(
+            "SELECT * FROM bookings WHERE user_id = ? ORDER BY booking_id DESC LIMIT 1",
+            (user_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def transition_booking(self, user_id, new_status):
+        """
+        Move the user's most recent booking to `new_status`.
+
+        Returns:
+            dict or None: The updated booking, or None if the user has none.
+
+        Raises:
+            BookingError: If the booking's current status does not allow it.
+        """
+
+        def work(conn):
+            row = conn.execute(
+                "SELECT * FROM bookings WHERE user_id = ? ORDER BY booking_id DESC LIMIT 1",
+                (user_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            if new_status not in BOOKING_TRANSITIONS[row["status"]]:
+                raise BookingError(f"Booking is already {row['status'].lower()}")
+            conn.execute(
+                "UPDATE bookings SET status = ?, updated_at = ? WHERE booking_id = ?",
+                (new_status, time.time(), row["booking_id"]),
+            )
+            return dict(row, status=new_status)
+
+        return self._transaction(work)
+
+    def queue_registration(self, phone_number, car_plate_no, reply_to, limit):
+        """
+        Hold a registration for replay, replacing any queued for the same number.
+
+        Returns:
+            list: Phone numbers of the oldest registrations dropped to keep
+            the queue within `limit`.
+        """
+
+        def work(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO registration_queue "
+                "(phone_key, phone_number, car_plate_no, reply_to, queued_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (normalise_phone(phone_number), phone_number, car_plate_no, reply_to, time.time()),
+            )
+            dropped = conn.execute(
+                "SELECT phone_key, phone_number FROM registration_queue "
+                "ORDER BY queued_at DESC LIMIT -1 OFFSET ?",
+                (limit,),
+            ).fetchall()
+            conn.executemany(
+                "DELETE FROM registration_queue WHERE phone_key = ?",
+                [(row["phone_key"],) for row in dropped],
+            )
+            return [row["phone_number"] for row in dropped]
+
+        return self._transaction(work)
+
+    def claim_queued_registration(self, lease):
+        """
+        Claim the oldest queued registration nobody else holds, for `lease` seconds.
+
+        Returns:
+            dict or None: The claimed registration.
+        """
+
+        def work(conn):
+            now = time.time()
+            row = conn.execute(
+                "SELECT * FROM registration_queue WHERE claimed_until <= ? "
+                "ORDER BY queued_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE registration_queue SET claimed_until = ? WHERE phone_key = ?",
+                (now + lease, row["phone_key"]),
+            )
+            return dict(row)
+
+        return self._transaction(work)
+
+    def release_queued_registration(self, entry):
+        """Give a claimed registration back to the queue, to be tried again."""
+        self._connection().execute(
+            "UPDATE registration_queue SET claimed_until = 0 "
+            "WHERE phone_key = ? AND queued_at = ?",
+            (entry["phone_key"], entry["queued_at"]),
+        )
+
+    def remove_queued_registration(self, entry):
+        """Drop a replayed registration, unless a newer one replaced it meanwhile."""
+        self._connection().execute(
+            "DELETE FROM registration_queue WHERE phone_key = ? AND queued_at = ?",
+            (entry["phone_key"], entry["queued_at"]),
+        )
+
+    def queued_registrations(self):
+        """Number of registrations waiting for replay."""
+        return self._connection().execute("SELECT COUNT(*) FROM registration_queue").fetchone()[0]
+
+    def stats(self):
+        conn = self._connection()
+        with self._cache_lock:
+            lookups = self._hits + self._misses
+            cache = {
+                "cached": len(self._cache),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+        bookings = dict(
+            conn.execute("SELECT status, COUNT(*) FROM bookings GROUP BY status").fetchall()
+        )
+        return {
+            "users": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+            "bookings": bookings,
+            "cache": cache,
+        }
+
+
+# Shared store used by the tools
+user_store = UserStore()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+VECTOR_STORE_UPLOAD_WORKERS = int(os.getenv("VECTOR_STORE_UPLOAD_WORKERS", "4"))
+
+
+def content_hash(path):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json_atomic(file_path, data):
+    """Write JSON to a temp file and rename it over the target in one step."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _upload_file(client, path):
+    with open(path, "rb") as stream:
+        uploaded = client.files.create(file=stream, purpose="assistants")
+    logging.info(f"Uploaded {path} as file {uploaded.id}")
+    return uploaded.id
+
+
+def _remove_file(client, vector_store_id, file_id):
+    try:
+        client.beta.vector_stores.files.delete(file_id, vector_store_id=vector_store_id)
+    except Exception as e:
+        logging.warning(f"Could not detach file {file_id} from vector store: {e}")
+    try:
+        client.files.delete(file_id)
+        logging.info(f"Deleted stale file {file_id}")
+    except Exception as e:
+        logging.warning(f"Could not delete file {file_id}: {e}")
+
+
+def _legacy_file_ids(client, vector_store_id):
+    """IDs of every file in a store whose metadata predates per-file tracking."""
+    return [f.id for f in client.beta.vector_stores.files.list(vector_store_id)]
+
+
+def sync_vector_store(client, file_paths, vector_store_name, metadata):
+    """
+    Bring a vector store in line with `file_paths` using content hashes.
+
+    Only new or edited files are uploaded (in parallel) and attached in one
+    batch; files that were edited or removed are detached and deleted.
+
+    Args:
+        client: OpenAI client
+        file_paths: Paths of the knowledge files that should be in the store
+        vector_store_name: Name of the vector store
+        metadata: Previously saved metadata, or None
+
+    Returns:
+        dict: Updated metadata, ready to be saved.
+    """
+    metadata = metadata or {}
+    tracked = metadata.get("files")
+    stale_ids = []
+
+    vector_store_id = metadata.get("vector_store_id")
+    if not vector_store_id or metadata.get("vector_store_name") != vector_store_name:
+        logging.info(f"Creating vector store: {vector_store_name}")
+        vector_store_id = client.beta.vector_stores.create(name=vector_store_name).id
+        logging.info(f"Vector store created with ID: {vector_store_id}")
+        tracked = {}
+    elif tracked is None:
+        # Metadata written before content hashes were tracked: re-upload the
+        # current files once and clear out whatever the store held before
+        stale_ids.extend(_legacy_file_ids(client, vector_store_id))
+        tracked = {}
+
+    hashes = {path: content_hash(path) for path in file_paths}
+    to_upload = [p for p in file_paths if tracked.get(p, {}).get("hash") != hashes[p]]
+    for path, entry in tracked.items():
+        if path not in hashes or path in to_upload:
+            stale_ids.append(entry["file_id"])
+
+    if not to_upload and not stale_ids:
+        logging.info(f"Vector store '{vector_store_name}' is up to date.")
+        return metadata
+
+    files = {p: e for p, e in tracked.items() if p in hashes and p not in to_upload}
+    file_counts = metadata.get("file_counts", {})
+    batch_status = metadata.get("file_batch_status")
+
+    with ThreadPoolExecutor(max_workers=VECTOR_STORE_UPLOAD_WORKERS) as pool:
+        if to_upload:
+            logging.info(f"Uploading {len(to_upload)} changed files to '{vector_store_name}'")
+            file_ids = list(pool.map(lambda p: _upload_file(client, p), to_upload))
+            file_batch = client.beta.vector_stores.file_batches.create_and_poll(
+                vector_store_id, file_ids=file_ids
+            )
+            batch_status = file_batch.status
+            if hasattr(file_batch, "file_counts"):
+                file_counts = {
+                    "processed_files": getattr(file_batch.file_counts, "completed", None),
+                    "failed_files": getattr(file_batch.file_counts, "failed", None),
+                    "pending_files": getattr(file_batch.file_counts, "in_progress", None),
+                }
+            for path, file_id in zip(to_upload, file_ids):
+                files[path] = {"hash": hashes[path], "file_id": file_id}
+            logging.info(f"File batch upload completed with status: {batch_status}")
+
+        if stale_ids:
+            list(pool.map(lambda f: _remove_file(client, vector_store_id, f), stale_ids))
+
+    return {
+        "vector_store_name": vector_store_name,
+        "vector_store_id": vector_store_id,
+        "file_batch_status": batch_status,
+        "file_counts": file_counts,
+        "uploaded_files": list(file_paths),
+        "files": files,
+    }
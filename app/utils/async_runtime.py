@@ -0,0 +1,66 @@
+import asyncio
+import os
+import threading
+
+
+class AsyncRuntime:
+    """
+    The event loop the message pipeline runs on, one per process.
+
+    The loop is started on a daemon thread on first use. A conversation
+    running on it holds no thread while it waits for OpenAI or the Graph API,
+    so one loop carries thousands of them at once. The ASGI app schedules
+    conversations here directly; sync callers (the Flask worker pool, tool
+    threads, the registration replayer) go through `run`, which is what the
+    blocking wrappers around the async pipeline functions call.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        # Checked against the pid so a forked child starts its own loop
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(
+                        target=loop.run_forever, name="async-runtime", daemon=True
+                    ).start()
+                    self._loop, self._pid = loop, os.getpid()
+        return self._loop
+
+    def in_loop(self):
+        """Whether the caller is running on the runtime's loop."""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """Run a plain callback on the loop thread."""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine on the loop and block until it finishes.
+
+        Raises:
+            RuntimeError: If called from the loop itself, where blocking would
+                deadlock; await the coroutine there instead.
+        """
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("Blocking call made on the async runtime's own loop")
+        return self.submit(coro).result(timeout)
+
+
+# Shared runtime for the whole process
+async_runtime = AsyncRuntime()
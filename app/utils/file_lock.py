@@ -0,0 +1,33 @@
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to no cross-process locking
+    fcntl = None
+
+
+class FileLock:
+    """
+    Exclusive lock on a file, shared by every process on the host.
+
+    Used so that only one gunicorn worker at a time performs one-off startup
+    work; the others block until it is done and then find the results on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            logging.warning("fcntl unavailable, startup lock is process-local only")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
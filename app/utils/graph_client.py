@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+import httpx
+import requests
+import urllib3
+from dotenv import load_dotenv
+from .async_runtime import async_runtime
+
+load_dotenv()
+GRAPH_API_BASE_URL = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com")
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "20"))
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "3.05"))
+GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "10"))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "3"))
+GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", "0.5"))
+GRAPH_BACKOFF_MAX = float(os.getenv("GRAPH_BACKOFF_MAX", "8"))
+
+# Status codes that are worth retrying (rate limiting and server errors)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# A 500/502/504 may come back after the request was acted on, so a request
+# that must not run twice (sending a message) is only retried on these
+NON_IDEMPOTENT_RETRYABLE_STATUS_CODES = {429, 503}
+
+
+def is_connect_error(error):
+    """Whether a requests or httpx error happened before the request reached the server."""
+    if isinstance(
+        error,
+        (
+            requests.exceptions.ConnectTimeout,
+            httpx.ConnectError,
+            httpx.ConnectTimeout,
+            httpx.PoolTimeout,
+        ),
+    ):
+        return True
+    # A dropped connection mid-response is also a ConnectionError, but by then
+    # the server may already have the request
+    return isinstance(error, requests.exceptions.ConnectionError) and not isinstance(
+        error.args[0] if error.args else None, urllib3.exceptions.ProtocolError
+    )
+
+
+def retry_delay(attempt, response=None):
+    """Work out how long to wait before the next attempt."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), GRAPH_BACKOFF_MAX)
+            except ValueError:
+                pass
+    delay = min(GRAPH_BACKOFF_BASE * (2**attempt), GRAPH_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def latency_percentiles(latencies):
+    """Return p50/p99 of a sequence of call durations in milliseconds."""
+    samples = sorted(latencies)
+    if not samples:
+        return {"calls": 0, "p50_ms": 0.0, "p99_ms": 0.0}
+
+    def percentile(p):
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return round(samples[index] * 1000, 2)
+
+    return {"calls": len(samples), "p50_ms": percentile(50), "p99_ms": percentile(99)}
+
+
+class GraphApiClient:
+    """
+    Shared client for the WhatsApp Cloud (Graph) API.
+
+    Built on httpx.AsyncClient running on the async runtime, so a call waiting
+    on Meta holds no thread. Keeps a pool of keep-alive connections to
+    graph.facebook.com, applies a timeout to every call and retries 429/5xx
+    responses with exponential backoff, honouring the Retry-After header when
+    Meta sends one. Message sends are not idempotent, so they are only retried
+    when the request never reached Meta (connection errors) or was refused
+    outright (429/503); a read timeout or other 5xx could otherwise deliver
+    the reply twice. `post`, `send_message` and `warm_up` are blocking
+    wrappers for callers outside the event loop.
+    """
+
+    def __init__(
+        self,
+        base_url=GRAPH_API_BASE_URL,
+        pool_size=GRAPH_POOL_SIZE,
+        timeout=(GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT),
+        max_retries=GRAPH_MAX_RETRIES,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.reload_credentials()
+        self._client = None
+
+        # Recent call durations, used for the p50/p99 latency stats
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def reload_credentials(self):
+        """Build the messages URL and auth headers once from the environment."""
+        self.messages_url = (
+            f"{self.base_url}/{os.getenv('VERSION')}/{os.getenv('PHONE_NUMBER_ID')}/messages"
+        )
+        self.headers = {
+            "Authorization": f"Bearer {os.getenv('ACCESS_TOKEN')}",
+            "Content-Type": "application/json",
+        }
+
+    @property
+    def client(self):
+        # Created on first use, on the runtime's loop, which it is bound to
+        if self._client is None:
+            connect_timeout, read_timeout = self.timeout
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                # Extra connections beyond the pool are opened when needed
+                # and closed afterwards, rather than waited for
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size),
+            )
+        return self._client
+
+    async def warm_up_async(self):
+        """
+        Open a connection to the Graph API ahead of the first real message so
+        the TCP and TLS handshakes are not paid on the request path.
+        """
+        try:
+            await self.client.head(self.base_url)
+            logging.info("Graph API connection pool warmed up")
+        except httpx.HTTPError as e:
+            logging.warning(f"Graph API warm-up failed: {e}")
+
+    def warm_up(self):
+        """Blocking version of `warm_up_async`."""
+        async_runtime.run(self.warm_up_async())
+
+    async def post_async(self, url, payload, timeout=None, idempotent=True):
+        """
+        POST a JSON payload to the Graph API, retrying transient failures.
+
+        Args:
+            url: Full Graph API URL
+            payload: JSON-serialisable request body
+            timeout: Optional (connect, read) timeout overriding the default
+            idempotent: False for requests that must not be applied twice;
+                they are retried only on connection errors and 429/503
+
+        Returns:
+            httpx.Response or None if the request could not be sent at all.
+        """
+        connect_timeout, read_timeout = timeout or self.timeout
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        retryable = (
+            RETRYABLE_STATUS_CODES if idempotent else NON_IDEMPOTENT_RETRYABLE_STATUS_CODES
+        )
+        response = None
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await self.client.post(
+                    url, headers=self.headers, json=payload, timeout=timeout
+                )
+            except httpx.HTTPError as e:
+                self._record_latency(time.perf_counter() - started)
+                if attempt == self.max_retries or not (idempotent or is_connect_error(e)):
+                    logging.error(f"Graph API request failed: {e}")
+                    return None
+                delay = retry_delay(attempt)
+                logging.warning(
+                    f"Graph API request error ({e}), retrying in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            self._record_latency(time.perf_counter() - started)
+            if response.status_code not in retryable or attempt == self.max_retries:
+                return response
+
+            delay = retry_delay(attempt, response)
+            logging.warning(
+                f"Graph API returned {response.status_code}, retrying in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+        return response
+
+    def post(self, url, payload, timeout=None, idempotent=True):
+        """Blocking version of `post_async`."""
+        return async_runtime.run(self.post_async(url, payload, timeout, idempotent))
+
+    async def send_message_async(self, payload, timeout=None):
+        """POST a payload to the phone number's /messages endpoint, without risking a duplicate send."""
+        return await self.post_async(self.messages_url, payload, timeout=timeout, idempotent=False)
+
+    def send_message(self, payload, timeout=None):
+        """Blocking version of `send_message_async`."""
+        return async_runtime.run(self.send_message_async(payload, timeout))
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def stats(self):
+        """Return p50/p99 latency of recent outbound calls in milliseconds."""
+        with self._lock:
+            return latency_percentiles(self._latencies)
+
+
+# Shared client used by all send_* helpers
+graph_client = GraphApiClient()
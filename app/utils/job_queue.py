@@ -0,0 +1,149 @@
+import logging
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "8"))
+JOB_QUEUE_MAXSIZE = int(os.getenv("JOB_QUEUE_MAXSIZE", "1000"))
+
+
+class JobQueue:
+    """
+    In-process job queue backed by a fixed pool of worker threads.
+
+    The webhook handler enqueues work and returns immediately; the workers pick
+    jobs up in FIFO order. Queue depth, wait time and worker utilisation are
+    tracked so the pool can be sized from real traffic.
+    """
+
+    def __init__(self, num_workers=WORKER_POOL_SIZE, maxsize=JOB_QUEUE_MAXSIZE):
+        self.num_workers = num_workers
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._started_at = None
+
+        # Counters used for the stats endpoint
+        self._busy_workers = 0
+        self._busy_seconds = 0.0
+        self._enqueued = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def start(self):
+        """Start the worker threads. Calling it more than once is a no-op."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._started_at = time.monotonic()
+            for i in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop, name=f"job-worker-{i}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        logging.info(f"Job queue started with {self.num_workers} workers")
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Enqueue a job without blocking.
+
+        Args:
+            func: Callable to run on a worker thread
+            *args, **kwargs: Arguments passed to the callable
+
+        Returns:
+            bool: True if the job was queued, False if the queue is full.
+        """
+        if not self._started:
+            self.start()
+        try:
+            self._queue.put_nowait((time.monotonic(), func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            logging.error("Job queue is full, rejecting job")
+            return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def _worker_loop(self):
+        while True:
+            enqueued_at, func, args, kwargs = self._queue.get()
+            started = time.monotonic()
+            wait = started - enqueued_at
+            with self._lock:
+                self._busy_workers += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                func(*args, **kwargs)
+                failed = False
+            except Exception as e:
+                failed = True
+                logging.error(f"Unhandled error in background job: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self._busy_workers -= 1
+                    self._busy_seconds += elapsed
+                    if failed:
+                        self._failed += 1
+                    else:
+                        self._completed += 1
+                self._queue.task_done()
+
+    def drain(self, timeout=None):
+        """
+        Wait until every queued and running job has finished.
+
+        Jobs that resubmit follow-up work (like lane drains) are waited for
+        too, since the follow-up is queued before the parent job completes.
+
+        Returns:
+            bool: True if the queue emptied, False if `timeout` ran out first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        """Return a snapshot of queue depth, wait time and worker utilisation."""
+        with self._lock:
+            uptime = time.monotonic() - self._started_at if self._started else 0.0
+            processed = self._completed + self._failed
+            capacity = uptime * self.num_workers
+            return {
+                "workers": self.num_workers,
+                "busy_workers": self._busy_workers,
+                "queue_depth": self._queue.qsize(),
+                "enqueued": self._enqueued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / processed * 1000, 2)
+                if processed
+                else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "utilisation": round(self._busy_seconds / capacity, 4)
+                if capacity
+                else 0.0,
+            }
+
+
+# Shared queue used by the webhook views
+job_queue = JobQueue()
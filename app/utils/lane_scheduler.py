@@ -0,0 +1,228 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+from dotenv import load_dotenv
+from app.utils.async_runtime import async_runtime
+from app.utils.job_queue import job_queue
+
+load_dotenv()
+# How long a lane left without a drain job waits before asking the queue again
+LANE_RETRY_SECONDS = float(os.getenv("LANE_RETRY_SECONDS", "0.5"))
+# Conversations processed at once on the event loop when served by app.asgi
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "5000"))
+# Accepted messages not yet finished before the webhook answers 503
+ASYNC_MAX_PENDING = int(os.getenv("ASYNC_MAX_PENDING", "50000"))
+
+
+class LaneScheduler:
+    """
+    Run jobs in ordered per-key lanes on top of the shared job queue.
+
+    Jobs with the same key (a user's wa_id) run strictly one at a time, in
+    order of their sort key (the webhook timestamp), so two messages from one
+    user never race on the same OpenAI thread. Different keys run in parallel
+    across the worker pool. A lane runs one job per pool slot and then yields,
+    so a chatty user cannot starve everyone else. Jobs only ever run on the
+    pool: a lane the full queue refused is handed to a retry timer rather
+    than drained on the submitting (webhook) thread.
+    """
+
+    def __init__(self, queue=job_queue, retry_seconds=LANE_RETRY_SECONDS):
+        self._queue = queue
+        self.retry_seconds = retry_seconds
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    def submit(self, key, sort_key, func, *args, **kwargs):
+        """
+        Add a job to the lane for `key`.
+
+        Args:
+            key: Lane key, e.g. the sender's wa_id
+            sort_key: Value the lane is ordered by, e.g. the message timestamp
+            func: Callable to run
+            *args, **kwargs: Arguments passed to the callable
+
+        Returns:
+            bool: False if the lane had to be started and the queue is full.
+        """
+        item = (sort_key, next(self._sequence), func, args, kwargs)
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is not None:
+                # The lane is already scheduled; its drain job will pick this up
+                heapq.heappush(lane, item)
+                return True
+            self._lanes[key] = [item]
+
+        if self._queue.submit(self._run_next, key):
+            return True
+
+        with self._lock:
+            lane = self._lanes[key]
+            lane.remove(item)
+            heapq.heapify(lane)
+            if not lane:
+                del self._lanes[key]
+                return False
+        # Another message joined the lane while we were rejected; its submit
+        # succeeded, so keep asking the queue for it instead of stranding it
+        self._retry_later(key)
+        return False
+
+    def _retry_later(self, key):
+        timer = threading.Timer(self.retry_seconds, self._retry, args=(key,))
+        timer.daemon = True
+        timer.start()
+
+    def _retry(self, key):
+        if not self._queue.submit(self._run_next, key):
+            self._retry_later(key)
+
+    def _run_next(self, key):
+        while True:
+            with self._lock:
+                _, _, func, args, kwargs = heapq.heappop(self._lanes[key])
+
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                logging.error(f"Unhandled error in lane '{key}': {e}")
+
+            with self._lock:
+                if not self._lanes[key]:
+                    del self._lanes[key]
+                    return
+
+            # Yield the worker and reschedule the rest of the lane; if the queue
+            # is full keep draining here so queued messages are never dropped
+            if self._queue.submit(self._run_next, key):
+                return
+
+    def stats(self):
+        """Return the number of active lanes and jobs waiting in them."""
+        with self._lock:
+            return {
+                "active_lanes": len(self._lanes),
+                "pending_jobs": sum(len(lane) for lane in self._lanes.values()),
+            }
+
+
+class AsyncLaneScheduler:
+    """
+    LaneScheduler for coroutines: ordered per-key lanes on the async runtime.
+
+    Same ordering guarantee as LaneScheduler, but a lane is a task on the
+    runtime's event loop instead of a job on the worker pool, so a
+    conversation waiting on OpenAI or the Graph API holds no thread and up to
+    ASYNC_MAX_IN_FLIGHT of them run at once. `submit` is thread-safe; once
+    ASYNC_MAX_PENDING messages are waiting or running it refuses new ones.
+    """
+
+    def __init__(
+        self,
+        runtime=async_runtime,
+        max_in_flight=ASYNC_MAX_IN_FLIGHT,
+        max_pending=ASYNC_MAX_PENDING,
+    ):
+        self._runtime = runtime
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._semaphore = None
+        self._tasks = set()
+
+    def submit(self, key, sort_key, coro_func, *args):
+        """
+        Add a coroutine call to the lane for `key`.
+
+        Args:
+            key: Lane key, e.g. the sender's wa_id
+            sort_key: Value the lane is ordered by, e.g. the message timestamp
+            coro_func: Coroutine function to run
+            *args: Arguments passed to it
+
+        Returns:
+            bool: False if ASYNC_MAX_PENDING messages are already accepted.
+        """
+        item = (sort_key, next(self._sequence), coro_func, args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            lane = self._lanes.get(key)
+            if lane is not None:
+                # The lane's task is running; it will pick this up
+                heapq.heappush(lane, item)
+                return True
+            self._lanes[key] = [item]
+        self._runtime.call_soon(self._start, key)
+        return True
+
+    def _start(self, key):
+        task = asyncio.get_running_loop().create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        while True:
+            with self._lock:
+                _, _, coro_func, args = heapq.heappop(self._lanes[key])
+
+            # Held per message, so a chatty user's lane waits its turn again
+            async with self._semaphore:
+                try:
+                    await coro_func(*args)
+                except Exception as e:
+                    logging.error(f"Unhandled error in lane '{key}': {e}")
+
+            with self._lock:
+                self._pending -= 1
+                if not self._lanes[key]:
+                    del self._lanes[key]
+                    return
+
+    async def drain(self, timeout=None):
+        """
+        Wait for every accepted message to finish; run on the runtime's loop.
+
+        Returns:
+            bool: False if some were still pending after `timeout` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self._pending:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self._tasks:
+                await asyncio.wait(list(self._tasks), timeout=remaining)
+            else:
+                # Lanes submitted from another thread have not started yet
+                await asyncio.sleep(0.01)
+        return True
+
+    def stats(self):
+        """Return the number of active lanes and messages queued or running in them."""
+        with self._lock:
+            queued = sum(len(lane) for lane in self._lanes.values())
+            return {
+                "active_lanes": len(self._lanes),
+                "pending_jobs": queued,
+                "in_flight": self._pending - queued,
+            }
+
+
+# Shared schedulers keyed by wa_id: on the worker pool (Flask), and on the
+# event loop (app.asgi)
+lane_scheduler = LaneScheduler()
+async_lane_scheduler = AsyncLaneScheduler()
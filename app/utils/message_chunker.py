@@ -0,0 +1,109 @@
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+# WhatsApp rejects text messages longer than this
+WHATSAPP_MAX_MESSAGE_CHARS = 4096
+# The first chunk is cut early so the user sees something quickly; later
+# chunks are larger so a long answer does not turn into dozens of messages
+STREAM_FIRST_CHUNK_CHARS = int(os.getenv("STREAM_FIRST_CHUNK_CHARS", "80"))
+STREAM_CHUNK_CHARS = int(os.getenv("STREAM_CHUNK_CHARS", "400"))
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?:;])\s+|\n")
+
+
+class MessageChunker:
+    """
+    Cut a stream of LLM text deltas into WhatsApp-sized messages.
+
+    Text is buffered until it is long enough, then cut at the last paragraph
+    break, or failing that the last sentence break, and handed to `send`.
+    Cuts never leave an unclosed citation marker (【...】) or bold marker
+    (**) behind, and no chunk exceeds the WhatsApp message limit.
+    """
+
+    def __init__(
+        self,
+        send,
+        first_chunk_chars=STREAM_FIRST_CHUNK_CHARS,
+        chunk_chars=STREAM_CHUNK_CHARS,
+        max_chars=WHATSAPP_MAX_MESSAGE_CHARS,
+    ):
+        self.send = send
+        self.first_chunk_chars = first_chunk_chars
+        self.chunk_chars = chunk_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.chunks_sent = 0
+        # Everything fed so far, sent or still buffered
+        self.streamed = ""
+
+    @property
+    def _min_chars(self):
+        return self.first_chunk_chars if self.chunks_sent == 0 else self.chunk_chars
+
+    @staticmethod
+    def _is_balanced(text):
+        return text.count("【") == text.count("】") and text.count("**") % 2 == 0
+
+    def _find_cut(self):
+        """Return the index to cut the buffer at, or None to keep buffering."""
+        window = self.buffer[: self.max_chars]
+        for pattern in (PARAGRAPH_BREAK, SENTENCE_BREAK):
+            cuts = [m.end() for m in pattern.finditer(window) if m.start() >= self._min_chars]
+            for cut in reversed(cuts):
+                if self._is_balanced(window[:cut]):
+                    return cut
+
+        if len(self.buffer) >= self.max_chars:
+            # No natural break within the limit: cut at the last whitespace
+            cut = window.rfind(" ")
+            return cut if cut > 0 else self.max_chars
+        return None
+
+    def _emit(self, text):
+        text = text.strip()
+        if text:
+            self.send(text)
+            self.chunks_sent += 1
+
+    def feed(self, delta):
+        """Add a text delta and send any chunks that are ready."""
+        self.streamed += delta
+        self.buffer += delta
+        while len(self.buffer) >= self._min_chars:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            chunk, self.buffer = self.buffer[:cut], self.buffer[cut:]
+            self._emit(chunk)
+
+    def flush(self):
+        """Send whatever is left in the buffer, split at the size limit."""
+        while len(self.buffer) > self.max_chars:
+            window = self.buffer[: self.max_chars]
+            cut = window.rfind(" ")
+            cut = cut if cut > 0 else self.max_chars
+            chunk, self.buffer = self.buffer[:cut], self.buffer[cut:]
+            self._emit(chunk)
+        chunk, self.buffer = self.buffer, ""
+        self._emit(chunk)
+
+    def finish(self, reply):
+        """
+        Send the part of the final reply that has not been sent yet.
+
+        The stream can break part-way and the full reply be fetched another
+        way (e.g. by polling the run), so only what follows the streamed text
+        is sent. Returns False, sending nothing, if `reply` does not continue
+        the streamed text (an error reply, or an answer regenerated from
+        scratch); the caller should then send it whole.
+        """
+        if not reply.startswith(self.streamed):
+            self.buffer = ""
+            return False
+        self.feed(reply[len(self.streamed):])
+        self.flush()
+        return True
@@ -0,0 +1,157 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "50000"))
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", str(24 * 60 * 60)))
+# Leave empty to keep the dedup store in memory only
+DEDUP_DB_FILE = os.getenv("DEDUP_DB_FILE", "")
+
+
+class MessageDeduplicator:
+    """
+    Bounded store of inbound WhatsApp message IDs that have already been seen.
+
+    Meta redelivers a webhook whenever our response is slow, so the same
+    message ID can arrive several times. Entries are kept in an ordered dict,
+    oldest first, with a TTL and a size cap; when a database file is
+    configured, IDs are also written to SQLite so redeliveries are caught
+    across restarts and worker processes. The table is purged of expired
+    rows, and trimmed to the same size cap, every tenth of the TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries=DEDUP_MAX_ENTRIES,
+        ttl_seconds=DEDUP_TTL_SECONDS,
+        db_file=DEDUP_DB_FILE,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._purge_interval = max(ttl_seconds / 10, 1)
+        self._next_purge = 0.0
+
+        self._db = None
+        if db_file:
+            self._db = sqlite3.connect(db_file, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen_messages "
+                "(message_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS seen_messages_age ON seen_messages (seen_at)"
+            )
+            self._db.commit()
+            self._purge_db(time.time())
+
+    def _evict(self, now):
+        # Entries are never reordered, so the oldest sit at the front and
+        # expired ones can be dropped from there
+        while self._seen:
+            message_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl_seconds and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def _purge_db(self, now):
+        self._next_purge = now + self._purge_interval
+        try:
+            self._db.execute(
+                "DELETE FROM seen_messages WHERE seen_at < ? OR message_id IN ("
+                "SELECT message_id FROM seen_messages "
+                "ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl_seconds, self.max_entries),
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Dedup store purge failed: {e}")
+
+    def _claim_in_db(self, message_id, now):
+        """Record the ID in SQLite; returns False if another worker already did."""
+        try:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO seen_messages (message_id, seen_at) VALUES (?, ?)",
+                (message_id, now),
+            )
+            self._db.commit()
+            if cursor.rowcount:
+                return True
+            row = self._db.execute(
+                "SELECT seen_at FROM seen_messages WHERE message_id = ?", (message_id,)
+            ).fetchone()
+            if row and now - row[0] >= self.ttl_seconds:
+                # The stored entry has expired; treat it as a fresh message
+                self._db.execute(
+                    "UPDATE seen_messages SET seen_at = ? WHERE message_id = ?",
+                    (now, message_id),
+                )
+                self._db.commit()
+                return True
+            return False
+        except sqlite3.Error as e:
+            logging.error(f"Dedup store error, falling back to memory only: {e}")
+            return True
+
+    def is_duplicate(self, message_id):
+        """
+        Check a message ID and record it as seen.
+
+        Args:
+            message_id: The WhatsApp message ID (message["id"])
+
+        Returns:
+            bool: True if the ID was already seen within the TTL.
+        """
+        now = time.time()
+        with self._lock:
+            seen_at = self._seen.get(message_id)
+            if seen_at is not None and now - seen_at < self.ttl_seconds:
+                self._hits += 1
+                return True
+
+            duplicate = self._db is not None and not self._claim_in_db(message_id, now)
+            if self._db is not None and now >= self._next_purge:
+                self._purge_db(now)
+            self._seen[message_id] = now
+            self._seen.move_to_end(message_id)
+            self._evict(now)
+            if duplicate:
+                self._hits += 1
+            else:
+                self._misses += 1
+            return duplicate
+
+    def forget(self, message_id):
+        """Drop an ID again, e.g. when the message could not be queued."""
+        with self._lock:
+            self._seen.pop(message_id, None)
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM seen_messages WHERE message_id = ?", (message_id,)
+                )
+                self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters; every hit is an LLM call and reply saved."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._seen),
+                "duplicates_skipped": self._hits,
+                "unique_messages": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+            }
+
+
+# Shared store used by the webhook views
+message_dedup = MessageDeduplicator()
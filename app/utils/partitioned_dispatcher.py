@@ -0,0 +1,290 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+# Number of worker processes; 0 keeps everything in the web process
+SERVING_WORKERS = int(os.getenv("SERVING_WORKERS", "0"))
+SERVING_INBOX_MAXSIZE = int(os.getenv("SERVING_INBOX_MAXSIZE", "1000"))
+SERVING_DRAIN_TIMEOUT = float(os.getenv("SERVING_DRAIN_TIMEOUT", "60"))
+SERVING_SUPERVISE_INTERVAL = float(os.getenv("SERVING_SUPERVISE_INTERVAL", "1"))
+SERVING_RESTART_BACKOFF_MAX = float(os.getenv("SERVING_RESTART_BACKOFF_MAX", "30"))
+# A worker that dies sooner than this after starting is treated as crash-looping
+SERVING_MIN_HEALTHY_SECONDS = 10.0
+
+# Workers are started with "spawn" so they never inherit the front process's
+# threads, sockets or SQLite connections
+_mp = multiprocessing.get_context("spawn")
+
+
+def partition_for(wa_id, num_partitions):
+    """Stable partition of a wa_id, the same in every process and every run."""
+    return zlib.crc32(str(wa_id).encode("utf-8")) % num_partitions
+
+
+def _worker_main(index, inbox, taken, drain_timeout):
+    """
+    Entry point of a worker process.
+
+    Runs the usual thread pool and per-user lanes, fed from this worker's
+    inbox instead of the webhook, and counts every event it takes in `taken`
+    so the front process knows which ones it still holds. A None in the inbox
+    means shut down: stop taking events, finish everything already accepted,
+    then exit.
+    """
+    # Ctrl-C reaches the whole process group; the front process decides when
+    # workers stop, so they only react to the sentinel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from app.config import configure_logging
+    from app.services.openai_service import start_warm_up
+    from app.utils.graph_client import graph_client
+    from app.utils.job_queue import job_queue
+    from app.utils.lane_scheduler import lane_scheduler
+    from app.utils.whatsapp_utils import process_message_event
+
+    configure_logging()
+    job_queue.start()
+    threading.Thread(target=graph_client.warm_up, daemon=True).start()
+    start_warm_up()
+    logging.info(f"Serving worker {index} started (pid {os.getpid()})")
+
+    while True:
+        event = inbox.get()
+        if event is None:
+            break
+        with taken.get_lock():
+            taken.value += 1
+        timestamp = int(event["message"].get("timestamp", 0))
+        # The webhook was already acknowledged, so wait for room rather than drop
+        while not lane_scheduler.submit(
+            event["wa_id"], timestamp, process_message_event, event
+        ):
+            time.sleep(0.05)
+
+    logging.info(f"Serving worker {index} draining in-flight jobs")
+    if not job_queue.drain(timeout=drain_timeout):
+        logging.warning(f"Serving worker {index} exited with jobs still running")
+    logging.info(f"Serving worker {index} stopped")
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self._new_inbox()
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = 0.0
+        self.next_start = 0.0
+        self.dispatched = 0
+
+    def _new_inbox(self):
+        self.inbox = _mp.Queue(maxsize=SERVING_INBOX_MAXSIZE)
+        # Events put in the inbox that the worker has not taken yet: the
+        # worker counts what it takes, and the oldest `taken` here are done
+        self.taken = _mp.Value("q", 0)
+        self.unacked = deque()
+        self.acked = 0
+
+    def trim(self):
+        """Forget the events the worker has taken from its inbox."""
+        taken = self.taken.value
+        while self.acked < taken and self.unacked:
+            self.unacked.popleft()
+            self.acked += 1
+
+    def replace_inbox(self):
+        """
+        Swap in a fresh inbox holding every event the worker had not taken.
+
+        Returns:
+            int: Number of events moved.
+        """
+        self.trim()
+        old, events = self.inbox, list(self.unacked)
+        self._new_inbox()
+        # A worker that dies inside inbox.get() takes the queue's read lock
+        # with it, so the old queue is abandoned rather than read again
+        old.cancel_join_thread()
+        old.close()
+        for event in events:
+            self.inbox.put(event)
+            self.unacked.append(event)
+        return len(events)
+
+
+class PartitionedDispatcher:
+    """
+    Fan webhook events out to worker processes partitioned by wa_id.
+
+    Every message from a user lands in the same worker, so that user's lane,
+    OpenAI thread and caches stay hot in one process while the box's cores are
+    shared out across users. The front process only verifies, deduplicates
+    and forwards. A supervisor thread restarts crashed workers, backing off if
+    they crash-loop, and re-dispatches to the replacement every event the dead
+    worker had not yet taken from its inbox, from the front process's own
+    record of them.
+    """
+
+    def __init__(self, num_workers=SERVING_WORKERS, drain_timeout=SERVING_DRAIN_TIMEOUT):
+        self.num_workers = num_workers
+        self.drain_timeout = drain_timeout
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopping = threading.Event()
+        self._rejected = 0
+
+    @property
+    def enabled(self):
+        return self.num_workers > 0
+
+    def start(self):
+        """Start the worker processes and their supervisor. Idempotent."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._workers = [_Worker(i) for i in range(self.num_workers)]
+            for worker in self._workers:
+                self._spawn(worker)
+        threading.Thread(
+            target=self._supervise, name="serving-supervisor", daemon=True
+        ).start()
+        logging.info(f"Partitioned dispatcher started with {self.num_workers} workers")
+
+    def _spawn(self, worker):
+        worker.process = _mp.Process(
+            target=_worker_main,
+            args=(worker.index, worker.inbox, worker.taken, self.drain_timeout),
+            name=f"serving-worker-{worker.index}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+
+    def _supervise(self):
+        while not self._stopping.wait(SERVING_SUPERVISE_INTERVAL):
+            with self._lock:
+                for worker in self._workers:
+                    if self._stopping.is_set() or worker.process.is_alive():
+                        worker.trim()
+                        continue
+                    now = time.monotonic()
+                    if worker.next_start == 0.0:
+                        uptime = now - worker.started_at
+                        logging.error(
+                            f"Serving worker {worker.index} died with exit code "
+                            f"{worker.process.exitcode} after {uptime:.1f}s"
+                        )
+                        if uptime < SERVING_MIN_HEALTHY_SECONDS:
+                            worker.backoff = min(
+                                max(worker.backoff * 2, 1.0), SERVING_RESTART_BACKOFF_MAX
+                            )
+                        else:
+                            worker.backoff = 0.0
+                        worker.next_start = now + worker.backoff
+                    if now < worker.next_start:
+                        continue
+                    self._recover_inbox(worker)
+                    worker.process.close()
+                    worker.next_start = 0.0
+                    worker.restarts += 1
+                    self._spawn(worker)
+                    logging.info(
+                        f"Restarted serving worker {worker.index} "
+                        f"(restart #{worker.restarts})"
+                    )
+
+    @staticmethod
+    def _recover_inbox(worker):
+        moved = worker.replace_inbox()
+        if moved:
+            logging.info(f"Moved {moved} queued events to restarted worker {worker.index}")
+
+    def dispatch(self, event):
+        """
+        Queue an event for the worker that owns its wa_id, without blocking.
+
+        Returns:
+            bool: False if that worker's inbox is full or the dispatcher is stopping.
+        """
+        if not self._started:
+            self.start()
+        if self._stopping.is_set():
+            return False
+        worker = self._workers[partition_for(event["wa_id"], self.num_workers)]
+        # Held while queueing so a restart cannot swap the inbox mid-put
+        with self._lock:
+            worker.trim()
+            try:
+                worker.inbox.put_nowait(event)
+            except queue.Full:
+                self._rejected += 1
+                logging.error(f"Inbox of serving worker {worker.index} is full, rejecting event")
+                return False
+            worker.unacked.append(event)
+            worker.dispatched += 1
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Graceful shutdown: stop accepting events and let every worker finish
+        the events it already has, then exit. Workers still running after
+        `timeout` are terminated.
+        """
+        timeout = self.drain_timeout if timeout is None else timeout
+        with self._lock:
+            if not self._started or self._stopping.is_set():
+                return
+            self._stopping.set()
+            workers = list(self._workers)
+        logging.info("Draining serving workers")
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.inbox.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                logging.warning(f"Serving worker {worker.index} did not drain in time, terminating")
+                worker.process.terminate()
+                worker.process.join()
+        logging.info("Serving workers stopped")
+
+    def stats(self):
+        """Return per-worker liveness, restarts and inbox depth."""
+        with self._lock:
+            workers = []
+            for worker in self._workers:
+                try:
+                    depth = worker.inbox.qsize()
+                except NotImplementedError:  # macOS
+                    depth = None
+                workers.append(
+                    {
+                        "index": worker.index,
+                        "pid": worker.process.pid if worker.process else None,
+                        "alive": bool(worker.process and worker.process.is_alive()),
+                        "restarts": worker.restarts,
+                        "dispatched": worker.dispatched,
+                        "inbox_depth": depth,
+                        "not_taken": len(worker.unacked),
+                    }
+                )
+            return {
+                "workers": workers,
+                "rejected": self._rejected,
+                "stopping": self._stopping.is_set(),
+            }
+
+
+# Shared dispatcher used by the webhook views when SERVING_WORKERS > 0
+dispatcher = PartitionedDispatcher()
@@ -0,0 +1,345 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from app.services.user_store import user_store
+from .graph_client import (
+    NON_IDEMPOTENT_RETRYABLE_STATUS_CODES,
+    is_connect_error,
+    latency_percentiles,
+)
+
+load_dotenv()
+REGISTRATION_URL = os.getenv(
+    "REGISTRATION_URL", "https://9a83-197-250-226-222.ngrok-free.app/registration"
+)
+REGISTRATION_POOL_SIZE = int(os.getenv("REGISTRATION_POOL_SIZE", "10"))
+REGISTRATION_CONNECT_TIMEOUT = float(os.getenv("REGISTRATION_CONNECT_TIMEOUT", "3.05"))
+REGISTRATION_READ_TIMEOUT = float(os.getenv("REGISTRATION_READ_TIMEOUT", "5"))
+# Total time one registration may take, retries and backoff included
+REGISTRATION_TIMEOUT = float(os.getenv("REGISTRATION_TIMEOUT", "8"))
+REGISTRATION_MAX_RETRIES = int(os.getenv("REGISTRATION_MAX_RETRIES", "2"))
+REGISTRATION_BACKOFF_BASE = float(os.getenv("REGISTRATION_BACKOFF_BASE", "0.3"))
+REGISTRATION_BACKOFF_MAX = float(os.getenv("REGISTRATION_BACKOFF_MAX", "2"))
+# Consecutive failures that open the breaker, and how long it stays open
+REGISTRATION_BREAKER_FAILURES = int(os.getenv("REGISTRATION_BREAKER_FAILURES", "5"))
+REGISTRATION_BREAKER_RESET = float(os.getenv("REGISTRATION_BREAKER_RESET", "30"))
+# Registrations held for replay while the backend is down
+REGISTRATION_QUEUE_LIMIT = int(os.getenv("REGISTRATION_QUEUE_LIMIT", "1000"))
+# How often the replayer looks for registrations queued by other processes
+REGISTRATION_REPLAY_POLL_SECONDS = float(os.getenv("REGISTRATION_REPLAY_POLL_SECONDS", "5"))
+
+REGISTERED = "registered"
+REJECTED = "rejected"
+QUEUED = "queued"
+# The request reached the backend but no answer came back, so it may or may
+# not have been created; it is neither retried nor replayed
+UNKNOWN = "unknown"
+
+
+def jittered_delay(attempt, base=REGISTRATION_BACKOFF_BASE, cap=REGISTRATION_BACKOFF_MAX):
+    """Exponential backoff with full jitter, so queued retries do not arrive together."""
+    return random.uniform(0, min(cap, base * (2**attempt)))
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures.
+
+    While open, calls are refused without touching the network. After
+    `reset_timeout` one trial call is let through (half-open): success closes
+    the breaker, failure opens it again for another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold=REGISTRATION_BREAKER_FAILURES,
+        reset_timeout=REGISTRATION_BREAKER_RESET,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def allow(self):
+        """Whether a call may go out now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def retry_in(self):
+        """Seconds until the breaker lets a trial call through."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info("Registration backend recovered, circuit closed")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logging.error(
+                    f"Registration backend failing, circuit open for {self.reset_timeout}s"
+                )
+
+
+class RegistrationClient:
+    """
+    Client for the external registration backend.
+
+    Keeps a pool of keep-alive connections and bounds every registration by
+    REGISTRATION_TIMEOUT. A registration is not idempotent, so it is only
+    retried, with jittered backoff, when the backend cannot have acted on it:
+    connection errors and 429/503 responses. A read timeout or other 5xx
+    gives UNKNOWN instead. A circuit breaker stops calls while the backend is
+    down; registrations arriving then (or failing every retry) are queued in
+    `queue_store` (the SQLite user store), so they survive a restart, and are
+    replayed by a background thread once the breaker lets calls through again.
+    Each process's replayer claims a queued registration for a lease before
+    sending it, so two processes never replay the same one at once.
+    `on_replayed(phone_number, car_plate_no, outcome, details, reply_to)` is
+    called with each replayed result and the wa_id that asked for it.
+    """
+
+    def __init__(
+        self,
+        url=REGISTRATION_URL,
+        pool_size=REGISTRATION_POOL_SIZE,
+        connect_timeout=REGISTRATION_CONNECT_TIMEOUT,
+        read_timeout=REGISTRATION_READ_TIMEOUT,
+        total_timeout=REGISTRATION_TIMEOUT,
+        max_retries=REGISTRATION_MAX_RETRIES,
+        breaker=None,
+        queue_limit=REGISTRATION_QUEUE_LIMIT,
+        queue_store=user_store,
+        replay_poll=REGISTRATION_REPLAY_POLL_SECONDS,
+    ):
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.queue_limit = queue_limit
+        self.queue_store = queue_store
+        self.replay_poll = replay_poll
+        self.on_replayed = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._wakeup = threading.Condition()
+        self._replayer = None
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._counts = {
+            REGISTERED: 0,
+            REJECTED: 0,
+            QUEUED: 0,
+            UNKNOWN: 0,
+            "replayed": 0,
+            "dropped": 0,
+        }
+        # Registrations queued before a restart are replayed without waiting
+        # for a new one to arrive
+        if self.queue_store.queued_registrations():
+            self._start_replayer()
+
+    def register(self, phone_number, car_plate_no, reply_to=None):
+        """
+        Register a user with the backend.
+
+        Args:
+            phone_number: Phone number to register
+            car_plate_no: The user's plate number
+            reply_to: wa_id told about the result if the request is replayed
+
+        Returns:
+            tuple: (outcome, details) where outcome is REGISTERED (details is
+            the response body), REJECTED (details explains why), QUEUED (the
+            backend is unavailable; the request will be replayed) or UNKNOWN
+            (the backend did not answer; it may have registered the user).
+        """
+        outcome, details = self._send(phone_number, car_plate_no)
+        if outcome is None:
+            self._enqueue(phone_number, car_plate_no, reply_to)
+            outcome = QUEUED
+        self._count(outcome)
+        return outcome, details
+
+    def _send(self, phone_number, car_plate_no):
+        """
+        One registration with retries.
+
+        Outcome None means the backend is unavailable and never got the
+        request, so it is safe to send again later.
+        """
+        payload = {"phone_number": phone_number, "car_plate_no": car_plate_no}
+        deadline = time.monotonic() + self.total_timeout
+        error = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                return None, error or "Registration service is unavailable"
+
+            started = time.perf_counter()
+            try:
+                response = self.session.post(
+                    self.url,
+                    json=payload,
+                    timeout=(
+                        min(self.connect_timeout, remaining),
+                        min(self.read_timeout, remaining),
+                    ),
+                )
+            except requests.exceptions.RequestException as e:
+                response, error = None, str(e)
+                retryable = is_connect_error(e)
+            else:
+                error = f"HTTP {response.status_code}"
+                retryable = response.status_code in NON_IDEMPOTENT_RETRYABLE_STATUS_CODES
+            self._record_latency(time.perf_counter() - started)
+
+            if response is not None and response.status_code < 500 and not retryable:
+                # The backend answered, so it is up even if it refused the request
+                self.breaker.record_success()
+                if response.status_code == 201:
+                    return REGISTERED, _response_body(response)
+                return REJECTED, _response_body(response)
+
+            self.breaker.record_failure()
+            if not retryable:
+                # The backend may have acted on the request before failing;
+                # sending it again could register the user twice
+                logging.error(f"Registration for {phone_number} has unknown outcome ({error})")
+                return UNKNOWN, error
+            delay = min(jittered_delay(attempt), max(deadline - time.monotonic(), 0))
+            logging.warning(f"Registration attempt {attempt + 1} failed ({error})")
+            if attempt < self.max_retries and delay > 0:
+                time.sleep(delay)
+        return None, error
+
+    def _enqueue(self, phone_number, car_plate_no, reply_to):
+        # A newer request for the same number replaces an older one
+        dropped = self.queue_store.queue_registration(
+            phone_number, car_plate_no, reply_to, self.queue_limit
+        )
+        for dropped_phone in dropped:
+            self._count("dropped")
+            logging.error(f"Registration queue full, dropped registration for {dropped_phone}")
+        self._start_replayer()
+        with self._wakeup:
+            self._wakeup.notify()
+        logging.warning(f"Registration for {phone_number} queued for replay")
+
+    def _start_replayer(self):
+        with self._wakeup:
+            if self._replayer is None:
+                self._replayer = threading.Thread(
+                    target=self._replay_loop, name="registration-replay", daemon=True
+                )
+                self._replayer.start()
+
+    def _replay_loop(self):
+        while True:
+            wait = self.breaker.retry_in()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+
+            # Held long enough for every retry, so no other process takes it
+            # while it is being sent
+            entry = self.queue_store.claim_queued_registration(lease=2 * self.total_timeout)
+            if entry is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.replay_poll)
+                continue
+
+            phone_number = entry["phone_number"]
+            car_plate_no = entry["car_plate_no"]
+            reply_to = entry["reply_to"]
+            outcome, details = self._send(phone_number, car_plate_no)
+            if outcome is None:
+                # Still down; the breaker decides when to try again
+                self.queue_store.release_queued_registration(entry)
+                time.sleep(max(self.breaker.retry_in(), 1.0))
+                continue
+
+            self.queue_store.remove_queued_registration(entry)
+            self._count("replayed")
+            self._count(outcome)
+            logging.info(f"Replayed registration for {phone_number}: {outcome}")
+            if self.on_replayed is not None:
+                try:
+                    self.on_replayed(phone_number, car_plate_no, outcome, details, reply_to)
+                except Exception as e:
+                    logging.error(f"Registration replay callback failed: {e}")
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def stats(self):
+        """Breaker state, queue depth, outcome counts and p50/p99 latency."""
+        with self._lock:
+            stats = dict(self._counts)
+            stats["latency"] = latency_percentiles(self._latencies)
+        stats["queued_now"] = self.queue_store.queued_registrations()
+        stats["breaker"] = self.breaker.state
+        stats["breaker_opened"] = self.breaker.opened
+        return stats
+
+
+def _response_body(response):
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+
+# Shared client used by the register_user tool
+registration_client = RegistrationClient()
@@ -1,16 +1,22 @@
+import asyncio
 import logging
 import json
-import requests
 import re
 from dotenv import load_dotenv
 import os
 from flask import jsonify
 
-# This is the responsible function from GeminAi to the use
-# from app.services.gemin_configuration import generate_response
-
-# The configuration for OpenAi
-from app.services.openai_service import generate_response
+# Replies come from whichever LLM provider (OpenAI or Gemini) the router
+# picks; see app/services/llm_providers.py
+from app.services.openai_service import generate_response_async
+from app.services.interactive_replies import (
+    interactive_dispatcher,
+    interactive_reply,
+    nearby_stations_reply,
+)
+from app.utils.async_runtime import async_runtime
+from app.utils.graph_client import graph_client
+from app.utils.message_chunker import MessageChunker
 
 
 # Load environment variables
@@ -21,6 +27,8 @@ PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 VERSION = os.getenv("VERSION")
 APP_ID = os.getenv("APP_ID")
 APP_SECRET = os.getenv("APP_SECRET")
+# Send long answers as progressive chunks while the model is still writing
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
 
 
 # Utility function to log HTTP response details
@@ -43,26 +51,15 @@ def get_text_message_input(recipient, text):
     )
 
 
-# Where integration with WhatsApp API to send the response back
-import requests
-
+# Describe a failed Graph API call for the error logs
+def response_error(response):
+    if response is None:
+        return "no response from Graph API"
+    return response.text
 
-def send_whatsapp_message(recipient_waid, message, reply_to_message_id=None):
-    """
-    Send a WhatsApp message with optional reply context.
 
-    Args:
-        recipient_waid: Recipient's WhatsApp ID
-        message: Message text to send
-        reply_to_message_id: Optional message ID to reply to (for quoting messages)
-    """
-    url = (
-        f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    )
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
+# Payload for a text message
+def build_text_message(recipient_waid, message, reply_to_message_id=None):
     data = {
         "messaging_product": "whatsapp",
         "to": recipient_waid,
@@ -73,16 +70,59 @@ def send_whatsapp_message(recipient_waid, message, reply_to_message_id=None):
     # Add reply context if message_id is provided (for replying to messages)
     if reply_to_message_id:
         data["context"] = {"message_id": reply_to_message_id}
+    return data
+
+
+# Payload for a direct reply: text, or a message object such as a location
+# pin or interactive list ({"type": ..., <type>: {...}})
+def build_reply_message(recipient_waid, reply, reply_to_message_id=None):
+    if isinstance(reply, str):
+        return build_text_message(recipient_waid, reply, reply_to_message_id)
+    data = {"messaging_product": "whatsapp", "to": recipient_waid, **reply}
+    if reply_to_message_id:
+        data["context"] = {"message_id": reply_to_message_id}
+    return data
+
+
+# Payload marking a message as read with a typing indicator
+def build_read_receipt(message_id):
+    return {
+        "messaging_product": "whatsapp",
+        "status": "read",
+        "message_id": message_id,
+        "typing_indicator": {
+            "type": "text"
+        }
+    }
+
+
+# Where integration with WhatsApp API to send the response back
+async def send_whatsapp_message_async(recipient_waid, message, reply_to_message_id=None):
+    """
+    Send a WhatsApp message with optional reply context.
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    Args:
+        recipient_waid: Recipient's WhatsApp ID
+        message: Message text to send, or a message object (see build_reply_message)
+        reply_to_message_id: Optional message ID to reply to (for quoting messages)
+    """
+    data = build_reply_message(recipient_waid, message, reply_to_message_id)
+    response = await graph_client.send_message_async(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"Message sent to {recipient_waid}")
         return response.json()
     else:
-        logging.error(f"Failed to send message to {recipient_waid}: {response.text}")
+        logging.error(f"Failed to send message to {recipient_waid}: {response_error(response)}")
         return None
 
 
+def send_whatsapp_message(recipient_waid, message, reply_to_message_id=None):
+    """Blocking version of `send_whatsapp_message_async`."""
+    return async_runtime.run(
+        send_whatsapp_message_async(recipient_waid, message, reply_to_message_id)
+    )
+
+
 def send_reaction(recipient_waid, message_id, emoji):
     """
     Send an emoji reaction to a specific message using WhatsApp Business API.
@@ -92,13 +132,6 @@ def send_reaction(recipient_waid, message_id, emoji):
         message_id: ID of the message to react to
         emoji: Emoji to react with (e.g., "👍", "❤️", "😊", "😂", "😮", "😢", "🙏")
     """
-    url = (
-        f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    )
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
     data = {
         "messaging_product": "whatsapp",
         "recipient_type": "individual",
@@ -110,47 +143,37 @@ def send_reaction(recipient_waid, message_id, emoji):
         }
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    response = graph_client.send_message(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"Reaction {emoji} sent to message {message_id}")
         return True
     else:
-        logging.error(f"Failed to send reaction: {response.text}")
+        logging.error(f"Failed to send reaction: {response_error(response)}")
         return False
 
 
-def mark_as_read_with_typing(message_id):
+async def mark_as_read_with_typing_async(message_id):
     """
     Mark a message as read and show typing indicator using WhatsApp Business API.
 
     Args:
         message_id: ID of the message to mark as read
     """
-    url = (
-        f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    )
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    data = {
-        "messaging_product": "whatsapp",
-        "status": "read",
-        "message_id": message_id,
-        "typing_indicator": {
-            "type": "text"
-        }
-    }
-
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    data = build_read_receipt(message_id)
+    response = await graph_client.send_message_async(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"Message {message_id} marked as read with typing indicator")
         return True
     else:
-        logging.error(f"Failed to mark message as read with typing: {response.text}")
+        logging.error(f"Failed to mark message as read with typing: {response_error(response)}")
         return False
 
 
+def mark_as_read_with_typing(message_id):
+    """Blocking version of `mark_as_read_with_typing_async`."""
+    return async_runtime.run(mark_as_read_with_typing_async(message_id))
+
+
 # Process text to match WhatsApp message style (e.g., replacing brackets, formatting text)
 def process_text_for_whatsapp(text):
     # Remove brackets and their content
@@ -162,26 +185,137 @@ def process_text_for_whatsapp(text):
     return whatsapp_style_text
 
 
-# Handle incoming WhatsApp message and respond
-def process_whatsapp_message(body):
+# Walk every entry, change and message in a webhook payload
+def extract_whatsapp_messages(body):
+    """
+    Flatten a webhook payload into one event per inbound message.
+
+    Meta may batch several entries, changes and messages into a single
+    delivery, so nothing here assumes index 0.
+
+    Returns:
+        list of dicts with 'wa_id', 'name' and 'message' keys.
+    """
+    events = []
+    for entry in body.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            contacts = value.get("contacts", [])
+            names = {
+                contact.get("wa_id"): contact.get("profile", {}).get("name")
+                for contact in contacts
+            }
+            for message in value.get("messages", []):
+                wa_id = message.get("from")
+                if not wa_id and contacts:
+                    wa_id = contacts[0].get("wa_id")
+                events.append(
+                    {
+                        "wa_id": wa_id,
+                        "name": names.get(wa_id) or "",
+                        "message": message,
+                    }
+                )
+    return events
+
+
+UNSUPPORTED_MESSAGE_REPLY = (
+    "Samahani, kwa sasa ninaweza kusoma ujumbe wa maandishi tu.\n"
+    "Sorry, I can only read text messages for now."
+)
+
+
+def triage_message(wa_id, message):
+    """
+    Decide how to answer an inbound message without calling the LLM if possible.
+
+    Button and list taps with a registered handler are answered directly;
+    taps without one are treated as if the user had typed the tapped title.
+    Shared locations are answered with the best filling stations nearby.
+
+    Returns:
+        tuple: (message_body for the LLM, or None; direct reply text or
+        message object, or None)
+    """
+    tap = interactive_reply(message)
+    if tap is not None:
+        tapped_id, title = tap
+        reply = interactive_dispatcher.dispatch(wa_id, tapped_id)
+        if reply is not None:
+            return None, reply
+        return title, None
+    if message.get("type", "text") == "text":
+        return message["text"]["body"], None
+    if message.get("type") == "location":
+        location = message["location"]
+        return None, nearby_stations_reply(
+            wa_id, float(location["latitude"]), float(location["longitude"])
+        )
+    logging.info(f"Unsupported message type '{message.get('type')}' from {wa_id}")
+    return None, UNSUPPORTED_MESSAGE_REPLY
+
+
+# Handle a single inbound WhatsApp message and respond
+async def process_message_event_async(event):
     try:
-        wa_id = body["entry"][0]["changes"][0]["value"]["contacts"][0]["wa_id"]
-        name = body["entry"][0]["changes"][0]["value"]["contacts"][0]["profile"]["name"]
-        message = body["entry"][0]["changes"][0]["value"]["messages"][0]
-        message_body = message["text"]["body"]
+        wa_id = event["wa_id"]
+        name = event["name"]
+        message = event["message"]
         message_id = message["id"]
 
-        logging.info(f"Received message from {name} ({wa_id}): {message_body}")
+        # Interactive handlers and the station lookup may hit SQLite
+        message_body, direct_reply = await asyncio.to_thread(triage_message, wa_id, message)
+        if direct_reply is not None:
+            # Taps and shared locations are answered in one Graph API call, no LLM
+            await send_whatsapp_message_async(wa_id, direct_reply, reply_to_message_id=message_id)
+            return
 
-        # Mark message as read and show typing indicator (mimic human behavior)
-        mark_as_read_with_typing(message_id)
+        logging.info(f"Received message from {name} ({wa_id}): {message_body}")
 
-        # Process and respond
-        response = generate_response(message_body, wa_id, name)
-        formatted_response = process_text_for_whatsapp(response)
+        # Mark message as read and show typing indicator (mimic human behavior);
+        # the model starts meanwhile, but nothing is sent before the receipt
+        read_receipt = asyncio.create_task(mark_as_read_with_typing_async(message_id))
+
+        if STREAM_REPLIES:
+            # Send the reply in chunks as the model writes it. Chunks are queued
+            # as they are cut and sent in order by one task, so the model stream
+            # is never held up by a Graph API call; only the first chunk quotes
+            # the original message
+            chunks = asyncio.Queue()
+
+            async def send_chunks():
+                await read_receipt
+                reply_to = message_id
+                while (chunk := await chunks.get()) is not None:
+                    await send_whatsapp_message_async(
+                        wa_id, process_text_for_whatsapp(chunk), reply_to_message_id=reply_to
+                    )
+                    reply_to = None
+
+            sender = asyncio.create_task(send_chunks())
+            chunker = MessageChunker(chunks.put_nowait)
+            try:
+                response = await generate_response_async(
+                    message_body, wa_id, name, on_text=chunker.feed
+                )
+                # Send what the stream did not deliver; a reply that does not
+                # continue the sent chunks goes out whole below, quoting the message
+                finished = chunker.chunks_sent and chunker.finish(response)
+            finally:
+                chunks.put_nowait(None)
+                await sender
+            if finished:
+                return
+        else:
+            # Process and respond
+            response = await generate_response_async(message_body, wa_id, name)
 
         # Send the response as a reply to the original message (mimic human behavior)
-        send_whatsapp_message(wa_id, formatted_response, reply_to_message_id=message_id)
+        await read_receipt
+        formatted_response = process_text_for_whatsapp(response)
+        await send_whatsapp_message_async(
+            wa_id, formatted_response, reply_to_message_id=message_id
+        )
 
         # Optional: Send a reaction emoji to acknowledge the message
         # Uncomment the line below to enable automatic reactions
@@ -193,18 +327,33 @@ def process_whatsapp_message(body):
         logging.error(f"Unexpected error during message processing: {e}")
 
 
-# Check if the incoming event is a valid WhatsApp message
+def process_message_event(event):
+    """Blocking version of `process_message_event_async`, run by the worker lanes."""
+    async_runtime.run(process_message_event_async(event))
+
+
+# Handle every message in an incoming webhook payload
+def process_whatsapp_message(body):
+    for event in extract_whatsapp_messages(body):
+        process_message_event(event)
+
+
+# Check if the incoming event contains at least one WhatsApp message
 def is_valid_whatsapp_message(body):
-    try:
-        return (
-            body.get("object") == "whatsapp_business_account"
-            and "entry" in body
-            and "changes" in body["entry"][0]
-            and "value" in body["entry"][0]["changes"][0]
-            and "messages" in body["entry"][0]["changes"][0]["value"]
-        )
-    except KeyError:
-        return False
+    return body.get("object") == "whatsapp_business_account" and any(
+        "messages" in change.get("value", {})
+        for entry in body.get("entry", [])
+        for change in entry.get("changes", [])
+    )
+
+
+# Check if the incoming event carries delivery/read status updates
+def is_whatsapp_status_update(body):
+    return any(
+        change.get("value", {}).get("statuses")
+        for entry in body.get("entry", [])
+        for change in entry.get("changes", [])
+    )
 
 
 def send_button_message(recipient_waid, body_text, buttons, header_text=None, footer_text=None):
@@ -226,11 +375,6 @@ def send_button_message(recipient_waid, body_text, buttons, header_text=None, fo
         ]
         send_button_message(wa_id, "Do you want to continue?", buttons)
     """
-    url = f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
 
     action_buttons = []
     for btn in buttons[:3]:  # Max 3 buttons
@@ -259,12 +403,12 @@ def send_button_message(recipient_waid, body_text, buttons, header_text=None, fo
     if footer_text:
         data["interactive"]["footer"] = {"text": footer_text}
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    response = graph_client.send_message(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"Button message sent to {recipient_waid}")
         return response.json()
     else:
-        logging.error(f"Failed to send button message: {response.text}")
+        logging.error(f"Failed to send button message: {response_error(response)}")
         return None
 
 
@@ -293,11 +437,6 @@ def send_list_message(recipient_waid, body_text, button_text, sections, header_t
         ]
         send_list_message(wa_id, "Choose payment method", "Select", sections)
     """
-    url = f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
 
     data = {
         "messaging_product": "whatsapp",
@@ -319,12 +458,12 @@ def send_list_message(recipient_waid, body_text, button_text, sections, header_t
     if footer_text:
         data["interactive"]["footer"] = {"text": footer_text}
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    response = graph_client.send_message(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"List message sent to {recipient_waid}")
         return response.json()
     else:
-        logging.error(f"Failed to send list message: {response.text}")
+        logging.error(f"Failed to send list message: {response_error(response)}")
         return None
 
 
@@ -346,11 +485,6 @@ def send_contact(recipient_waid, contacts):
         ]
         send_contact(wa_id, contacts)
     """
-    url = f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
 
     data = {
         "messaging_product": "whatsapp",
@@ -359,12 +493,12 @@ def send_contact(recipient_waid, contacts):
         "contacts": contacts
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    response = graph_client.send_message(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"Contact sent to {recipient_waid}")
         return response.json()
     else:
-        logging.error(f"Failed to send contact: {response.text}")
+        logging.error(f"Failed to send contact: {response_error(response)}")
         return None
 
 
@@ -382,11 +516,6 @@ def send_location(recipient_waid, latitude, longitude, name=None, address=None):
     Example:
         send_location(wa_id, -6.7924, 39.2083, "Dar es Salaam", "Tanzania")
     """
-    url = f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
 
     location_data = {
         "latitude": latitude,
@@ -405,12 +534,12 @@ def send_location(recipient_waid, latitude, longitude, name=None, address=None):
         "location": location_data
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    response = graph_client.send_message(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"Location sent to {recipient_waid}")
         return response.json()
     else:
-        logging.error(f"Failed to send location: {response.text}")
+        logging.error(f"Failed to send location: {response_error(response)}")
         return None
 
 
@@ -433,11 +562,6 @@ def send_media(recipient_waid, media_type, media_id=None, media_link=None, capti
         # Using media ID
         send_media(wa_id, "document", media_id="123456", filename="report.pdf")
     """
-    url = f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
 
     media_data = {}
     if media_id:
@@ -461,12 +585,12 @@ def send_media(recipient_waid, media_type, media_id=None, media_link=None, capti
         media_type: media_data
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    response = graph_client.send_message(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"{media_type.capitalize()} sent to {recipient_waid}")
         return response.json()
     else:
-        logging.error(f"Failed to send {media_type}: {response.text}")
+        logging.error(f"Failed to send {media_type}: {response_error(response)}")
         return None
 
 
@@ -492,11 +616,6 @@ def send_template(recipient_waid, template_name, language_code="en", components=
         ]
         send_template(wa_id, "hello_world", "en", components)
     """
-    url = f"https://graph.facebook.com/{VERSION}/{os.getenv('PHONE_NUMBER_ID')}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
 
     data = {
         "messaging_product": "whatsapp",
@@ -511,12 +630,12 @@ def send_template(recipient_waid, template_name, language_code="en", components=
     if components:
         data["template"]["components"] = components
 
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
+    response = graph_client.send_message(data)
+    if response is not None and response.status_code == 200:
         logging.info(f"Template message sent to {recipient_waid}")
         return response.json()
     else:
-        logging.error(f"Failed to send template: {response.text}")
+        logging.error(f"Failed to send template: {response_error(response)}")
         return None
 
 
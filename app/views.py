@@ -4,7 +4,22 @@ import json
 from flask import Blueprint, request, jsonify, current_app
 from dotenv import load_dotenv
 from .decorators.security import signature_required
-from .utils.whatsapp_utils import process_whatsapp_message, is_valid_whatsapp_message
+from .utils.whatsapp_utils import (
+    extract_whatsapp_messages,
+    is_valid_whatsapp_message,
+    is_whatsapp_status_update,
+    process_message_event,
+)
+from .utils.job_queue import job_queue
+from .utils.lane_scheduler import lane_scheduler
+from .utils.message_dedup import message_dedup
+from .utils.partitioned_dispatcher import dispatcher
+from .services.openai_service import llm_router, readiness, response_cache
+from .services.station_registry import station_registry
+from .services.tool_runtime import tool_runtime
+from .services.user_store import user_store
+from .utils.graph_client import graph_client
+from .utils.registration_client import registration_client
 
 # from app.services.functions import register_user, payment_options, request_filling_station, confirm_booking
 
@@ -22,6 +37,50 @@ logging.info(f"VERIFY_TOKEN loaded: {VERIFY_TOKEN}")
 webhook_blueprint = Blueprint("webhook", __name__)
 
 
+def accept_message_events(body, lanes=lane_scheduler, handler=process_message_event):
+    """
+    Queue every new message in a webhook payload for processing.
+
+    Each user gets an ordered lane keyed by wa_id: their messages run one at a
+    time in timestamp order, while different users run concurrently. Shared
+    by the Flask view and the ASGI app; the ASGI app passes its event-loop
+    lanes and the coroutine version of the handler. Dedup writes to SQLite,
+    so call this off the event loop.
+
+    Args:
+        body: Webhook payload
+        lanes: Scheduler to queue the messages on
+        handler: Callable (or coroutine function, for async lanes) run per message
+
+    Returns:
+        bool: False if the server was too busy to take a message.
+    """
+    for event in extract_whatsapp_messages(body):
+        # Redeliveries of a message we already accepted are acknowledged
+        # without running the LLM or replying again
+        if message_dedup.is_duplicate(event["message"].get("id")):
+            logging.info(f"Skipping redelivered message {event['message'].get('id')}")
+            continue
+        if dispatcher.enabled:
+            # Multi-process mode: the worker owning this wa_id runs the lane
+            accepted = dispatcher.dispatch(event)
+        else:
+            timestamp = int(event["message"].get("timestamp", 0))
+            accepted = lanes.submit(event["wa_id"], timestamp, handler, event)
+        if not accepted:
+            # Let Meta's redelivery through the dedup check next time
+            message_dedup.forget(event["message"].get("id"))
+            return False
+    return True
+
+
+def queue_stats_payload():
+    """Job queue and lane stats, or the worker processes' in multi-process mode."""
+    if dispatcher.enabled:
+        return dispatcher.stats()
+    return {**job_queue.stats(), **lane_scheduler.stats()}
+
+
 def handle_message():
     """
     Handle incoming webhook events from the WhatsApp API.
@@ -36,19 +95,15 @@ def handle_message():
         logging.error("Empty or invalid JSON received.")
         return jsonify({"status": "error", "message": "Invalid JSON provided"}), 400
 
-    # Check if it's a WhatsApp status update (delivered, read, etc.)
-    if (
-        body.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("statuses")
-    ):
-        logging.info("Received a WhatsApp status update.")
-        return jsonify({"status": "ok"}), 200
-
-    # Process valid WhatsApp message
+    # Hand every message in the payload to the worker pool and acknowledge right
+    # away, so Meta does not time out and redeliver while the LLM is working.
     if is_valid_whatsapp_message(body):
-        process_whatsapp_message(body)
+        if not accept_message_events(body):
+            return jsonify({"status": "error", "message": "Server busy"}), 503
+        return jsonify({"status": "ok"}), 200
+    elif is_whatsapp_status_update(body):
+        # Status updates only (delivered, read, etc.)
+        logging.info("Received a WhatsApp status update.")
         return jsonify({"status": "ok"}), 200
     else:
         logging.warning("Not a valid WhatsApp API event.")
@@ -94,6 +149,67 @@ def webhook_post():
     return handle_message()
 
 
+@webhook_blueprint.route("/ready", methods=["GET"])
+def ready():
+    """Report whether the assistant and knowledge base warm-up has finished."""
+    is_ready, details = readiness()
+    return jsonify(details), 200 if is_ready else 503
+
+
+@webhook_blueprint.route("/queue-stats", methods=["GET"])
+def queue_stats():
+    """Expose job queue depth, wait time, worker utilisation and lane counts."""
+    return jsonify(queue_stats_payload()), 200
+
+
+@webhook_blueprint.route("/dedup-stats", methods=["GET"])
+def dedup_stats():
+    """Expose how many redelivered messages were skipped."""
+    return jsonify(message_dedup.stats()), 200
+
+
+@webhook_blueprint.route("/response-cache-stats", methods=["GET"])
+def response_cache_stats():
+    """Expose FAQ response cache hits, misses and coalesced LLM calls."""
+    return jsonify(response_cache.stats()), 200
+
+
+@webhook_blueprint.route("/tool-stats", methods=["GET"])
+def tool_stats():
+    """Expose per-tool call, failure and timeout counts and tool cache hits."""
+    return jsonify(tool_runtime.stats()), 200
+
+
+@webhook_blueprint.route("/station-stats", methods=["GET"])
+def station_stats():
+    """Expose the size of the station index and how many stations have stock."""
+    return jsonify(station_registry.stats()), 200
+
+
+@webhook_blueprint.route("/user-stats", methods=["GET"])
+def user_stats():
+    """Expose user and booking counts and user cache hits."""
+    return jsonify(user_store.stats()), 200
+
+
+@webhook_blueprint.route("/registration-stats", methods=["GET"])
+def registration_stats():
+    """Expose the registration backend's circuit state, replay queue and latency."""
+    return jsonify(registration_client.stats()), 200
+
+
+@webhook_blueprint.route("/llm-stats", methods=["GET"])
+def llm_stats():
+    """Expose each LLM provider's rolling latency, error rate and hedges."""
+    return jsonify(llm_router.stats()), 200
+
+
+@webhook_blueprint.route("/graph-stats", methods=["GET"])
+def graph_stats():
+    """Expose p50/p99 latency of outbound Graph API calls."""
+    return jsonify(graph_client.stats()), 200
+
+
 # # Registration route
 # @webhook_blueprint.route("/register", methods=["POST"])
 # def register():
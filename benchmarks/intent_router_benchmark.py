@@ -0,0 +1,138 @@
+"""
+Accuracy and latency of the intent router on labelled English/Swahili messages.
+
+Run from the repository root (the app's .env must be present):
+
+    python benchmarks/intent_router_benchmark.py
+
+The legacy keyword rule ("payment", "contact", "info" -> function assistant)
+is scored on the same examples for comparison.
+"""
+
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.intent_router import RETRIEVAL_INTENT, intent_router  # noqa: E402
+
+LABELLED_EXAMPLES = [
+    # register_user
+    ("I want to register", "register_user"),
+    ("How do I sign up for the service?", "register_user"),
+    ("Register my car, plate number T123ABC", "register_user"),
+    ("Please create an account for me", "register_user"),
+    ("Nataka kujisajili", "register_user"),
+    ("Naomba kunisajili, namba ya gari ni T 456 DEF", "register_user"),
+    ("Nisajili tafadhali", "register_user"),
+    ("Usajili unafanyikaje?", "register_user"),
+    ("I'm a new customer and want to register my plate", "register_user"),
+    ("Fungua akaunti yangu", "register_user"),
+    # confirm_booking
+    ("Confirm my booking", "confirm_booking"),
+    ("Yes, I confirm", "confirm_booking"),
+    ("Please cancel my booking", "confirm_booking"),
+    ("I want to cancel the reservation", "confirm_booking"),
+    ("Nathibitisha oda yangu", "confirm_booking"),
+    ("Thibitisha nafasi yangu", "confirm_booking"),
+    ("Ghairi booking yangu", "confirm_booking"),
+    ("Sitisha oda tafadhali", "confirm_booking"),
+    ("Can you book me a slot?", "confirm_booking"),
+    ("Booking confirmed?", "confirm_booking"),
+    # request_filling_station
+    ("Where is the nearest filling station?", "request_filling_station"),
+    ("Show me gas stations near me", "request_filling_station"),
+    ("Which station is closest to Mikocheni?", "request_filling_station"),
+    ("Where can I get fuel around here?", "request_filling_station"),
+    ("Kituo cha mafuta kilicho karibu yangu kiko wapi?", "request_filling_station"),
+    ("Nitapata mafuta wapi?", "request_filling_station"),
+    ("Sheli iliyo karibu na Kariakoo", "request_filling_station"),
+    ("Vituo vya mafuta vilivyo karibu", "request_filling_station"),
+    ("Nataka kujaza mafuta, sheli gani iko karibu?", "request_filling_station"),
+    ("Find me a petrol station", "request_filling_station"),
+    # payment_options
+    ("I want to pay", "payment_options"),
+    ("Can I pay with cash?", "payment_options"),
+    ("Payment by M-Pesa please", "payment_options"),
+    ("I will pay electronically", "payment_options"),
+    ("Nataka kulipa", "payment_options"),
+    ("Nitalipa taslimu", "payment_options"),
+    ("Naweza kulipia kwa M-Pesa?", "payment_options"),
+    ("Malipo kwa kadi yanawezekana?", "payment_options"),
+    ("Nilipe kwa Tigo Pesa", "payment_options"),
+    ("What payment options do you have?", "payment_options"),
+    # retrieval
+    ("What is the price of petrol today?", RETRIEVAL_INTENT),
+    ("Bei ya dizeli ni kiasi gani?", RETRIEVAL_INTENT),
+    ("Is LPG available at Station X?", RETRIEVAL_INTENT),
+    ("What time does Station B open?", RETRIEVAL_INTENT),
+    ("Sheli inafunguliwa saa ngapi?", RETRIEVAL_INTENT),
+    ("Are there any discounts on diesel today?", RETRIEVAL_INTENT),
+    ("Kuna punguzo la bei leo?", RETRIEVAL_INTENT),
+    ("How can I safely refuel my car?", RETRIEVAL_INTENT),
+    ("Who can I call if my car breaks down?", RETRIEVAL_INTENT),
+    ("Nipigie fundi, gari limeharibika", RETRIEVAL_INTENT),
+    ("How long is the wait time at Station A?", RETRIEVAL_INTENT),
+    ("Foleni ikoje leo?", RETRIEVAL_INTENT),
+    ("How do I report an issue with the service?", RETRIEVAL_INTENT),
+    ("Nina malalamiko kuhusu huduma", RETRIEVAL_INTENT),
+    ("Habari yako", RETRIEVAL_INTENT),
+    ("Hello", RETRIEVAL_INTENT),
+    ("Asante sana", RETRIEVAL_INTENT),
+    ("Does Station C provide oil change services?", RETRIEVAL_INTENT),
+    ("Mafuta ya petroli yanapatikana?", RETRIEVAL_INTENT),
+    ("Tell me about your company", RETRIEVAL_INTENT),
+]
+
+LEGACY_KEYWORDS = {"payment", "contact", "info"}
+
+
+def legacy_route(message_body):
+    if any(keyword in message_body.lower() for keyword in LEGACY_KEYWORDS):
+        return "function"
+    return RETRIEVAL_INTENT
+
+
+def main(repeat=2000):
+    correct = 0
+    assistant_correct = 0
+    legacy_correct = 0
+    confusion = Counter()
+    for message, label in LABELLED_EXAMPLES:
+        predicted = intent_router.route(message).intent
+        correct += predicted == label
+        # What actually changes cost: function assistant vs retrieval
+        assistant_correct += (predicted == RETRIEVAL_INTENT) == (label == RETRIEVAL_INTENT)
+        legacy_correct += (legacy_route(message) == RETRIEVAL_INTENT) == (
+            label == RETRIEVAL_INTENT
+        )
+        if predicted != label:
+            confusion[(label, predicted)] += 1
+            print(f"MISS  {label:>24} -> {predicted:<24} {message}")
+
+    latencies = []
+    for _ in range(repeat):
+        for message, _ in LABELLED_EXAMPLES:
+            started = time.perf_counter()
+            intent_router.route(message)
+            latencies.append((time.perf_counter() - started) * 1e6)
+    latencies.sort()
+
+    total = len(LABELLED_EXAMPLES)
+    print()
+    print(f"examples:                 {total}")
+    print(f"intent accuracy:          {correct / total:.1%}")
+    print(f"assistant accuracy:       {assistant_correct / total:.1%}")
+    print(f"legacy keyword accuracy:  {legacy_correct / total:.1%}")
+    print(f"latency mean:             {statistics.fmean(latencies):.1f} us")
+    print(f"latency p50:              {latencies[len(latencies) // 2]:.1f} us")
+    print(f"latency p99:              {latencies[int(len(latencies) * 0.99)]:.1f} us")
+    for (label, predicted), count in confusion.most_common():
+        print(f"confused {label} -> {predicted}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Latency and correctness of nearest-station queries on the grid index.
+
+Run from the repository root:
+
+    python benchmarks/station_index_benchmark.py [number_of_stations]
+
+Random stations are spread over greater Dar es Salaam. Every query is checked
+against a brute-force scan of all stations, which is also timed for comparison.
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.station_registry import StationRegistry, haversine_km  # noqa: E402
+
+# Roughly greater Dar es Salaam
+LAT_RANGE = (-7.05, -6.60)
+LON_RANGE = (39.05, 39.45)
+QUERIES = 2000
+K = 5
+
+
+def random_stations(count, rng):
+    return [
+        {
+            "id": f"s{i}",
+            "name": f"Station {i}",
+            "latitude": rng.uniform(*LAT_RANGE),
+            "longitude": rng.uniform(*LON_RANGE),
+            "queue_length": rng.randint(0, 8),
+            "in_stock": rng.random() > 0.1,
+        }
+        for i in range(count)
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(42)
+    records = random_stations(count, rng)
+    registry = StationRegistry(records)
+    latitudes = np.array([r["latitude"] for r in records])
+    longitudes = np.array([r["longitude"] for r in records])
+
+    points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(QUERIES)]
+    grid_times, scan_times, mismatches = [], [], 0
+    for latitude, longitude in points:
+        start = time.perf_counter()
+        indices, _ = registry.nearest(latitude, longitude, K)
+        grid_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        distances = haversine_km(latitude, longitude, latitudes, longitudes)
+        expected = np.argsort(distances, kind="stable")[:K]
+        scan_times.append(time.perf_counter() - start)
+
+        if set(indices.tolist()) != set(expected.tolist()):
+            mismatches += 1
+
+    rank_times = []
+    for latitude, longitude in points:
+        start = time.perf_counter()
+        registry.rank(latitude, longitude, k=K)
+        rank_times.append(time.perf_counter() - start)
+
+    print(f"{count} stations, {QUERIES} queries, k={K}")
+    print(f"  mismatches vs brute force: {mismatches}")
+    for label, times in (("grid nearest", grid_times), ("grid rank", rank_times), ("full scan", scan_times)):
+        micros = [t * 1e6 for t in times]
+        print(
+            f"  {label:<13} p50 {statistics.median(micros):7.1f}µs"
+            f"  p99 {percentile(micros, 0.99):7.1f}µs"
+        )
+
+
+if __name__ == "__main__":
+    main()
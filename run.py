@@ -1,10 +1,17 @@
 import logging
+import signal
+import sys
 
 from app import create_app
 
 
-app = create_app()
-
 if __name__ == "__main__":
+    # Created under the main guard: in multi-process mode (SERVING_WORKERS > 0)
+    # worker processes re-import this module and must not build their own app
+    app = create_app()
+
+    # Treat `docker stop` like Ctrl-C so worker processes are drained on exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     logging.info("Flask app started")
     app.run(host="0.0.0.0", port=8000)
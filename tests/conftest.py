@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+# The app reads its settings when first imported, and importing any module
+# under app/ runs app/__init__.py (and so the Flask views). Give it the
+# settings it insists on, and keep its SQLite files out of the working tree.
+_scratch = tempfile.mkdtemp(prefix="whatsapp-bot-tests-")
+os.environ.setdefault("VERIFY_TOKEN", "test-verify-token")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+for _name, _filename in (
+    ("THREAD_STORE_FILE", "threads.sqlite3"),
+    ("MEMORY_DB_FILE", "memory.sqlite3"),
+    ("USER_STORE_FILE", "users.sqlite3"),
+    ("WARM_UP_LOCK_FILE", "warm_up.lock"),
+):
+    os.environ[_name] = os.path.join(_scratch, _filename)
+os.environ["DEDUP_DB_FILE"] = ""
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+from app.utils.async_runtime import AsyncRuntime
+from app.utils.job_queue import JobQueue
+from app.utils.lane_scheduler import AsyncLaneScheduler, LaneScheduler
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_one_users_jobs_run_one_at_a_time_in_timestamp_order():
+    scheduler = LaneScheduler(queue=JobQueue(num_workers=4))
+    release = threading.Event()
+    ran, running, overlaps = [], [], []
+    lock = threading.Lock()
+
+    def job(label):
+        with lock:
+            if running:
+                overlaps.append(label)
+            running.append(label)
+        if label == "first":
+            release.wait(5)
+        time.sleep(0.01)
+        with lock:
+            running.remove(label)
+            ran.append(label)
+
+    assert scheduler.submit("255700000001", 100, job, "first")
+    wait_until(lambda: running)
+    # Delivered out of order while the first message is still being answered
+    for timestamp in (103, 101, 102):
+        assert scheduler.submit("255700000001", timestamp, job, timestamp)
+    release.set()
+
+    wait_until(lambda: len(ran) == 4)
+    assert ran == ["first", 101, 102, 103]
+    assert overlaps == []
+    assert scheduler.stats() == {"active_lanes": 0, "pending_jobs": 0}
+
+
+def test_different_users_run_in_parallel():
+    scheduler = LaneScheduler(queue=JobQueue(num_workers=2))
+    barrier = threading.Barrier(2, timeout=5)
+    passed = []
+
+    def job(wa_id):
+        # Only returns if the other user's job is running at the same time
+        barrier.wait()
+        passed.append(wa_id)
+
+    assert scheduler.submit("a", 1, job, "a")
+    assert scheduler.submit("b", 1, job, "b")
+    wait_until(lambda: len(passed) == 2)
+
+
+class FullOnceQueue(JobQueue):
+    """A queue that refuses its first job, running `on_full` as it does."""
+
+    def __init__(self, on_full):
+        super().__init__(num_workers=1)
+        self.on_full = on_full
+        self.refusals = 0
+
+    def submit(self, func, *args, **kwargs):
+        if self.refusals == 0:
+            self.refusals += 1
+            self.on_full()
+            return False
+        return super().submit(func, *args, **kwargs)
+
+
+def test_rejected_lane_with_a_newer_message_is_retried():
+    ran = threading.Event()
+    results = []
+
+    def job(label):
+        results.append(label)
+        ran.set()
+
+    # A second message for the same user joins the lane while the first
+    # one's submit is being refused by the full queue
+    queue = FullOnceQueue(lambda: results.append(scheduler.submit("a", 2, job, "second")))
+    scheduler = LaneScheduler(queue=queue, retry_seconds=0.05)
+
+    assert scheduler.submit("a", 1, job, "first") is False
+    assert ran.wait(5)
+    assert results == [True, "second"]
+    wait_until(lambda: scheduler.stats()["active_lanes"] == 0)
+
+
+def test_rejected_lane_without_other_messages_is_dropped():
+    queue = FullOnceQueue(lambda: None)
+    scheduler = LaneScheduler(queue=queue, retry_seconds=0.05)
+
+    assert scheduler.submit("a", 1, print, "never") is False
+    assert scheduler.stats() == {"active_lanes": 0, "pending_jobs": 0}
+
+
+def test_async_lanes_keep_order_per_user_and_cap_pending():
+    scheduler = AsyncLaneScheduler(runtime=AsyncRuntime(), max_in_flight=10, max_pending=5)
+    release = threading.Event()
+    ran = []
+
+    async def job(label):
+        if label in ("first", "b"):
+            await asyncio.to_thread(release.wait, 5)
+        ran.append(label)
+
+    assert scheduler.submit("a", 100, job, "first")
+    for timestamp in (103, 101, 102):
+        assert scheduler.submit("a", timestamp, job, timestamp)
+    assert scheduler.submit("b", 1, job, "b")
+    # Five messages accepted and unfinished: the next one is refused
+    assert scheduler.submit("c", 1, job, "c") is False
+    release.set()
+
+    drained = scheduler._runtime.run(scheduler.drain(5))
+    assert drained
+    assert [label for label in ran if label != "b"] == ["first", 101, 102, 103]
+    assert "b" in ran and "c" not in ran
+    assert scheduler.stats() == {"active_lanes": 0, "pending_jobs": 0, "in_flight": 0}
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import message_dedup
+from app.utils.message_dedup import MessageDeduplicator
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(message_dedup, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_redelivery_within_ttl_is_a_duplicate(clock):
+    dedup = MessageDeduplicator(max_entries=10, ttl_seconds=60)
+    assert dedup.is_duplicate("wamid.1") is False
+    clock.value += 59
+    assert dedup.is_duplicate("wamid.1") is True
+    assert dedup.stats()["duplicates_skipped"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    dedup = MessageDeduplicator(max_entries=10, ttl_seconds=60)
+    dedup.is_duplicate("wamid.1")
+    clock.value += 61
+    assert dedup.is_duplicate("wamid.2") is False
+    # Expired entries are dropped from the front as new IDs arrive
+    assert dedup.stats()["entries"] == 1
+    assert dedup.is_duplicate("wamid.1") is False
+
+
+def test_oldest_entries_are_evicted_at_the_size_cap(clock):
+    dedup = MessageDeduplicator(max_entries=3, ttl_seconds=60)
+    for i in range(3):
+        dedup.is_duplicate(f"wamid.{i}")
+        clock.value += 1
+    # A hit does not make an entry younger, so the oldest still goes first
+    assert dedup.is_duplicate("wamid.0") is True
+    dedup.is_duplicate("wamid.3")
+    assert dedup.stats()["entries"] == 3
+    assert dedup.is_duplicate("wamid.0") is False
+
+
+def test_forget_lets_a_redelivery_through(clock):
+    dedup = MessageDeduplicator(max_entries=10, ttl_seconds=60)
+    dedup.is_duplicate("wamid.1")
+    dedup.forget("wamid.1")
+    assert dedup.is_duplicate("wamid.1") is False
+
+
+def test_sqlite_store_is_shared_and_purged(clock, tmp_path):
+    db_file = str(tmp_path / "dedup.db")
+    first = MessageDeduplicator(max_entries=3, ttl_seconds=60, db_file=db_file)
+    second = MessageDeduplicator(max_entries=3, ttl_seconds=60, db_file=db_file)
+    assert first.is_duplicate("wamid.1") is False
+    assert second.is_duplicate("wamid.1") is True
+
+    for i in range(2, 8):
+        clock.value += 10
+        first.is_duplicate(f"wamid.{i}")
+    rows = first._db.execute("SELECT COUNT(*) FROM seen_messages").fetchone()[0]
+    assert rows <= 3
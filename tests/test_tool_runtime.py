@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services import tool_runtime as tool_runtime_module
+from app.services.tool_runtime import ToolRuntime
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    # Tools must be described to the model; these test-only ones are not
+    for name in ("slow", "fast", "stuck"):
+        monkeypatch.setitem(tool_runtime_module.TOOL_VALIDATORS, name, None)
+    runtime = ToolRuntime(num_workers=2, queue_limit=8)
+    yield runtime
+    runtime._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_slow_tool_times_out(runtime):
+    release = threading.Event()
+
+    @runtime.register("stuck", timeout=0.1)
+    def stuck():
+        release.wait(5)
+
+    started = time.monotonic()
+    result = runtime.run("stuck", {})
+    release.set()
+    assert result.ok is False
+    assert "timed out" in result.error
+    assert time.monotonic() - started < 1
+    assert runtime.stats()["tools"]["stuck"]["timeouts"] == 1
+
+
+def test_concurrency_cap_queues_calls_without_blocking_other_tools(runtime):
+    release = threading.Event()
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    @runtime.register("slow", timeout=5, max_concurrency=1)
+    def slow():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        release.wait(5)
+        with lock:
+            running[0] -= 1
+        return "slow"
+
+    @runtime.register("fast")
+    def fast():
+        return "fast"
+
+    slow_calls = [runtime.start("slow", {}) for _ in range(3)]
+    assert runtime.stats()["tools"]["slow"]["waiting"] == 2
+    # The capped calls hold one pool thread, not both
+    assert runtime.run("fast", {}).data == "fast"
+
+    release.set()
+    assert [runtime.wait(call).data for call in slow_calls] == ["slow"] * 3
+    assert peak[0] == 1
+
+
+def test_queued_call_that_times_out_never_runs(runtime):
+    release = threading.Event()
+    ran = []
+
+    @runtime.register("slow", timeout=0.1, max_concurrency=1)
+    def slow(label):
+        ran.append(label)
+        release.wait(5)
+
+    first = runtime.start("slow", {"label": "first"})
+    queued = runtime.start("slow", {"label": "queued"})
+    assert runtime.wait(queued).ok is False
+    release.set()
+    runtime.wait(first)
+    runtime._executor.shutdown(wait=True)
+    assert ran == ["first"]
+
+
+def test_wait_async_does_not_block_the_loop(runtime):
+    @runtime.register("slow", timeout=5)
+    def slow():
+        time.sleep(0.1)
+        return "done"
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        result = await runtime.wait_async(runtime.start("slow", {}))
+        ticker.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result.data == "done"
+    assert ticks > 3
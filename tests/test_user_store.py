@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from app.services.user_store import CANCELLED, CONFIRMED, PENDING, BookingError, UserStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UserStore(db_file=str(tmp_path / "users.sqlite3"))
+
+
+def test_register_normalises_the_phone_number(store):
+    user, created = store.register("0712 345 678", "T 123 ABC")
+    assert created
+    assert store.find_by_phone("255712345678")["user_id"] == user["user_id"]
+    assert store.register("+255712345678", "T 456 DEF") == (
+        dict(user, car_plate_no="T 456 DEF", plate_key="T456DEF"),
+        False,
+    )
+
+
+def test_a_user_has_one_pending_booking(store):
+    user, _ = store.register("0712345678", "T123ABC")
+    first = store.open_booking(user["user_id"], "cash")
+    second = store.open_booking(user["user_id"], "mpesa")
+    assert second["booking_id"] == first["booking_id"]
+    assert second["payment_option"] == "mpesa"
+    assert second["status"] == PENDING
+
+
+def test_concurrent_confirms_of_one_booking_succeed_once(store):
+    user, _ = store.register("0712345678", "T123ABC")
+    for _ in range(10):
+        store.open_booking(user["user_id"], "cash")
+        # Each thread gets its own SQLite connection, like two workers would
+        barrier = threading.Barrier(4, timeout=5)
+        outcomes = []
+
+        def confirm():
+            barrier.wait()
+            try:
+                outcomes.append(store.transition_booking(user["user_id"], CONFIRMED)["status"])
+            except BookingError:
+                outcomes.append("rejected")
+
+        threads = [threading.Thread(target=confirm) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(outcomes) == [CONFIRMED, "rejected", "rejected", "rejected"]
+        store.transition_booking(user["user_id"], CANCELLED)
+
+
+def test_cancelled_booking_cannot_be_confirmed(store):
+    user, _ = store.register("0712345678", "T123ABC")
+    store.open_booking(user["user_id"], "cash")
+    store.transition_booking(user["user_id"], CANCELLED)
+    with pytest.raises(BookingError):
+        store.transition_booking(user["user_id"], CONFIRMED)